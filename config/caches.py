@@ -0,0 +1,13 @@
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+
+def is_process_local(alias=DEFAULT_CACHE_ALIAS):
+    """
+    Проверяет, что кэш хранится в памяти процесса (LocMemCache) или отключён (DummyCache): изменения в таком кэше
+    не видны другим процессам (воркерам gunicorn).
+    :param alias: Псевдоним кэша
+    :return: True, если кэш не общий для процессов
+    """
+    return isinstance(caches[alias], (LocMemCache, DummyCache))
@@ -0,0 +1,168 @@
+import random
+import threading
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.functional import SimpleLazyObject, empty
+
+# Маршрутизация чтения текущего запроса; задаётся ReplicaRoutingMiddleware
+current_routing = ContextVar("current_routing", default=None)
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+def pin_key(user_id):
+    """
+    Формирует ключ кэша, закрепляющего чтение пользователя за основной БД после записи.
+    :param user_id: ID пользователя
+    :return: Ключ кэша
+    """
+    return f"db:pinned:{user_id}"
+
+
+def request_user(request):
+    """
+    Получает пользователя запроса, не выполняя запросов к БД: ленивый пользователь AuthenticationMiddleware
+    учитывается, только если уже загружен (пользователя JWT устанавливает DRF при аутентификации в представлении).
+    :param request: Запрос
+    :return: Аутентифицированный пользователь или None
+    """
+    user = request.__dict__.get("user")
+    if isinstance(user, SimpleLazyObject):
+        user = None if user._wrapped is empty else user._wrapped
+    return user if user is not None and user.is_authenticated else None
+
+
+class ReplicaLagMonitor:
+    """
+    Проверяет отставание реплик не чаще DB_REPLICA_LAG_CHECK_INTERVAL секунд на процесс.
+    Реплика считается недоступной, если отставание больше DB_REPLICA_MAX_LAG или проверка завершилась ошибкой.
+    """
+
+    # Отставание реплики PostgreSQL: 0, если все полученные изменения применены (основная БД простаивает)
+    lag_sql = (
+        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+        "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+    )
+
+    def __init__(self):
+        """
+        Инициализирует пустые результаты проверок.
+        :return: None
+        """
+        self._lock = threading.Lock()
+        self._checked = {}  # {псевдоним: (время проверки, доступна ли реплика)}
+
+    def is_available(self, alias):
+        """
+        Проверяет, можно ли читать из реплики.
+        :param alias: Псевдоним БД реплики
+        :return: True, если отставание реплики допустимо
+        """
+        now = time.monotonic()
+        checked = self._checked.get(alias)
+        if checked is not None and now - checked[0] < settings.DB_REPLICA_LAG_CHECK_INTERVAL:
+            return checked[1]
+        lag = self.measure(alias)
+        available = lag is not None and lag <= settings.DB_REPLICA_MAX_LAG
+        with self._lock:
+            self._checked[alias] = (now, available)
+        return available
+
+    def measure(self, alias):
+        """
+        Измеряет отставание реплики.
+        :param alias: Псевдоним БД реплики
+        :return: Отставание (секунды) или None, если реплика недоступна
+        """
+        connection = connections[alias]
+        if connection.vendor != "postgresql":  # Отставание измеряется только для PostgreSQL
+            return 0.0
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(self.lag_sql)
+                return float(cursor.fetchone()[0])
+        except DatabaseError:
+            return None
+
+    def reset(self):
+        """
+        Очищает результаты проверок.
+        :return: None
+        """
+        with self._lock:
+            self._checked.clear()
+
+
+lag_monitor = ReplicaLagMonitor()
+
+
+class ReadRouting:
+    """
+    Состояние маршрутизации запросов к БД в рамках одного HTTP-запроса.
+    Attributes:
+        request (HttpRequest): Запрос
+        wrote (bool): True, если в запросе выполнялась запись
+    """
+
+    def __init__(self, request):
+        """
+        :param request: Запрос
+        :return: None
+        """
+        self.request = request
+        self.wrote = False
+        self._alias = None
+        self._user_id = None
+
+    def read_alias(self):
+        """
+        Выбирает БД для чтения: случайную доступную реплику для безопасных запросов пользователя, не закреплённого
+        за основной БД после записи, иначе - основную. Выбор запоминается, чтобы запрос читал из одной БД.
+        :return: Псевдоним реплики или None (основная БД)
+        """
+        if self.request.method not in SAFE_METHODS or self.wrote:
+            return None
+        user = request_user(self.request)
+        user_id = user.pk if user is not None else None
+        if self._alias is None or user_id != self._user_id:  # Решение пересматривается после аутентификации
+            self._user_id = user_id
+            self._alias = DEFAULT_DB_ALIAS
+            if user_id is None or not cache.get(pin_key(user_id)):
+                replicas = [alias for alias in settings.DB_REPLICAS if lag_monitor.is_available(alias)]
+                if replicas:
+                    self._alias = random.choice(replicas)
+        return None if self._alias == DEFAULT_DB_ALIAS else self._alias
+
+
+class ReadReplicaRouter:
+    """
+    Направляет чтение безопасных (GET, HEAD, OPTIONS) запросов к репликам DB_REPLICAS, а запись и остальное чтение -
+    в основную БД. Вне HTTP-запросов (команды, фоновые потоки) и внутри транзакций используется основная БД.
+    """
+
+    def db_for_read(self, model, **hints):
+        routing = current_routing.get()
+        if routing is None or not settings.DB_REPLICAS or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return None
+        return routing.read_alias()
+
+    def db_for_write(self, model, **hints):
+        routing = current_routing.get()
+        if routing is not None:
+            routing.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DB_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DB_REPLICAS:  # Реплики получают схему из основной БД
+            return False
+        return None
@@ -0,0 +1,184 @@
+import copy
+import json
+import logging
+import os
+import queue
+from contextvars import ContextVar
+from logging.handlers import (
+    QueueHandler,
+    QueueListener,
+    RotatingFileHandler,
+    TimedRotatingFileHandler,
+    WatchedFileHandler,
+)
+
+# ID текущего запроса; задаётся RequestLogMiddleware и попадает в каждую запись лога
+request_id_var = ContextVar("request_id", default="-")
+
+# Стандартные атрибуты записи лога; остальные атрибуты переданы через extra и выводятся в JSON
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "request_id"}
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Добавляет к записи лога ID текущего запроса.
+    """
+
+    def filter(self, record):
+        """
+        Добавляет атрибут request_id.
+        :param record: Запись лога
+        :return: True (запись не отбрасывается)
+        """
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Форматирует запись лога в одну строку JSON: время, уровень, логгер, сообщение, ID запроса, поля из extra
+    (например, длительность запроса) и трейсбек исключения.
+    """
+
+    def format(self, record):
+        """
+        Форматирует запись лога.
+        :param record: Запись лога
+        :return: Строка JSON
+        """
+        data = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", "-"),
+        }
+        data.update({key: value for key, value in vars(record).items() if key not in RECORD_ATTRIBUTES})
+        if record.exc_info:
+            data["exception"] = self.formatException(record.exc_info)
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class QueuedFileHandler(QueueHandler):
+    """
+    Определяет обработчик, который передаёт записи лога в очередь, а запись в файл выполняет фоновый поток
+    QueueListener. Запрос не ждёт файлового ввода-вывода.
+    Фоновый поток запускается при первой записи в каждом процессе (в том числе в воркерах, созданных fork после
+    загрузки приложения, например gunicorn --preload), поток и очередь родительского процесса не используются.
+    По умолчанию все процессы дописывают один файл, а ротацию выполняет внешняя утилита (logrotate): файл
+    открывается заново после переименования. При per_process каждый процесс пишет в свой файл (имя с PID процесса)
+    и ротирует его по размеру (max_bytes) или по времени (when); старые файлы завершённых процессов не удаляются.
+    Каталог файла создаётся при необходимости.
+    Attributes:
+        filename (str): Путь к файлу лога (без PID процесса)
+        target (Handler): Файловый обработчик текущего процесса или None до первой записи
+        listener (QueueListener): Фоновый поток записи текущего процесса или None до первой записи
+    """
+
+    def __init__(self, filename, max_bytes=10 * 1024 * 1024, backup_count=5, when=None, interval=1, encoding="utf-8",
+                 per_process=False):
+        """
+        :param filename: Путь к файлу лога
+        :param max_bytes: Размер файла для ротации по размеру (байты)
+        :param backup_count: Количество хранимых старых файлов
+        :param when: Период ротации по времени ("midnight", "H" и т.д.); если задан, размер не учитывается
+        :param interval: Количество периодов между ротациями
+        :param encoding: Кодировка файла
+        :param per_process: Писать в отдельный файл процесса и ротировать его самостоятельно
+        :return: None
+        """
+        super().__init__(queue.SimpleQueue())
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        self.filename = filename
+        self.rotation = {"max_bytes": max_bytes, "backup_count": backup_count, "when": when, "interval": interval}
+        self.encoding = encoding
+        self.per_process = per_process
+        self.formatter = None
+        self.target = None
+        self.listener = None
+        self._pid = None
+
+    def process_filename(self):
+        """
+        Формирует имя файла лога текущего процесса: app.log -> app.<PID>.log (только при per_process).
+        :return: Путь к файлу
+        """
+        if not self.per_process:
+            return self.filename
+        root, ext = os.path.splitext(self.filename)
+        return f"{root}.{os.getpid()}{ext}"
+
+    def create_target(self):
+        """
+        Создаёт файловый обработчик текущего процесса.
+        :return: Файловый обработчик
+        """
+        filename, rotation = self.process_filename(), self.rotation
+        if not self.per_process:
+            return WatchedFileHandler(filename, encoding=self.encoding, delay=True)
+        if rotation["when"]:
+            return TimedRotatingFileHandler(
+                filename, when=rotation["when"], interval=rotation["interval"], backupCount=rotation["backup_count"],
+                encoding=self.encoding, delay=True,
+            )
+        return RotatingFileHandler(
+            filename, maxBytes=rotation["max_bytes"], backupCount=rotation["backup_count"], encoding=self.encoding,
+            delay=True,
+        )
+
+    def start(self):
+        """
+        Запускает фоновый поток записи в текущем процессе. После fork очередь и файловый обработчик создаются
+        заново: фоновый поток родителя в дочерний процесс не копируется.
+        :return: None
+        """
+        self.queue = queue.SimpleQueue()
+        self.target = self.create_target()
+        self.target.setFormatter(self.formatter)
+        self.listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+        self.listener.start()
+        self._pid = os.getpid()
+
+    def emit(self, record):
+        """
+        Передаёт запись в очередь, при первой записи в процессе запуская фоновый поток.
+        Вызывается под блокировкой обработчика (Handler.handle), которая пересоздаётся после fork.
+        :param record: Запись лога
+        :return: None
+        """
+        if self._pid != os.getpid():
+            self.start()
+        super().emit(record)
+
+    def setFormatter(self, fmt):
+        """
+        Передаёт форматтер файловому обработчику, чтобы форматирование выполнялось в фоновом потоке.
+        :param fmt: Форматтер
+        :return: None
+        """
+        self.formatter = fmt
+        if self.target is not None:
+            self.target.setFormatter(fmt)
+
+    def prepare(self, record):
+        """
+        Готовит запись к передаче в очередь: подставляет аргументы в сообщение, чтобы зафиксировать значения
+        на момент вызова логгера. Остальное форматирование выполняет фоновый поток.
+        :param record: Запись лога
+        :return: Копия записи
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def close(self):
+        """
+        Дописывает записи из очереди и закрывает файл, если фоновый поток запущен в текущем процессе.
+        :return: None
+        """
+        if self._pid == os.getpid():
+            self.listener.stop()
+            self.target.close()
+            self._pid = None
+        super().close()
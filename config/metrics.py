@@ -0,0 +1,341 @@
+import atexit
+import fcntl
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+
+from users.clients import UpstreamMetrics, get_upstream_metrics
+
+# Границы корзин гистограммы времени ответа (секунды)
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Описания метрик: {имя: (тип, описание)}
+METRICS = {
+    "http_requests_total": ("counter", "Количество запросов по представлению, методу и статусу ответа"),
+    "http_request_duration_seconds": ("histogram", "Время ответа по представлению"),
+    "db_connections_total": ("counter", "Количество открытых соединений с БД"),
+    "db_queries_total": ("counter", "Количество SQL-запросов, выполненных при обработке запросов"),
+    "db_query_duration_seconds_total": ("counter", "Суммарное время SQL-запросов, выполненных при обработке запросов"),
+    "upstream_requests_total": ("counter", "Количество обращений к внешним сервисам"),
+    "upstream_errors_total": ("counter", "Количество ошибок обращений к внешним сервисам"),
+    "upstream_request_duration_seconds": ("histogram", "Время обращений к внешним сервисам"),
+}
+
+# Файл с суммой значений завершённых процессов в METRICS_MULTIPROC_DIR
+DEAD_FILE = "metrics-dead.json"
+
+
+class MetricsRegistry:
+    """
+    Хранит счётчики и гистограммы в памяти процесса.
+    Attributes:
+        counters (dict): Счётчики {(имя, метки): значение}
+        histograms (dict): Гистограммы {(имя, метки): [количество по корзинам, сумма]}
+        generation (str): ID запуска процесса в имени файла метрик, чтобы новый процесс с тем же PID
+            не перезаписал файл завершённого
+    """
+
+    def __init__(self):
+        """
+        Инициализирует пустой реестр.
+        :return: None
+        """
+        self.reset()
+
+    def reset(self):
+        """
+        Очищает метрики и назначает новый ID запуска. Вызывается и в дочернем процессе после fork (gunicorn --preload),
+        чтобы воркер не учитывал значения родителя повторно и писал в свой файл.
+        :return: None
+        """
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.last_flush = 0.0
+        self.generation = uuid.uuid4().hex
+
+    def inc(self, name, value=1, **labels):
+        """
+        Увеличивает счётчик.
+        :param name: Имя метрики
+        :param value: Приращение
+        :param labels: Метки
+        :return: None
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """
+        Учитывает значение в гистограмме с границами DURATION_BUCKETS.
+        :param name: Имя метрики
+        :param value: Значение (секунды)
+        :param labels: Метки
+        :return: None
+        """
+        key = (name, tuple(sorted(labels.items())))
+        bucket = next((index for index, bound in enumerate(DURATION_BUCKETS) if value <= bound), -1)
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = [[0] * (len(DURATION_BUCKETS) + 1), 0.0]
+            histogram[0][bucket] += 1
+            histogram[1] += value
+
+    def snapshot(self):
+        """
+        Возвращает значения метрик процесса, включая метрики внешних сервисов (users.clients).
+        :return: Словарь {"counters": [[имя, метки, значение]], "histograms": [[имя, метки, границы, корзины, сумма]]}
+        """
+        with self._lock:
+            counters = [[name, list(labels), value] for (name, labels), value in self.counters.items()]
+            histograms = [
+                [name, list(labels), list(DURATION_BUCKETS), list(counts), total]
+                for (name, labels), (counts, total) in self.histograms.items()
+            ]
+        for service, upstream in get_upstream_metrics().items():
+            labels = [["service", service]]
+            counters.append(["upstream_requests_total", labels, upstream["requests"]])
+            counters.append(["upstream_errors_total", labels, upstream["errors"]])
+            histograms.append([
+                "upstream_request_duration_seconds", labels, list(UpstreamMetrics.buckets), upstream["histogram"],
+                upstream["total_time"],
+            ])
+        return {"counters": counters, "histograms": histograms}
+
+    def flush(self, force=False):
+        """
+        Сохраняет значения метрик процесса в файл каталога METRICS_MULTIPROC_DIR (не чаще METRICS_FLUSH_INTERVAL),
+        чтобы эндпоинт метрик любого процесса (воркера gunicorn) мог объединить значения всех процессов.
+        :param force: Сохранить независимо от времени последнего сохранения
+        :return: None
+        """
+        directory = settings.METRICS_MULTIPROC_DIR
+        now = time.monotonic()
+        if not directory or (not force and now - self.last_flush < settings.METRICS_FLUSH_INTERVAL):
+            return
+        self.last_flush = now
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        _write(self.path(directory), self.snapshot())
+
+    def path(self, directory):
+        """
+        Возвращает путь к файлу метрик процесса.
+        :param directory: Каталог METRICS_MULTIPROC_DIR
+        :return: Путь вида metrics-<PID>-<ID запуска>.json
+        """
+        return Path(directory) / f"metrics-{os.getpid()}-{self.generation}.json"
+
+    def mark_dead(self):
+        """
+        Переносит значения процесса в файл завершённых процессов и удаляет файл процесса, чтобы файлы воркеров
+        не накапливались в METRICS_MULTIPROC_DIR. Вызывается при завершении процесса.
+        :return: None
+        """
+        directory = settings.METRICS_MULTIPROC_DIR
+        if not directory:
+            return
+        self.flush(force=True)
+        with _locked(directory):
+            _compact(Path(directory), [self.path(directory)])
+
+
+registry = MetricsRegistry()
+os.register_at_fork(after_in_child=registry.reset)
+atexit.register(registry.mark_dead)
+
+
+def _write(path, snapshot):
+    """
+    Атомарно записывает значения метрик в файл: читатели не увидят файл, записанный наполовину.
+    :param path: Путь к файлу
+    :param snapshot: Значения в формате MetricsRegistry.snapshot
+    :return: None
+    """
+    temp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+    temp_path.write_text(json.dumps(snapshot), encoding="utf-8")
+    os.replace(temp_path, path)
+
+
+def _read(path):
+    """
+    Читает значения метрик из файла.
+    :param path: Путь к файлу
+    :return: Значения в формате MetricsRegistry.snapshot или None, если файл удалён или заменяется
+    """
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+@contextmanager
+def _locked(directory):
+    """
+    Блокирует каталог метрик, чтобы перенос значений в файл завершённых процессов и чтение файлов не пересекались
+    (иначе значения процесса могли бы быть учтены дважды или потеряны).
+    :param directory: Каталог METRICS_MULTIPROC_DIR
+    :return: Контекстный менеджер
+    """
+    Path(directory).mkdir(parents=True, exist_ok=True)
+    with open(Path(directory) / "metrics.lock", "a") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _is_alive(pid):
+    """
+    Проверяет, что процесс с указанным PID существует.
+    :param pid: PID процесса
+    :return: True, если процесс существует
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:  # Процесс другого пользователя
+        return True
+    return True
+
+
+def _compact(directory, paths):
+    """
+    Добавляет значения файлов завершённых процессов к файлу DEAD_FILE и удаляет эти файлы.
+    Вызывается под блокировкой каталога.
+    :param directory: Каталог METRICS_MULTIPROC_DIR
+    :param paths: Файлы завершённых процессов
+    :return: None
+    """
+    if not paths:
+        return
+    dead_path = directory / DEAD_FILE
+    snapshots = [_read(path) for path in [dead_path, *paths]]
+    _write(dead_path, _merge(snapshot for snapshot in snapshots if snapshot))
+    for path in paths:
+        path.unlink(missing_ok=True)
+
+
+def _merge(snapshots):
+    """
+    Складывает значения метрик нескольких процессов.
+    :param snapshots: Значения в формате MetricsRegistry.snapshot
+    :return: Объединённые значения в том же формате
+    """
+    counters, histograms = {}, {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot["counters"]:
+            key = (name, tuple(map(tuple, labels)))
+            counters[key] = counters.get(key, 0) + value
+        for name, labels, bounds, counts, total in snapshot["histograms"]:
+            key = (name, tuple(map(tuple, labels)), tuple(bounds))
+            merged = histograms.setdefault(key, [[0] * len(counts), 0.0])
+            merged[0] = [a + b for a, b in zip(merged[0], counts)]
+            merged[1] += total
+    return {
+        "counters": [[name, list(labels), value] for (name, labels), value in counters.items()],
+        "histograms": [
+            [name, list(labels), list(bounds), counts, total]
+            for (name, labels, bounds), (counts, total) in histograms.items()
+        ],
+    }
+
+
+def collect():
+    """
+    Собирает метрики всех процессов из METRICS_MULTIPROC_DIR или только текущего процесса, если каталог не задан.
+    Значения процессов складываются. Файлы процессов, которые завершились без mark_dead (например, были убиты),
+    переносятся в файл завершённых процессов DEAD_FILE, чтобы счётчики не уменьшались, а файлы не накапливались.
+    :return: Объединённые значения в формате MetricsRegistry.snapshot
+    """
+    if not settings.METRICS_MULTIPROC_DIR:
+        return registry.snapshot()
+    registry.flush(force=True)
+    directory = Path(settings.METRICS_MULTIPROC_DIR)
+    with _locked(directory):
+        paths = [path for path in directory.glob("metrics-*.json") if path.name != DEAD_FILE]
+        dead = [path for path in paths if not _is_alive(int(path.name.split("-")[1]))]
+        _compact(directory, dead)
+        snapshots = [_read(path) for path in [directory / DEAD_FILE, *set(paths) - set(dead)]]
+    return _merge(snapshot for snapshot in snapshots if snapshot)
+
+
+def _escape(value):
+    """
+    Экранирует значение метки (обратная косая черта, кавычка и перевод строки).
+    :param value: Значение метки
+    :return: Строка
+    """
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels, **extra):
+    """
+    Форматирует метки в синтаксисе Prometheus.
+    :param labels: Список пар [имя, значение]
+    :param extra: Дополнительные метки (например, le)
+    :return: Строка вида {name="value"} или пустая строка
+    """
+    pairs = [*labels, *extra.items()]
+    if not pairs:
+        return ""
+    escaped = (f'{name}="{_escape(value)}"' for name, value in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+def _format_value(value):
+    """
+    Форматирует значение метрики.
+    :param value: Число
+    :return: Строка
+    """
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render(snapshot):
+    """
+    Формирует текст метрик в формате Prometheus (text/plain; version=0.0.4).
+    :param snapshot: Значения в формате MetricsRegistry.snapshot
+    :return: Текст метрик
+    """
+    samples = {}
+    for name, labels, value in sorted(snapshot["counters"]):
+        samples.setdefault(name, []).append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+    for name, labels, bounds, counts, total in sorted(snapshot["histograms"]):
+        lines = samples.setdefault(name, [])
+        cumulative = 0
+        for bound, count in zip([*bounds, "+Inf"], counts):
+            cumulative += count
+            lines.append(f"{name}_bucket{_format_labels(labels, le=bound)} {cumulative}")
+        lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(float(total))}")
+        lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+
+    output = []
+    for name, (kind, description) in METRICS.items():
+        if name in samples:
+            output += [f"# HELP {name} {description}", f"# TYPE {name} {kind}", *samples[name]]
+    return "\n".join(output) + "\n"
+
+
+def connection_opened(sender, connection, **kwargs):
+    """
+    Учитывает открытие соединения с БД.
+    :param sender: Класс обёртки соединения
+    :param connection: Обёртка соединения
+    :return: None
+    """
+    registry.inc("db_connections_total", alias=connection.alias)
+
+
+connection_created.connect(connection_opened, dispatch_uid="config.metrics.connection_opened")
@@ -0,0 +1,259 @@
+import cProfile
+import logging
+import random
+import time
+import uuid
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+
+from . import metrics
+from .caches import is_process_local
+from .db_router import ReadRouting, current_routing, pin_key, request_user
+from .logs import request_id_var
+from .permissions import is_staff_request, matches_secret
+from .profiling import RequestProfile, current_profile, install_serializer_timer, registry
+
+logger = logging.getLogger("config.requests")
+
+
+class RequestLogMiddleware:
+    """
+    Присваивает запросу ID (из заголовка X-Request-ID или новый), делает его доступным записям лога
+    и логирует метод, путь, статус и длительность запроса.
+    """
+
+    header = "X-Request-ID"
+
+    def __init__(self, get_response):
+        """
+        :param get_response: Следующий обработчик запроса
+        :return: None
+        """
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """
+        Обрабатывает запрос.
+        :param request: Запрос
+        :return: Ответ
+        """
+        request_id = request.headers.get(self.header, "")[:64] or uuid.uuid4().hex
+        token = request_id_var.set(request_id)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+            logger.info(
+                "%s %s %s",
+                request.method,
+                request.path,
+                response.status_code,
+                extra={"status": response.status_code, "duration_ms": round((time.perf_counter() - start) * 1000, 2)},
+            )
+            response[self.header] = request_id
+            return response
+        finally:
+            request_id_var.reset(token)
+
+
+class ProfilingMiddleware:
+    """
+    Профилирует запросы при включённой настройке PROFILING_ENABLED: долю PROFILING_SAMPLE_RATE всех запросов
+    и запросы с заголовком PROFILING_HEADER от администраторов или со значением PROFILING_HEADER_SECRET.
+    Учитывает время ответа, время и количество SQL-запросов, повторы одинаковых запросов, время сериализации
+    и размер ответа и накапливает их по имени URL в памяти процесса.
+    Для запросов дольше PROFILING_SLOW_MS сохраняет вывод cProfile в PROFILING_CPROFILE_DIR (если задан).
+    """
+
+    def __init__(self, get_response):
+        """
+        :param get_response: Следующий обработчик запроса
+        :return: None
+        """
+        self.get_response = get_response
+        install_serializer_timer()
+
+    def __call__(self, request):
+        """
+        Обрабатывает запрос.
+        :param request: Запрос
+        :return: Ответ
+        """
+        if not self.should_profile(request):
+            return self.get_response(request)
+
+        profile = RequestProfile()
+        profiler = self.start_profiler()
+        token = current_profile.set(profile)
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(profile))
+                response = self.get_response(request)
+        finally:
+            wall_time = time.perf_counter() - start
+            current_profile.reset(token)
+            if profiler is not None:
+                profiler.disable()
+
+        match = request.resolver_match
+        name = match.view_name if match is not None else "unresolved"
+        registry.record(
+            name,
+            {
+                "wall_time": wall_time,
+                "db_time": profile.db_time,
+                "serializer_time": profile.serializer_time,
+                "queries": len(profile.queries),
+                "duplicate_queries": profile.duplicate_queries,
+                "response_size": 0 if response.streaming else len(response.content),
+            },
+        )
+        if profiler is not None and wall_time * 1000 >= settings.PROFILING_SLOW_MS:
+            self.dump_profile(profiler, name)
+        return response
+
+    @staticmethod
+    def should_profile(request):
+        """
+        Определяет, нужно ли профилировать запрос.
+        :param request: Запрос
+        :return: True, если запрос профилируется
+        """
+        if not settings.PROFILING_ENABLED:
+            return False
+        header = request.headers.get(settings.PROFILING_HEADER)
+        # Заголовок от остальных клиентов не учитывается: профилирование замедляет запрос и заполняет показатели
+        if header and (matches_secret(header, settings.PROFILING_HEADER_SECRET) or is_staff_request(request)):
+            return True
+        return random.random() < settings.PROFILING_SAMPLE_RATE
+
+    @staticmethod
+    def start_profiler():
+        """
+        Запускает cProfile, если задан каталог для сохранения профилей медленных запросов.
+        :return: Профилировщик или None
+        """
+        if not settings.PROFILING_CPROFILE_DIR:
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # Python 3.12+: в процессе уже работает другой профилировщик (параллельный запрос)
+            return None
+        return profiler
+
+    @staticmethod
+    def dump_profile(profiler, name):
+        """
+        Сохраняет вывод cProfile медленного запроса (файл .prof для pstats или snakeviz).
+        :param profiler: Профилировщик
+        :param name: Имя URL
+        :return: None
+        """
+        directory = Path(settings.PROFILING_CPROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        filename = f"{name.replace(':', '-')}-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.prof"
+        profiler.dump_stats(directory / filename)
+
+
+class MetricsMiddleware:
+    """
+    Учитывает в метриках процесса (config.metrics) количество и время ответов по представлению, методу и статусу,
+    а также количество и время SQL-запросов. Значения сохраняются для объединения между процессами
+    не чаще METRICS_FLUSH_INTERVAL секунд.
+    """
+
+    def __init__(self, get_response):
+        """
+        :param get_response: Следующий обработчик запроса
+        :return: None
+        """
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """
+        Обрабатывает запрос.
+        :param request: Запрос
+        :return: Ответ
+        """
+        queries = {}
+
+        def count_query(execute, sql, params, many, context):
+            """
+            Выполняет SQL-запрос и учитывает его количество и время по псевдониму БД.
+            :return: Результат запроса
+            """
+            query_start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                alias = context["connection"].alias
+                count, elapsed = queries.get(alias, (0, 0.0))
+                queries[alias] = (count + 1, elapsed + time.perf_counter() - query_start)
+
+        start = time.perf_counter()
+        status = 500
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(count_query))
+                response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            match = request.resolver_match
+            view = match.view_name if match is not None else "unresolved"
+            metrics.registry.inc("http_requests_total", view=view, method=request.method, status=status)
+            metrics.registry.observe("http_request_duration_seconds", time.perf_counter() - start, view=view)
+            for alias, (count, elapsed) in queries.items():
+                metrics.registry.inc("db_queries_total", count, alias=alias)
+                metrics.registry.inc("db_query_duration_seconds_total", elapsed, alias=alias)
+            metrics.registry.flush()
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Включает маршрутизацию чтения безопасных запросов к репликам (config.db_router.ReadReplicaRouter).
+    После запроса, выполнившего запись, чтение пользователя на DB_REPLICA_STICKY_SECONDS секунд закрепляется
+    за основной БД, чтобы он сразу видел свои изменения (например, новую подписку или оплату).
+    Закрепление хранится в кэше, поэтому при заданных DB_REPLICAS нужен общий для процессов кэш.
+    """
+
+    def __init__(self, get_response):
+        """
+        :param get_response: Следующий обработчик запроса
+        :return: None
+        """
+        if settings.DB_REPLICAS and is_process_local():
+            raise ImproperlyConfigured(
+                "DB_REPLICAS требует общего для процессов кэша (CACHE_BACKEND): в кэше в памяти процесса закрепление "
+                "за основной БД после записи не видно другим воркерам"
+            )
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """
+        Обрабатывает запрос.
+        :param request: Запрос
+        :return: Ответ
+        """
+        if not settings.DB_REPLICAS:
+            return self.get_response(request)
+
+        routing = ReadRouting(request)
+        token = current_routing.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        if routing.wrote:
+            user = request_user(request)
+            if user is not None:
+                cache.set(pin_key(user.pk), True, settings.DB_REPLICA_STICKY_SECONDS)
+        return response
@@ -0,0 +1,31 @@
+import hmac
+
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+
+
+def matches_secret(value, secret):
+    """
+    Сравнивает переданное значение с секретом за постоянное время.
+    :param value: Значение из запроса
+    :param secret: Секрет из настроек (если не задан, значение не подходит)
+    :return: True, если секрет задан и значение с ним совпадает
+    """
+    return bool(secret) and hmac.compare_digest(value.encode(), secret.encode())
+
+
+def is_staff_request(request):
+    """
+    Проверяет, что запрос выполняет администратор: по сессии (если запрос прошёл AuthenticationMiddleware)
+    или по JWT-токену. Пользователь загружается из БД, поэтому проверка выполняется только для служебных запросов.
+    :param request: Запрос Django
+    :return: True, если пользователь аутентифицирован и является администратором
+    """
+    user = getattr(request, "user", None)
+    if user is not None and user.is_authenticated:
+        return user.is_staff
+    try:
+        result = JWTAuthentication().authenticate(request)
+    except AuthenticationFailed:  # Недействительный токен или пользователь
+        return False
+    return result is not None and result[0].is_staff
@@ -0,0 +1,174 @@
+import threading
+import time
+from contextvars import ContextVar
+
+from rest_framework.serializers import BaseSerializer
+
+# Профиль текущего запроса; задаётся ProfilingMiddleware только для профилируемых запросов
+current_profile = ContextVar("current_profile", default=None)
+
+# Границы корзин гистограммы времени ответа (миллисекунды)
+HISTOGRAM_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+
+class RequestProfile:
+    """
+    Накапливает показатели одного запроса.
+    Attributes:
+        db_time (float): Время выполнения SQL-запросов (секунды)
+        queries (list): Выполненные запросы [(sql, params)]
+        serializer_time (float): Время сериализации ответа (секунды)
+    """
+
+    def __init__(self):
+        """
+        Инициализирует пустые показатели.
+        :return: None
+        """
+        self.db_time = 0.0
+        self.queries = []
+        self.serializer_time = 0.0
+        self._serializer_depth = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        """
+        Выполняет SQL-запрос и учитывает его время (обёртка connection.execute_wrapper).
+        :return: Результат запроса
+        """
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries.append((sql, repr(params)))
+
+    @property
+    def duplicate_queries(self):
+        """
+        Считает повторы одинаковых запросов с одинаковыми параметрами (признак N+1).
+        :return: Количество повторов
+        """
+        return len(self.queries) - len(set(self.queries))
+
+
+class EndpointStats:
+    """
+    Накапливает показатели запросов к одному эндпоинту.
+    Attributes:
+        count (int): Количество запросов
+        histogram (list): Количество запросов по корзинам времени ответа (последняя - больше всех границ)
+    """
+
+    fields = ("wall_time", "db_time", "serializer_time", "queries", "duplicate_queries", "response_size")
+
+    def __init__(self):
+        """
+        Инициализирует пустые показатели.
+        :return: None
+        """
+        self.count = 0
+        self.totals = dict.fromkeys(self.fields, 0)
+        self.max_wall_time = 0.0
+        self.histogram = [0] * (len(HISTOGRAM_BUCKETS) + 1)
+
+    def add(self, sample):
+        """
+        Учитывает показатели одного запроса.
+        :param sample: Словарь показателей (поля fields)
+        :return: None
+        """
+        self.count += 1
+        for field in self.fields:
+            self.totals[field] += sample[field]
+        self.max_wall_time = max(self.max_wall_time, sample["wall_time"])
+        wall_ms = sample["wall_time"] * 1000
+        bucket = next((index for index, bound in enumerate(HISTOGRAM_BUCKETS) if wall_ms <= bound), -1)
+        self.histogram[bucket] += 1
+
+    def as_dict(self):
+        """
+        Возвращает средние и максимальные показатели и гистограмму.
+        :return: Словарь показателей
+        """
+        averages = {f"avg_{field}": self.totals[field] / self.count for field in self.fields}
+        for field in ("wall_time", "db_time", "serializer_time"):  # Время - в миллисекундах
+            averages[f"avg_{field}"] = round(averages[f"avg_{field}"] * 1000, 3)
+        bounds = [str(bound) for bound in HISTOGRAM_BUCKETS] + ["+Inf"]
+        return {
+            "count": self.count,
+            **averages,
+            "max_wall_time": round(self.max_wall_time * 1000, 3),
+            "histogram_ms": dict(zip(bounds, self.histogram)),
+        }
+
+
+class ProfilingRegistry:
+    """
+    Хранит показатели профилирования по именам URL в памяти процесса.
+    """
+
+    def __init__(self):
+        """
+        Инициализирует пустой реестр.
+        :return: None
+        """
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, name, sample):
+        """
+        Учитывает показатели запроса к эндпоинту.
+        :param name: Имя URL (например, materials:course-list)
+        :param sample: Словарь показателей
+        :return: None
+        """
+        with self._lock:
+            self._endpoints.setdefault(name, EndpointStats()).add(sample)
+
+    def snapshot(self):
+        """
+        Возвращает показатели всех эндпоинтов.
+        :return: Словарь {имя URL: показатели}
+        """
+        with self._lock:
+            return {name: stats.as_dict() for name, stats in sorted(self._endpoints.items())}
+
+    def reset(self):
+        """
+        Очищает накопленные показатели.
+        :return: None
+        """
+        with self._lock:
+            self._endpoints.clear()
+
+
+registry = ProfilingRegistry()
+
+_original_serializer_data = BaseSerializer.data
+
+
+def _timed_serializer_data(self):
+    """
+    Получает данные сериализатора и учитывает время сериализации в профиле текущего запроса.
+    Вложенные вызовы учитываются один раз.
+    :return: Данные сериализатора
+    """
+    profile = current_profile.get()
+    if profile is None:
+        return _original_serializer_data.fget(self)
+    profile._serializer_depth += 1
+    start = time.perf_counter()
+    try:
+        return _original_serializer_data.fget(self)
+    finally:
+        profile._serializer_depth -= 1
+        if profile._serializer_depth == 0:
+            profile.serializer_time += time.perf_counter() - start
+
+
+def install_serializer_timer():
+    """
+    Подключает учёт времени сериализации DRF. Для непрофилируемых запросов добавляет одну проверку ContextVar.
+    :return: None
+    """
+    BaseSerializer.data = property(_timed_serializer_data)
@@ -44,11 +44,16 @@ INSTALLED_APPS += [
 ]
 
 MIDDLEWARE = [
+    "config.middleware.MetricsMiddleware",
+    "config.middleware.RequestLogMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    # После AuthenticationMiddleware, чтобы заголовок профилирования учитывался от администратора, вошедшего по сессии
+    "config.middleware.ProfilingMiddleware",
+    "config.middleware.ReplicaRoutingMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -77,17 +82,56 @@ TEMPLATES = [
 WSGI_APPLICATION = "config.wsgi.application"
 
 # Database
+# Настройка соединений с БД: постоянные соединения (DB_CONN_MAX_AGE) или пул psycopg 3 (DB_POOL_ENABLED).
+# Пул несовместим с постоянными соединениями Django, поэтому при включённом пуле CONN_MAX_AGE равен 0
+DB_CONN_MAX_AGE = int(os.getenv("DB_CONN_MAX_AGE", 60))  # Время жизни соединения (секунды; 0 - на каждый запрос)
+DB_CONN_HEALTH_CHECKS = os.getenv("DB_CONN_HEALTH_CHECKS", "True") == "True"  # Проверять соединение перед запросом
+DB_POOL_ENABLED = os.getenv("DB_POOL_ENABLED", False) == "True"
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", 2))  # Минимальное количество соединений в пуле процесса
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", 10))  # Максимальное количество соединений в пуле процесса
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))  # Ожидание свободного соединения (секунды)
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", 10 * 60))  # Закрывать соединения, простаивающие дольше
+DB_POOL_MAX_LIFETIME = float(os.getenv("DB_POOL_MAX_LIFETIME", 60 * 60))  # Пересоздавать соединения старше (секунды)
+
 DATABASES = {
     "default": {
-        "ENGINE": "django.db.backends.postgresql_psycopg2",
+        "ENGINE": "django.db.backends.postgresql",
         "NAME": os.getenv("DB_NAME"),
         "USER": os.getenv("DB_USER"),
         "PASSWORD": os.getenv("DB_PASSWORD"),
         "HOST": os.getenv("DB_HOST"),
         "PORT": os.getenv("DB_PORT"),
+        "CONN_MAX_AGE": 0 if DB_POOL_ENABLED else DB_CONN_MAX_AGE,
+        "CONN_HEALTH_CHECKS": DB_CONN_HEALTH_CHECKS,
+        "OPTIONS": {
+            "pool": {
+                "min_size": DB_POOL_MIN_SIZE,
+                "max_size": DB_POOL_MAX_SIZE,
+                "timeout": DB_POOL_TIMEOUT,
+                "max_idle": DB_POOL_MAX_IDLE,
+                "max_lifetime": DB_POOL_MAX_LIFETIME,
+            },
+        } if DB_POOL_ENABLED else {},
     }
 }
 
+# Настройка реплик для чтения: адреса через запятую (host или host:port), остальные параметры - как у основной БД.
+# Чтение безопасных запросов направляется к репликам, если их отставание не больше DB_REPLICA_MAX_LAG секунд
+DB_REPLICAS = []
+for _index, _replica in enumerate(filter(None, os.getenv("DB_REPLICA_HOSTS", "").split(",")), start=1):
+    _host, _, _port = _replica.strip().partition(":")
+    DATABASES[f"replica{_index}"] = {
+        **DATABASES["default"],
+        "HOST": _host,
+        "PORT": _port or DATABASES["default"]["PORT"],
+        "TEST": {"MIRROR": "default"},  # В тестах реплика - та же БД, что и основная
+    }
+    DB_REPLICAS.append(f"replica{_index}")
+DATABASE_ROUTERS = ["config.db_router.ReadReplicaRouter"]
+DB_REPLICA_STICKY_SECONDS = int(os.getenv("DB_REPLICA_STICKY_SECONDS", 15))  # Чтение из основной БД после записи
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", 5))  # Допустимое отставание реплики (секунды)
+DB_REPLICA_LAG_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_LAG_CHECK_INTERVAL", 5))  # Период проверки отставания
+
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
@@ -123,42 +167,70 @@ AUTHENTICATION_BACKENDS = [
 ]
 
 # Настройка логгера
+# Записи передаются в очередь, а в файлы их пишет фоновый поток (config.logs.QueuedFileHandler).
+# Все процессы пишут в общий файл, который ротирует внешняя утилита (logrotate); при LOG_FILE_PER_PROCESS каждый
+# процесс пишет в свой файл (reports.<PID>.log) и сам ротирует его по LOG_MAX_BYTES или LOG_ROTATE_WHEN
+LOG_LEVEL = os.getenv("LOG_LEVEL", "DEBUG" if DEBUG else "INFO")  # Уровень логов приложений
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # Формат записей: json или verbose
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))  # Размер файла для ротации (байты)
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 5))  # Количество хранимых старых файлов
+LOG_ROTATE_WHEN = os.getenv("LOG_ROTATE_WHEN") or None  # Ротация по времени (например, midnight) вместо размера
+LOG_FILE_PER_PROCESS = os.getenv("LOG_FILE_PER_PROCESS", False) == "True"  # Отдельные файлы процессов
+
+
+def _log_file_handler(filename):
+    """
+    Описывает обработчик файла лога для LOGGING.
+    :param filename: Путь к файлу лога
+    :return: Словарь настроек обработчика
+    """
+    return {
+        "level": "DEBUG",
+        "class": "config.logs.QueuedFileHandler",
+        "filename": os.path.join(BASE_DIR, filename),
+        "max_bytes": LOG_MAX_BYTES,
+        "backup_count": LOG_BACKUP_COUNT,
+        "when": LOG_ROTATE_WHEN,
+        "per_process": LOG_FILE_PER_PROCESS,
+        "formatter": LOG_FORMAT,
+        "filters": ["request_context"],
+    }
+
+
 LOGGING = {
     "version": 1,
     "disable_existing_loggers": False,
     "formatters": {
-        "verbose": {"format": "%(asctime)s - %(name)s - %(levelname)s: %(message)s"},
+        "verbose": {"format": "%(asctime)s - %(name)s - %(levelname)s [%(request_id)s]: %(message)s"},
+        "json": {"()": "config.logs.JsonFormatter"},
+    },
+    "filters": {
+        "request_context": {"()": "config.logs.RequestContextFilter"},
     },
     "handlers": {
-        "users_file": {
-            "level": "DEBUG",
-            "class": "logging.FileHandler",
-            "filename": os.path.join(BASE_DIR, "users/logs/reports.log"),
-            "encoding": "utf-8",
-            "formatter": "verbose",
-        },
-        "materials_file": {
-            "level": "DEBUG",
-            "class": "logging.FileHandler",
-            "filename": os.path.join(BASE_DIR, "materials/logs/reports.log"),
-            "encoding": "utf-8",
-            "formatter": "verbose",
-        },
+        "users_file": _log_file_handler("users/logs/reports.log"),
+        "materials_file": _log_file_handler("materials/logs/reports.log"),
+        "requests_file": _log_file_handler("logs/requests.log"),
     },
     "loggers": {
         "users": {
             "handlers": ["users_file"],
-            "level": "DEBUG",
+            "level": LOG_LEVEL,
             "propagate": False,
         },
         "materials": {
             "handlers": ["materials_file"],
-            "level": "DEBUG",
+            "level": LOG_LEVEL,
             "propagate": False,
         },
         "courses": {
             "handlers": ["materials_file"],
-            "level": "DEBUG",
+            "level": LOG_LEVEL,
+            "propagate": False,
+        },
+        "config.requests": {
+            "handlers": ["requests_file"],
+            "level": LOG_LEVEL,
             "propagate": False,
         },
     },
@@ -187,5 +259,61 @@ SIMPLE_JWT = {
 }
 
 
+# Настройка кэша (locmem по умолчанию; для нескольких процессов - FileBasedCache или RedisCache)
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache")
+CACHES = {
+    "default": {
+        "BACKEND": CACHE_BACKEND,
+        "LOCATION": os.getenv("CACHE_LOCATION", ""),
+    }
+}
+# Кэши в памяти процесса: изменения в них не видны другим воркерам
+PROCESS_LOCAL_CACHES = ("django.core.cache.backends.locmem.LocMemCache", "django.core.cache.backends.dummy.DummyCache")
+
+# Настройка кэша ответов курсов и уроков (по умолчанию включён только с общим кэшем, см. materials.checks)
+MATERIALS_CACHE_ENABLED = (
+    os.getenv("MATERIALS_CACHE_ENABLED", str(CACHE_BACKEND not in PROCESS_LOCAL_CACHES)) == "True"
+)
+MATERIALS_CACHE_ALIAS = os.getenv("MATERIALS_CACHE_ALIAS", "default")
+MATERIALS_CACHE_TIMEOUT = int(os.getenv("MATERIALS_CACHE_TIMEOUT", 10 * 60))  # Время жизни ответа (секунды)
+
+# Настройка курсов валют ЦБ РФ
+CBR_RATE_PROVIDER = os.getenv("CBR_RATE_PROVIDER", "users.services.CbrRateProvider")  # Класс поставщика курсов
+CBR_RATES_URL = os.getenv("CBR_RATES_URL", "https://www.cbr.ru/scripts/XML_daily.asp")  # Ежедневные курсы ЦБ РФ
+CBR_RATES_FILE = os.getenv("CBR_RATES_FILE", os.path.join(BASE_DIR, "users/fixtures/cbr_xml_daily.xml"))
+CBR_REQUEST_TIMEOUT = float(os.getenv("CBR_REQUEST_TIMEOUT", 5))  # Таймаут запроса к ЦБ (секунды)
+CBR_RATES_REFRESH_HOUR = int(os.getenv("CBR_RATES_REFRESH_HOUR", 0))  # Час (МСК), когда вступают в силу новые курсы
+CBR_RATES_RETRY_INTERVAL = int(os.getenv("CBR_RATES_RETRY_INTERVAL", 300))  # Пауза перед повтором после ошибки ЦБ
+CBR_RATES_STALE_TTL = int(os.getenv("CBR_RATES_STALE_TTL", 2 * 24 * 60 * 60))  # Сколько хранить устаревшие курсы
+
+# Настройка HTTP-клиентов внешних сервисов (Stripe, ЦБ РФ)
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 3.05))  # Таймаут подключения (секунды)
+HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 2))  # Количество повторов GET-запросов при сбоях
+STRIPE_API_BASE = os.getenv("STRIPE_API_BASE", "https://api.stripe.com")  # Адрес API Stripe
+STRIPE_REQUEST_TIMEOUT = float(os.getenv("STRIPE_REQUEST_TIMEOUT", 20))  # Таймаут чтения ответа Stripe (секунды)
+
+# Настройка фоновой обработки оплат
+PAYMENT_CHECKOUT_EAGER = os.getenv("PAYMENT_CHECKOUT_EAGER", False) == "True"  # Создавать сессию Stripe в запросе
+PAYMENT_CHECKOUT_WORKERS = int(os.getenv("PAYMENT_CHECKOUT_WORKERS", 4))  # Количество фоновых потоков
+PAYMENT_LINK_MAX_WAIT = float(os.getenv("PAYMENT_LINK_MAX_WAIT", 10))  # Максимальное ожидание ссылки (секунды)
+PAYMENT_LINK_POLL_INTERVAL = float(os.getenv("PAYMENT_LINK_POLL_INTERVAL", 0.5))  # Интервал проверки ссылки
+PAYMENT_EXPORT_CHUNK_SIZE = int(os.getenv("PAYMENT_EXPORT_CHUNK_SIZE", 2000))  # Строк в одной порции выгрузки
+
+# Настройка профилирования запросов (показатели доступны администраторам по адресу /profiling/)
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", False) == "True"
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", 0))  # Доля профилируемых запросов (0-1)
+PROFILING_HEADER = os.getenv("PROFILING_HEADER", "X-Profile")  # Заголовок, включающий профилирование запроса
+# Значение заголовка, включающее профилирование без входа администратора (иначе заголовок учитывается только от них)
+PROFILING_HEADER_SECRET = os.getenv("PROFILING_HEADER_SECRET") or None
+PROFILING_SLOW_MS = float(os.getenv("PROFILING_SLOW_MS", 500))  # Порог медленного запроса для cProfile (мс)
+PROFILING_CPROFILE_DIR = os.getenv("PROFILING_CPROFILE_DIR") or None  # Каталог для вывода cProfile
+
+# Настройка метрик в формате Prometheus (адрес /metrics/)
+# Токен для заголовка "Authorization: Bearer <токен>"; без него метрики доступны только администраторам
+METRICS_TOKEN = os.getenv("METRICS_TOKEN") or None
+METRICS_MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR") or None  # Общий каталог метрик процессов (воркеров)
+METRICS_FLUSH_INTERVAL = float(os.getenv("METRICS_FLUSH_INTERVAL", 5))  # Период сохранения метрик процесса (секунды)
+
 STRIPE_SECRET_KEY = os.getenv("STRIPE_SECRET_KEY")
 STRIPE_API_KEY = os.getenv("STRIPE_API_KEY")
+STRIPE_WEBHOOK_SECRET = os.getenv("STRIPE_WEBHOOK_SECRET")  # Секрет для проверки подписи вебхуков Stripe
@@ -9,6 +9,8 @@ from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from .views import ProfilingStatsAPIView, metrics_view
+
 
 schema_view = get_schema_view(
    openapi.Info(
@@ -30,6 +32,10 @@ urlpatterns = [
     path("", include("materials.urls", namespace="materials")),
     #-- URL for User models --
     path("users/", include("users.urls", namespace="users")),
+    #-- URL for request profiling --
+    path("profiling/", ProfilingStatsAPIView.as_view(), name="profiling-stats"),
+    #-- URL for Prometheus metrics --
+    path("metrics/", metrics_view, name="metrics"),
     #-- URL for API documentation --
     path("docs/", schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),  # swagger
     # path('docs/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),  # redoc
@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.views.decorators.http import require_GET
+from rest_framework import status
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from . import metrics
+from .permissions import is_staff_request, matches_secret
+from .profiling import HISTOGRAM_BUCKETS, registry
+
+
+class ProfilingStatsAPIView(APIView):
+    """
+    Показатели профилирования запросов по именам URL (только для администраторов).
+    GET - средние значения (время в миллисекундах, размер ответа в байтах) и гистограмма времени ответа,
+    DELETE - очистка накопленных показателей. Показатели хранятся в памяти процесса, обслужившего запрос.
+    """
+
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        """
+        Получает показатели профилирования процесса.
+        :param request: Запрос
+        :return: Ответ с границами гистограммы и показателями по именам URL
+        """
+        return Response({"histogram_buckets_ms": list(HISTOGRAM_BUCKETS), "endpoints": registry.snapshot()})
+
+    def delete(self, request):
+        """
+        Очищает показатели профилирования процесса.
+        :param request: Запрос
+        :return: Пустой ответ
+        """
+        registry.reset()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+@require_GET
+def metrics_view(request):
+    """
+    Отдаёт метрики API, БД и внешних сервисов в текстовом формате Prometheus.
+    Обычное представление Django без аутентификации DRF, чтобы частые опросы Prometheus обходились дёшево.
+    Доступно с заголовком "Authorization: Bearer <METRICS_TOKEN>" или администраторам (сессия или JWT-токен).
+    :param request: Запрос
+    :return: Ответ с метриками
+    """
+    token = request.headers.get("Authorization", "").removeprefix("Bearer ")
+    if not matches_secret(token, settings.METRICS_TOKEN) and not is_staff_request(request):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(metrics.collect()), content_type="text/plain; version=0.0.4; charset=utf-8")
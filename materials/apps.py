@@ -7,3 +7,10 @@ class MaterialsConfig(AppConfig):
     """
     default_auto_field = "django.db.models.BigAutoField"
     name = "materials"
+
+    def ready(self):
+        """
+        Подключает обработчики сигналов и проверки приложения.
+        :return: None
+        """
+        from . import checks, signals  # noqa: F401
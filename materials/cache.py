@@ -0,0 +1,115 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+def get_cache():
+    """
+    Получает кэш ответов курсов и уроков, заданный настройкой MATERIALS_CACHE_ALIAS.
+    :return: Бэкенд кэша
+    """
+    return caches[settings.MATERIALS_CACHE_ALIAS]
+
+
+def _version_key(name):
+    """
+    Формирует ключ версии группы закэшированных ответов.
+    :param name: Имя группы, например "course:1" или "course-list"
+    :return: Ключ кэша
+    """
+    return f"materials:version:{name}"
+
+
+def get_version(name):
+    """
+    Получает текущую версию группы закэшированных ответов.
+    Начальная версия берётся из текущего времени, поэтому после вытеснения ключа версии из кэша старые ответы
+    не будут прочитаны снова.
+    :param name: Имя группы
+    :return: Версия
+    """
+    cache = get_cache()
+    version = cache.get(_version_key(name))
+    if version is None:
+        cache.add(_version_key(name), time.time_ns(), None)
+        version = cache.get(_version_key(name))
+    return version
+
+
+def bump_version(*names):
+    """
+    Делает недействительными закэшированные ответы групп, увеличивая их версии.
+    Версии увеличиваются сразу и повторно после фиксации транзакции, чтобы ответ, прочитанный параллельным запросом
+    до фиксации изменений, не остался в кэше под новой версией.
+    :param names: Имена групп
+    :return: None
+    """
+    _bump_versions(names)
+    transaction.on_commit(lambda: _bump_versions(names))
+
+
+def _bump_versions(names):
+    """
+    Увеличивает версии групп закэшированных ответов.
+    :param names: Имена групп
+    :return: None
+    """
+    cache = get_cache()
+    for name in names:
+        try:
+            cache.incr(_version_key(name))
+        except ValueError:  # Версии ещё нет в кэше
+            cache.add(_version_key(name), time.time_ns(), None)
+
+
+def response_key(name, request=None):
+    """
+    Формирует ключ закэшированного ответа с учётом версии группы и параметров запроса.
+    :param name: Имя группы
+    :param request: Запрос (для списков - учитываются параметры пагинации, поиска и сортировки)
+    :return: Ключ кэша
+    """
+    key = f"materials:response:{name}:v{get_version(name)}"
+    if request is not None:
+        query = request.get_full_path().encode("utf-8")
+        key += f":{hashlib.md5(query).hexdigest()}"
+    return key
+
+
+def get_response(key):
+    """
+    Получает закэшированный ответ.
+    :param key: Ключ кэша
+    :return: Данные ответа или None
+    """
+    if not settings.MATERIALS_CACHE_ENABLED:
+        return None
+    return get_cache().get(key)
+
+
+def set_response(key, data):
+    """
+    Сохраняет ответ в кэше на MATERIALS_CACHE_TIMEOUT секунд.
+    :param key: Ключ кэша
+    :param data: Данные ответа
+    :return: None
+    """
+    if settings.MATERIALS_CACHE_ENABLED:
+        get_cache().set(key, data, settings.MATERIALS_CACHE_TIMEOUT)
+
+
+def get_state(name, compute):
+    """
+    Получает закэшированное состояние группы (например, количество и дату изменения курсов для ETag списка).
+    Состояние хранится под текущей версией группы и пересчитывается после её сброса.
+    :param name: Имя группы
+    :param compute: Функция вычисления состояния
+    :return: Состояние
+    """
+    if not settings.MATERIALS_CACHE_ENABLED:
+        return compute()
+    key = f"materials:state:{name}:v{get_version(name)}"
+    return get_cache().get_or_set(key, compute, settings.MATERIALS_CACHE_TIMEOUT)
@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, register
+
+from config.caches import is_process_local
+
+
+@register(Tags.caches)
+def check_materials_cache(app_configs, **kwargs):
+    """
+    Проверяет, что кэш ответов курсов и уроков включён только с общим для процессов кэшем: иначе сброс версий
+    после изменения доходит лишь до процесса, выполнившего запись, а остальные отдают устаревшие ответы.
+    :param app_configs: Проверяемые приложения
+    :param kwargs: Прочие аргументы проверки
+    :return: Список ошибок
+    """
+    if settings.MATERIALS_CACHE_ENABLED and is_process_local(settings.MATERIALS_CACHE_ALIAS):
+        return [
+            Error(
+                "MATERIALS_CACHE_ENABLED требует общего для процессов кэша.",
+                hint="Задайте CACHE_BACKEND (Redis, Memcached, файловый, в БД) или MATERIALS_CACHE_ENABLED=False.",
+                id="materials.E001",
+            )
+        ]
+    return []
@@ -1,4 +1,7 @@
-from rest_framework import generics
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
 from rest_framework.permissions import IsAuthenticated
 
 from users.permissions import IsOwner, IsModerator
@@ -22,3 +25,69 @@ class LessonPermissionMixin:
             self.permission_classes = [IsAuthenticated]  # Любой авторизованный пользователь может просматривать
 
         return [permission() for permission in self.permission_classes]
+
+
+class ConditionalGetMixin:
+    """
+    Добавляет к ответам заголовки ETag и Last-Modified и отвечает 304 Not Modified на условные GET-запросы,
+    если данные не изменились. Проверка выполняется по дате изменения, без сериализации данных.
+    """
+
+    @staticmethod
+    def is_conditional(request):
+        """
+        Проверяет, содержит ли запрос заголовки условного GET.
+        :param request: Запрос
+        :return: True, если запрос условный
+        """
+        return "HTTP_IF_NONE_MATCH" in request.META or "HTTP_IF_MODIFIED_SINCE" in request.META
+
+    @staticmethod
+    def make_etag(*parts):
+        """
+        Формирует ETag по версии данных.
+        :param parts: Составляющие версии (ID, даты изменения, количество объектов и т.д.)
+        :return: ETag в кавычках
+        """
+        return '"%s"' % hashlib.md5(":".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def get_object_state(queryset, pk):
+        """
+        Получает дату изменения и владельца объекта одним лёгким запросом.
+        :param queryset: Выборка объектов
+        :param pk: ID объекта
+        :return: Словарь {"updated_at": ..., "owner_id": ...} или None, если объект не найден
+        """
+        try:
+            return queryset.filter(pk=pk).values("updated_at", "owner_id").first()
+        except (TypeError, ValueError):
+            return None
+
+    def not_modified(self, request, etag, last_modified=None):
+        """
+        Формирует ответ 304, если версия данных у клиента совпадает с текущей.
+        :param request: Запрос
+        :param etag: Текущий ETag
+        :param last_modified: Текущая дата изменения
+        :return: Ответ 304 или None
+        """
+        timestamp = int(last_modified.timestamp()) if last_modified else None
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is not None:
+            self.set_validators(response, etag, last_modified)
+        return response
+
+    @staticmethod
+    def set_validators(response, etag, last_modified=None):
+        """
+        Добавляет к ответу заголовки ETag и Last-Modified.
+        :param response: Ответ
+        :param etag: ETag
+        :param last_modified: Дата изменения
+        :return: Ответ
+        """
+        response["ETag"] = etag
+        if last_modified:
+            response["Last-Modified"] = http_date(last_modified.timestamp())
+        return response
@@ -8,13 +8,15 @@ class Course(models.Model):
         name (str): Название курса,
         description (str): Описание курса,
         image (ImageField): Превью курса,
-        owner (User): Владелец курса.
+        owner (User): Владелец курса,
+        updated_at (DateTimeField): Дата изменения курса или его уроков.
     """
 
     name = models.CharField(max_length=255, verbose_name="Название курса")
     description = models.TextField(verbose_name="Описание курса")
     image = models.ImageField(upload_to="courses/", blank=True, null=True, verbose_name="Превью курса")
     owner = models.ForeignKey("users.User", on_delete=models.CASCADE, blank=True, null=True, verbose_name="Владелец курса")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name="Дата изменения")
 
     def __str__(self):
         """
@@ -39,7 +41,8 @@ class Lesson(models.Model):
         course (Course): Курс,
         image (ImageField): Превью урока,
         video (FileField): Видео урока,
-        owner (User): Владелец урока
+        owner (User): Владелец урока,
+        updated_at (DateTimeField): Дата изменения урока
     """
 
     name = models.CharField(max_length=255, verbose_name="Название урока")
@@ -48,6 +51,7 @@ class Lesson(models.Model):
     image = models.ImageField(upload_to="lessons/", blank=True, null=True, verbose_name="Превью урока")
     video = models.FileField(upload_to="lessons/", blank=True, null=True, verbose_name="Видео урока")
     owner = models.ForeignKey("users.User", on_delete=models.CASCADE, blank=True, null=True, verbose_name="Владелец урока")
+    updated_at = models.DateTimeField(auto_now=True, db_index=True, verbose_name="Дата изменения")
 
     def __str__(self):
         """
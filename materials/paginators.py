@@ -1,4 +1,4 @@
-from rest_framework.pagination import PageNumberPagination
+from rest_framework.pagination import BasePagination, CursorPagination, PageNumberPagination
 
 
 class CoursePagination(PageNumberPagination):
@@ -19,3 +19,147 @@ class LessonPagination(PageNumberPagination):
     page_size = 2  # Количество элементов на одной странице
     page_size_query_param = "page_size"  # Позволяет клиенту запрашивать разное количество элементов
     max_page_size = 10  # Максимальное количество элементов на одной странице
+
+
+class CourseCursorPagination(CursorPagination):
+    """
+    Определяет курсорную пагинацию для представления курсов.
+    Не выполняет COUNT(*) и выбирает страницу по индексу первичного ключа вместо OFFSET.
+    """
+
+    page_size = 2  # Количество элементов на одной странице
+    page_size_query_param = "page_size"  # Позволяет клиенту запрашивать разное количество элементов
+    max_page_size = 10  # Максимальное количество элементов на одной странице
+    ordering = "id"  # Поле, по которому строится курсор
+
+
+class LessonCursorPagination(CursorPagination):
+    """
+    Определяет курсорную пагинацию для представления уроков.
+    Не выполняет COUNT(*) и выбирает страницу по индексу первичного ключа вместо OFFSET.
+    """
+
+    page_size = 2  # Количество элементов на одной странице
+    page_size_query_param = "page_size"  # Позволяет клиенту запрашивать разное количество элементов
+    max_page_size = 10  # Максимальное количество элементов на одной странице
+    ordering = "id"  # Поле, по которому строится курсор
+
+
+class SelectablePagination(BasePagination):
+    """
+    Выбирает постраничную или курсорную пагинацию по параметру запроса.
+    Курсорная пагинация включается параметром `?pagination=cursor` или наличием параметра курсора в запросе.
+    Attributes:
+        page_number_class: Класс постраничной пагинации (None - без пагинации)
+        cursor_class: Класс курсорной пагинации
+        mode_query_param: Имя параметра запроса для выбора режима
+    """
+
+    page_number_class = None
+    cursor_class = None
+    mode_query_param = "pagination"
+
+    def __init__(self):
+        """
+        Инициализирует пагинатор без выбранного режима.
+        :return: None
+        """
+        self.paginator = None
+
+    @property
+    def display_page_controls(self):
+        """
+        Показывает, нужны ли элементы управления пагинацией в Browsable API. Выбранный пагинатор определяет это
+        только после разбиения выборки, поэтому значение берётся у него при каждом обращении.
+        :return: True, если у страницы есть соседние страницы
+        """
+        return self.paginator is not None and self.paginator.display_page_controls
+
+    def get_paginator_class(self, request):
+        """
+        Определяет класс пагинации для запроса.
+        :param request: Запрос
+        :return: Класс пагинации или None
+        """
+        mode = request.query_params.get(self.mode_query_param)
+        if mode == "cursor":
+            return self.cursor_class
+        if mode is None and self.cursor_class.cursor_query_param in request.query_params:
+            return self.cursor_class
+        return self.page_number_class
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """
+        Разбивает выборку на страницы выбранным классом пагинации.
+        :param queryset: Выборка
+        :param request: Запрос
+        :param view: Представление
+        :return: Список объектов страницы или None, если пагинация не используется
+        """
+        paginator_class = self.get_paginator_class(request)
+        if paginator_class is None:
+            self.paginator = None
+            return None
+        self.paginator = paginator_class()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        """
+        Формирует ответ выбранного класса пагинации.
+        :param data: Данные страницы
+        :return: Ответ
+        """
+        return self.paginator.get_paginated_response(data)
+
+    def get_paginated_response_schema(self, schema):
+        """
+        Описывает схему ответа для документации.
+        :param schema: Схема списка объектов
+        :return: Схема ответа
+        """
+        return (self.page_number_class or self.cursor_class)().get_paginated_response_schema(schema)
+
+    def get_schema_operation_parameters(self, view):
+        """
+        Описывает параметры запроса обоих режимов пагинации для документации.
+        :param view: Представление
+        :return: Список параметров
+        """
+        parameters = [
+            {
+                "name": self.mode_query_param,
+                "required": False,
+                "in": "query",
+                "description": "Режим пагинации: cursor для курсорной пагинации.",
+                "schema": {"type": "string", "enum": ["page", "cursor"]},
+            }
+        ]
+        for paginator_class in (self.page_number_class, self.cursor_class):
+            if paginator_class is not None:
+                parameters += paginator_class().get_schema_operation_parameters(view)
+        return parameters
+
+    def to_html(self):
+        """
+        Отображает элементы управления пагинацией в Browsable API.
+        :return: HTML-разметка
+        """
+        return self.paginator.to_html()
+
+
+class CourseSelectablePagination(SelectablePagination):
+    """
+    Определяет пагинацию курсов с выбором постраничного или курсорного режима.
+    """
+
+    page_number_class = CoursePagination
+    cursor_class = CourseCursorPagination
+
+
+class LessonSelectablePagination(SelectablePagination):
+    """
+    Определяет пагинацию уроков с выбором постраничного или курсорного режима.
+    """
+
+    page_number_class = LessonPagination
+    cursor_class = LessonCursorPagination
@@ -36,17 +36,26 @@ class CourseSerializer(serializers.ModelSerializer):
     def get_lessons_count(obj):
         """
         Получает количество уроков в курсе.
+        Использует аннотацию из CourseViewSet.get_queryset, а при её отсутствии (например, для только что
+        созданного курса) выполняет отдельный запрос.
         :param obj: Объект курса
         :return: Количество уроков
         """
+        lessons_count = getattr(obj, "lessons_count", None)
+        if lessons_count is not None:
+            return lessons_count
         return obj.lessons.count()
 
     def get_is_subscribed(self, obj):
         """
         Определяет, подписан ли текущий пользователь на курс.
+        Использует аннотацию из CourseViewSet.get_queryset, а при её отсутствии выполняет отдельный запрос.
         :param obj: Объект курса
         :return: True, если пользователь подписан, иначе False
         """
+        is_subscribed = getattr(obj, "is_subscribed", None)
+        if is_subscribed is not None:
+            return is_subscribed
         user = self.context.get("request").user
         if user.is_authenticated:
             return Subscription.objects.filter(user=user, course=obj).exists()
@@ -76,9 +85,12 @@ class CourseDetailSerializer(serializers.ModelSerializer):
     def get_lessons_count(obj):
         """
         Получает количество уроков в курсе.
+        Если уроки уже подгружены через prefetch_related, считает их без дополнительного запроса.
         :param obj: Объект курса
         :return: Количество уроков
         """
+        if "lessons" in getattr(obj, "_prefetched_objects_cache", {}):
+            return len(obj.lessons.all())
         return obj.lessons.count()
 
     def get(self, request, course_id):
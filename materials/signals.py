@@ -0,0 +1,54 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .cache import bump_version
+from .models import Course, Lesson
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def course_changed(sender, instance, **kwargs):
+    """
+    Сбрасывает закэшированные ответы курса и списка курсов.
+    :param sender: Модель курса
+    :param instance: Курс
+    :return: None
+    """
+    bump_version(f"course:{instance.pk}", "course-list")
+
+
+@receiver(pre_save, sender=Lesson)
+def lesson_pre_save(sender, instance, **kwargs):
+    """
+    Запоминает прежний курс урока, чтобы при переносе урока сбросить кэш обоих курсов.
+    :param sender: Модель урока
+    :param instance: Урок
+    :return: None
+    """
+    if instance.pk is not None:
+        instance._previous_course_id = (
+            Lesson.objects.filter(pk=instance.pk).values_list("course_id", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def lesson_changed(sender, instance, origin=None, **kwargs):
+    """
+    Обновляет дату изменения курса урока и сбрасывает закэшированные ответы урока, списка уроков и курса урока
+    (детализация и количество уроков).
+    :param sender: Модель урока
+    :param instance: Урок
+    :param origin: Объект, удаление которого вызвало удаление урока (только для post_delete)
+    :return: None
+    """
+    course_ids = {instance.course_id}
+    previous_course_id = getattr(instance, "_previous_course_id", None)
+    if previous_course_id is not None:
+        course_ids.add(previous_course_id)
+    if not isinstance(origin, Course):  # При каскадном удалении курса обновлять его не нужно (и это запрос на урок)
+        Course.objects.filter(pk__in=course_ids).update(updated_at=timezone.now())
+
+    names = {f"lesson:{instance.pk}", "lesson-list", "course-list"}
+    bump_version(*names, *(f"course:{course_id}" for course_id in course_ids))
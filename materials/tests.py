@@ -1,7 +1,15 @@
+from django.contrib.auth.models import Group
+from django.db import connection
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory, APITestCase
+from materials.cache import get_cache
+from materials.checks import check_materials_cache
 from materials.models import Lesson, Course
-from users.models import User
+from materials.paginators import CourseSelectablePagination
+from users.models import Subscription, User
 
 
 # Можно импортировать пользователя из users.models или получить через
@@ -112,6 +120,30 @@ class LessonCreateAPIViewTestCase(APITestCase):
         response = self.client.delete(self.lesson_delete_url)
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
 
+    def test_retrieve_lesson_queries(self):
+        """
+        Проверяет, что урок загружается из БД одним запросом.
+        :return: None
+        """
+        get_cache().clear()
+        self.client.force_authenticate(user=self.owner)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.lesson_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["name"], "Test Lesson")
+
+    def test_delete_lesson_queries(self):
+        """
+        Проверяет, что удаляемый урок загружается и проверяется один раз.
+        :return: None
+        """
+        self.client.force_authenticate(user=self.owner)
+        # Урок, обнуление оплат урока, удаление урока и обновление даты изменения курса
+        with self.assertNumQueries(4):
+            response = self.client.delete(self.lesson_delete_url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Lesson.objects.filter(pk=self.lesson.pk).exists())
+
 
 # -- Тестирование CRUD операций с курсами --
 class CourseViewSetTestCase(APITestCase):
@@ -269,3 +301,396 @@ class CourseViewSetTestCase(APITestCase):
         self.client.force_authenticate(user=self.moderator)
         response = self.client.delete(self.course_url)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_delete_course_queries(self):
+        """
+        Проверяет, что удаляемый курс загружается и проверяется один раз.
+        :return: None
+        """
+        self.client.force_authenticate(user=self.owner)
+        # Курс, подписки и уроки курса, перенос статистики курса, обнуление оплат и статистики курса и удаление курса
+        with self.assertNumQueries(7):
+            response = self.client.delete(self.course_url)
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertFalse(Course.objects.filter(pk=self.course.pk).exists())
+
+    def test_list_courses_constant_queries(self):
+        """
+        Проверяет, что количество запросов к БД при получении списка курсов не зависит от числа курсов.
+        :return: None
+        """
+        from users.models import Subscription
+
+        for index in range(5):
+            course = Course.objects.create(name=f"Course {index}", description="Description", owner=self.owner)
+            Lesson.objects.create(name=f"Lesson {index}", description="Description", course=course, owner=self.owner)
+            Subscription.objects.create(user=self.user, course=course)
+
+        self.client.force_authenticate(user=self.user)
+        with self.assertNumQueries(2):  # COUNT для пагинации и выборка страницы с аннотациями
+            response = self.client.get(self.list_url, {"page_size": 10})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"][1]["lessons_count"], 1)
+        self.assertTrue(response.data["results"][1]["is_subscribed"])
+
+    def test_retrieve_course_queries(self):
+        """
+        Проверяет, что детализация курса загружает курс и его уроки за два запроса.
+        :return: None
+        """
+        for index in range(3):
+            Lesson.objects.create(
+                name=f"Lesson {index}", description="Description", course=self.course, owner=self.owner
+            )
+
+        self.client.force_authenticate(user=self.owner)
+        with self.assertNumQueries(2):  # Курс и уроки курса
+            response = self.client.get(self.course_url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["lessons_count"], 3)
+        self.assertEqual(len(response.data["lessons"]), 3)
+
+    def test_list_courses_cursor_pagination(self):
+        """
+        Проверяет курсорную пагинацию списка курсов: без запроса COUNT и с переходом на следующую страницу.
+        :return: None
+        """
+        for index in range(3):
+            Course.objects.create(name=f"Course {index}", description="Description", owner=self.owner)
+
+        self.client.force_authenticate(user=self.user)
+        with self.assertNumQueries(1):  # Только выборка страницы
+            response = self.client.get(self.list_url, {"pagination": "cursor"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn("count", response.data)
+        self.assertEqual(len(response.data["results"]), 2)
+
+        response = self.client.get(response.data["next"])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data["results"]), 2)
+        self.assertIsNone(response.data["next"])
+
+    def test_selectable_pagination_page_controls(self):
+        """
+        Проверяет, что элементы управления пагинацией отображаются в обоих режимах, если страниц больше одной.
+        :return: None
+        """
+        for index in range(3):
+            Course.objects.create(name=f"Course {index}", description="Description", owner=self.owner)
+
+        for params in ({}, {"pagination": "cursor"}):
+            with self.subTest(params=params):
+                paginator = CourseSelectablePagination()
+                self.assertFalse(paginator.display_page_controls)
+                request = Request(APIRequestFactory().get(self.list_url, params))
+                paginator.paginate_queryset(Course.objects.order_by("id"), request)
+                self.assertTrue(paginator.display_page_controls)
+
+
+# -- Тестирование кэша ответов курсов и уроков --
+@override_settings(MATERIALS_CACHE_ENABLED=True)  # Тесты выполняются в одном процессе
+class MaterialsCacheTestCase(APITestCase):
+    """
+    Тестирует кэширование ответов курсов и уроков и его сброс при изменениях.
+    """
+
+    def setUp(self):
+        """
+        Создаёт пользователей и тестовые данные.
+        :return: None
+        """
+        from users.models import Subscription
+
+        self.owner = User.objects.create_user(username="owner", email="owner@example.com", password="testpass")
+        self.user = User.objects.create_user(username="user", email="user@example.com", password="testpass")
+        self.course = Course.objects.create(name="Test Course", description="Test Description", owner=self.owner)
+        self.lesson = Lesson.objects.create(
+            name="Test Lesson", description="Test Description", course=self.course, owner=self.owner
+        )
+        Subscription.objects.create(user=self.user, course=self.course)
+
+    def test_course_list_cached_with_user_subscription(self):
+        """
+        Проверяет, что повторный запрос списка курсов берётся из кэша, а подписка вычисляется для каждого пользователя.
+        :return: None
+        """
+        self.client.force_authenticate(user=self.user)
+        self.client.get("/course/")
+        with self.assertNumQueries(1):  # Только подписки пользователя на курсы страницы
+            response = self.client.get("/course/")
+        self.assertTrue(response.data["results"][0]["is_subscribed"])
+
+        self.client.force_authenticate(user=self.owner)
+        response = self.client.get("/course/")
+        self.assertFalse(response.data["results"][0]["is_subscribed"])
+
+    def test_course_detail_cached_and_invalidated(self):
+        """
+        Проверяет, что детализация курса берётся из кэша и сбрасывается при изменении урока.
+        :return: None
+        """
+        self.client.force_authenticate(user=self.owner)
+        self.client.get(f"/course/{self.course.id}/")
+        with self.assertNumQueries(0):
+            response = self.client.get(f"/course/{self.course.id}/")
+        self.assertEqual(response.data["lessons_count"], 1)
+
+        Lesson.objects.create(name="Second Lesson", description="Description", course=self.course, owner=self.owner)
+        response = self.client.get(f"/course/{self.course.id}/")
+        self.assertEqual(response.data["lessons_count"], 2)
+
+    def test_cached_course_detail_checks_permissions(self):
+        """
+        Проверяет, что закэшированная детализация курса недоступна пользователю без прав.
+        :return: None
+        """
+        self.client.force_authenticate(user=self.owner)
+        self.client.get(f"/course/{self.course.id}/")
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(f"/course/{self.course.id}/")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_process_local_cache_rejected(self):
+        """
+        Проверяет, что кэш ответов нельзя включить с кэшем в памяти процесса.
+        :return: None
+        """
+        self.assertEqual([error.id for error in check_materials_cache(None)], ["materials.E001"])
+        with override_settings(MATERIALS_CACHE_ENABLED=False):
+            self.assertEqual(check_materials_cache(None), [])
+
+    def test_course_detail_key_normalized(self):
+        """
+        Проверяет, что курс по адресу с ведущим нулём кэшируется под тем же ключом и сбрасывается при изменении,
+        а нечисловой ID не принимается.
+        :return: None
+        """
+        self.client.force_authenticate(user=self.owner)
+        response = self.client.get(f"/course/0{self.course.id}/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.course.owner = self.user
+        self.course.save()
+        response = self.client.get(f"/course/0{self.course.id}/")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        self.assertEqual(self.client.get("/course/abc/").status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_lesson_detail_invalidated_on_update(self):
+        """
+        Проверяет, что закэшированный урок обновляется после изменения.
+        :return: None
+        """
+        self.client.force_authenticate(user=self.owner)
+        self.client.get(f"/lesson/list/{self.lesson.id}/")
+        self.lesson.name = "Renamed Lesson"
+        self.lesson.save()
+        response = self.client.get(f"/lesson/list/{self.lesson.id}/")
+        self.assertEqual(response.data["name"], "Renamed Lesson")
+
+
+# -- Тестирование условных GET-запросов --
+@override_settings(MATERIALS_CACHE_ENABLED=True)  # Тесты выполняются в одном процессе
+class ConditionalGetTestCase(APITestCase):
+    """
+    Тестирование условных GET-запросов (ETag и Last-Modified) к курсам и урокам.
+    """
+
+    def setUp(self):
+        """
+        Создание пользователя, курса и урока.
+        :return: None
+        """
+        get_cache().clear()
+        self.owner = User.objects.create_user(username="owner", email="owner@example.com", password="testpass")
+        self.course = Course.objects.create(name="Test Course", description="Test Description", owner=self.owner)
+        self.lesson = Lesson.objects.create(
+            name="Test Lesson", description="Test Description", course=self.course, owner=self.owner
+        )
+        self.client.force_authenticate(user=self.owner)
+
+    def test_course_detail_not_modified(self):
+        """
+        Проверяет ответ 304 на повторный запрос курса с тем же ETag.
+        :return: None
+        """
+        response = self.client.get(f"/course/{self.course.id}/")
+        self.assertIn("ETag", response)
+        self.assertIn("Last-Modified", response)
+
+        response = self.client.get(f"/course/{self.course.id}/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_course_detail_modified_by_lesson(self):
+        """
+        Проверяет, что изменение урока меняет ETag курса.
+        :return: None
+        """
+        etag = self.client.get(f"/course/{self.course.id}/")["ETag"]
+        self.lesson.name = "Renamed Lesson"
+        self.lesson.save()
+
+        response = self.client.get(f"/course/{self.course.id}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_course_detail_not_modified_without_cache(self):
+        """
+        Проверяет, что без закэшированного ответа версия курса проверяется одним запросом.
+        :return: None
+        """
+        etag = self.client.get(f"/course/{self.course.id}/")["ETag"]
+        get_cache().clear()
+        with self.assertNumQueries(1):
+            response = self.client.get(f"/course/{self.course.id}/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_course_list_modified_by_subscription(self):
+        """
+        Проверяет, что ETag списка курсов меняется при подписке пользователя.
+        :return: None
+        """
+        etag = self.client.get("/course/")["ETag"]
+        response = self.client.get("/course/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Subscription.objects.create(user=self.owner, course=self.course)
+        response = self.client.get("/course/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_course_list_etag_without_extra_queries(self):
+        """
+        Проверяет, что ETag списка курсов строится без дополнительных запросов: закэшированная страница с ETag
+        клиента стоит одного запроса подписок пользователя.
+        :return: None
+        """
+        etag = self.client.get("/course/")["ETag"]
+        with self.assertNumQueries(1):
+            response = self.client.get("/course/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_lesson_list_not_modified(self):
+        """
+        Проверяет ответ 304 на повторный запрос списка уроков и новый ETag после изменения урока.
+        :return: None
+        """
+        etag = self.client.get("/lesson/list/")["ETag"]
+        response = self.client.get("/lesson/list/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        Lesson.objects.create(name="Second Lesson", description="Description", course=self.course, owner=self.owner)
+        response = self.client.get("/lesson/list/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+# -- Бюджет запросов к БД для всех эндпоинтов --
+@override_settings(MATERIALS_CACHE_ENABLED=True)  # Тесты выполняются в одном процессе
+class MaterialsQueryBudgetTestCase(APITestCase):
+    """
+    Проверяет, что количество запросов к БД и размер ответа эндпоинтов курсов и уроков ограничены и не зависят
+    от объёма данных и запрошенного размера страницы. Каждый запрос выполняется с пустым кэшем ответов.
+    """
+
+    courses_count = 200
+    lessons_per_course = 10
+    max_response_size = 16 * 1024  # Байт
+
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Создаёт пользователей, курсы, уроки и подписки.
+        :return: None
+        """
+        cls.owner = User.objects.create_user(username="owner", email="owner@example.com", password="testpass")
+        cls.moderator = User.objects.create_user(username="moder", email="moder@example.com", password="testpass")
+        cls.user = User.objects.create_user(username="user", email="user@example.com", password="testpass")
+        Group.objects.get_or_create(name="Модераторы")[0].user_set.add(cls.moderator)
+        cls.moderator.refresh_from_db()  # Флаг is_moderator синхронизирован сигналом, как при загрузке по JWT
+
+        courses = Course.objects.bulk_create(
+            Course(name=f"Course {index}", description="Description", owner=cls.owner)
+            for index in range(cls.courses_count)
+        )
+        Lesson.objects.bulk_create(
+            Lesson(name=f"Lesson {index}", description="Description", course=course, owner=cls.owner)
+            for course in courses
+            for index in range(cls.lessons_per_course)
+        )
+        Subscription.objects.bulk_create(Subscription(user=cls.user, course=course) for course in courses[::2])
+        cls.course = courses[0]
+        cls.lesson = Lesson.objects.filter(course=cls.course).order_by("id").first()
+
+    def setUp(self):
+        """
+        Очищает кэш ответов.
+        :return: None
+        """
+        get_cache().clear()
+
+    def assert_budget(self, role, method, url, expected_status, max_queries, data=None):
+        """
+        Выполняет запрос от имени пользователя и проверяет статус, количество запросов к БД и размер ответа.
+        :param role: Имя атрибута пользователя: owner, moderator или user
+        :param method: HTTP-метод
+        :param url: Адрес
+        :param expected_status: Ожидаемый статус ответа
+        :param max_queries: Максимальное количество запросов к БД
+        :param data: Тело запроса или параметры GET
+        :return: None
+        """
+        get_cache().clear()
+        self.client.force_authenticate(user=getattr(self, role))
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data, format="json" if method != "get" else None)
+        self.assertEqual(response.status_code, expected_status)
+        self.assertLessEqual(len(queries), max_queries, "\n".join(query["sql"] for query in queries.captured_queries))
+        self.assertLessEqual(len(response.content), self.max_response_size)
+
+    def test_read_endpoints(self):
+        """
+        Проверяет эндпоинты чтения для владельца, модератора и пользователя.
+        :return: None
+        """
+        endpoints = [
+            # COUNT и страница с аннотациями
+            ("get", "/course/", {"page_size": 1000}, 2),
+            ("get", "/course/", {"page_size": 1000, "pagination": "cursor"}, 1),
+            # Курс и уроки курса (для пользователя - курс и подписка в проверке прав)
+            ("get", f"/course/{self.course.id}/", None, 2),
+            ("get", "/lesson/list/", {"page_size": 1000}, 3),
+            ("get", "/lesson/list/", {"page_size": 1000, "pagination": "cursor"}, 2),
+            ("get", f"/lesson/list/{self.lesson.id}/", None, 1),
+        ]
+        for role in ("owner", "moderator", "user"):
+            for method, url, data, max_queries in endpoints:
+                with self.subTest(role=role, url=url, data=data):
+                    # Детализация курса доступна только владельцу и модератору
+                    forbidden = role == "user" and url == f"/course/{self.course.id}/"
+                    expected_status = status.HTTP_403_FORBIDDEN if forbidden else status.HTTP_200_OK
+                    self.assert_budget(role, method, url, expected_status, max_queries, data)
+
+    def test_write_endpoints(self):
+        """
+        Проверяет эндпоинты создания, изменения и удаления с учётом прав владельца, модератора и пользователя.
+        :return: None
+        """
+        course, lesson = self.course, self.lesson
+        course_data = {"name": "New Course", "description": "Description"}
+        lesson_data = {"name": "New Lesson", "description": "Description", "course": course.id}
+        endpoints = [
+            ("owner", "post", "/course/", course_data, status.HTTP_201_CREATED, 3),
+            ("owner", "patch", f"/course/{course.id}/", {"name": "Renamed"}, status.HTTP_200_OK, 2),
+            ("moderator", "patch", f"/course/{course.id}/", {"name": "Renamed"}, status.HTTP_200_OK, 2),
+            ("user", "patch", f"/course/{course.id}/", {"name": "Renamed"}, status.HTTP_403_FORBIDDEN, 1),
+            ("moderator", "delete", f"/course/{course.id}/", None, status.HTTP_403_FORBIDDEN, 1),
+            ("owner", "post", "/lesson/create/", lesson_data, status.HTTP_201_CREATED, 3),
+            ("owner", "patch", f"/lesson/update/{lesson.id}/", {"name": "Renamed"}, status.HTTP_200_OK, 4),
+            ("moderator", "patch", f"/lesson/update/{lesson.id}/", {"name": "Renamed"}, status.HTTP_200_OK, 4),
+            ("user", "patch", f"/lesson/update/{lesson.id}/", {"name": "Renamed"}, status.HTTP_403_FORBIDDEN, 1),
+            ("user", "delete", f"/lesson/delete/{lesson.id}/", None, status.HTTP_403_FORBIDDEN, 1),
+            ("owner", "delete", f"/lesson/delete/{lesson.id}/", None, status.HTTP_204_NO_CONTENT, 4),
+            # Каскадное удаление курса с уроками не зависит от количества уроков
+            ("owner", "delete", f"/course/{course.id}/", None, status.HTTP_204_NO_CONTENT, 10),
+        ]
+        for role, method, url, data, expected_status, max_queries in endpoints:
+            with self.subTest(role=role, method=method, url=url):
+                self.assert_budget(role, method, url, expected_status, max_queries, data)
@@ -21,7 +21,7 @@ class DescriptionValidator:
         """
         pattern = re.compile(r"(?:https?://)?(?:www\.)?(youtube\.com|youtu\.be)")  # Проверяет также сокращённые ссылки
 
-        field_to_validate = dict(value).get(self.field)
+        field_to_validate = dict(value).get(self.field) or ""  # При частичном обновлении поля может не быть
         if "https://" in field_to_validate or "http://" in field_to_validate:
             if not pattern.match(field_to_validate):
                 raise serializers.ValidationError("Ссылка на другие каналы кроме youtube не допустима.")
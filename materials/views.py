@@ -1,10 +1,14 @@
 # View for materials app
+from django.db.models import Count, Exists, Max, OuterRef, Prefetch, Value
 from rest_framework.permissions import IsAuthenticated
-from rest_framework import viewsets, generics
+from rest_framework import viewsets, generics, status
+from rest_framework.response import Response
+from users.models import Subscription
 from users.permissions import IsModerator, IsOwner
-from .mixins import LessonPermissionMixin
+from . import cache
+from .mixins import ConditionalGetMixin, LessonPermissionMixin
 from .models import Course, Lesson
-from .paginators import CoursePagination
+from .paginators import CourseSelectablePagination, LessonSelectablePagination
 from .serializers import CourseSerializer, LessonSerializer, CourseDetailSerializer
 import logging
 
@@ -12,7 +16,7 @@ logger = logging.getLogger(__name__)
 
 
 # -- ViewSet для создания CRUD-операций с курсами --
-class CourseViewSet(viewsets.ModelViewSet):
+class CourseViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     """
     Определяет ViewSet для CRUD-операций с курсами.
     Attributes:
@@ -21,6 +25,26 @@ class CourseViewSet(viewsets.ModelViewSet):
     """
 
     queryset = Course.objects.all().order_by("id")
+    lookup_value_regex = r"\d+"  # ID курса входит в ключ кэша, поэтому принимаются только числа
+
+    # -- QuerySet
+    def get_queryset(self):
+        """
+        Добавляет к курсам количество уроков и признак подписки текущего пользователя одним SQL-запросом.
+        Для детализации курса вместо аннотаций подгружает уроки через prefetch_related.
+        :return: Список курсов с аннотациями lessons_count и is_subscribed или с подгруженными уроками
+        """
+        queryset = super().get_queryset()
+        if self.action == "retrieve":
+            # Детализации курса нужны сами уроки: забираем их одним дополнительным запросом
+            return queryset.prefetch_related(Prefetch("lessons", queryset=Lesson.objects.order_by("id")))
+
+        user = self.request.user
+        if user.is_authenticated:
+            is_subscribed = Exists(Subscription.objects.filter(user=user, course=OuterRef("pk")))
+        else:
+            is_subscribed = Value(False)
+        return queryset.annotate(lessons_count=Count("lessons"), is_subscribed=is_subscribed)
 
     # -- Serializer
     def get_serializer_class(self):
@@ -52,7 +76,7 @@ class CourseViewSet(viewsets.ModelViewSet):
         return [permission() for permission in self.permission_classes]
 
     # -- Pagination
-    pagination_class = CoursePagination
+    pagination_class = CourseSelectablePagination  # Постраничная или курсорная (?pagination=cursor)
 
     # -- Переопределение метода для использования сериализатора
     def perform_create(self, serializer):
@@ -90,7 +114,56 @@ class CourseViewSet(viewsets.ModelViewSet):
         :return: Ответ
         """
         logger.info("Получен запрос на список курсов от %s", request.user)
-        return super().list(request, *args, **kwargs)
+        # Версия читается до данных: изменение во время запроса сделает устаревшим ETag, а не закэшированные данные
+        version = cache.get_version("course-list")
+        key = cache.response_key("course-list", request)
+        data = cache.get_response(key)
+        if data is None:
+            response = super().list(request, *args, **kwargs)
+            # Признак подписки зависит от пользователя, поэтому в общий кэш он не попадает
+            results = self.page_results(response.data)
+            cached_results = [{k: v for k, v in item.items() if k != "is_subscribed"} for item in results]
+            if isinstance(response.data, dict):
+                cache.set_response(key, {**response.data, "results": cached_results})
+            else:
+                cache.set_response(key, cached_results)
+        else:
+            response = Response(self.merge_is_subscribed(data, request.user))
+
+        if version is None:  # Кэш не хранит версии (DummyCache): изменения списка не отследить
+            return response
+        # ETag - из уже полученных данных: версии списка и подписок пользователя на курсы страницы
+        subscribed = [item["id"] for item in self.page_results(response.data) if item["is_subscribed"]]
+        etag = self.make_etag(request.get_full_path(), version, *subscribed)
+        not_modified = self.not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+        return self.set_validators(response, etag)
+
+    @staticmethod
+    def page_results(data):
+        """
+        Получает курсы страницы из данных ответа с пагинацией или без неё.
+        :param data: Данные ответа
+        :return: Список курсов
+        """
+        return data["results"] if isinstance(data, dict) else data
+
+    @classmethod
+    def merge_is_subscribed(cls, data, user):
+        """
+        Добавляет признак подписки пользователя к закэшированной странице курсов одним запросом.
+        :param data: Закэшированные данные страницы
+        :param user: Пользователь
+        :return: Данные страницы с полем is_subscribed
+        """
+        results = cls.page_results(data)
+        course_ids = [item["id"] for item in results]
+        subscribed = set(
+            Subscription.objects.filter(user=user, course_id__in=course_ids).values_list("course_id", flat=True)
+        )
+        results = [{**item, "is_subscribed": item["id"] in subscribed} for item in results]
+        return {**data, "results": results} if isinstance(data, dict) else results
 
     def retrieve(self, request, *args, **kwargs):
         """
@@ -100,9 +173,33 @@ class CourseViewSet(viewsets.ModelViewSet):
         :param kwargs: Список именованных аргументов
         :return: Ответ
         """
-        course = self.get_object()
+        pk = int(self.kwargs[self.lookup_field])  # /course/01/ и /course/1/ - один курс и один ключ кэша
+        key = cache.response_key(f"course:{pk}")
+        entry = cache.get_response(key)
+        state = entry
+        if state is None and self.is_conditional(request):
+            state = self.get_object_state(Course.objects.all(), pk)  # Лёгкий запрос версии вместо всего курса
+
+        if state is not None:
+            # Права проверяются по владельцу из кэша или запроса версии, без загрузки курса из БД
+            self.check_object_permissions(request, Course(pk=pk, owner_id=state["owner_id"]))
+            etag = self.make_etag("course", pk, state["updated_at"].isoformat())
+            not_modified = self.not_modified(request, etag, state["updated_at"])
+            if not_modified is not None:
+                return not_modified
+
+        if entry is not None:
+            logger.info("Курс %s запрошен пользователем %s", entry["data"]["name"], request.user)
+            return self.set_validators(Response(entry["data"]), etag, entry["updated_at"])
+
+        course = self.get_object()  # Курс запрашивается один раз и используется и для лога, и для ответа
         logger.info("Курс %s запрошен пользователем %s", course.name, request.user)
-        return super().retrieve(request, *args, **kwargs)
+        serializer = self.get_serializer(course)
+        cache.set_response(
+            key, {"owner_id": course.owner_id, "updated_at": course.updated_at, "data": serializer.data}
+        )
+        etag = self.make_etag("course", course.pk, course.updated_at.isoformat())
+        return self.set_validators(Response(serializer.data), etag, course.updated_at)
 
     def update(self, request, *args, **kwargs):
         """
@@ -126,9 +223,10 @@ class CourseViewSet(viewsets.ModelViewSet):
         :param kwargs: Список именованных аргументов
         :return: Ответ
         """
-        course = self.get_object()
+        course = self.get_object()  # Объект запрашивается и проверяется один раз для лога и удаления
         logger.warning("Курс %s удалён пользователем %s", course.name, request.user)
-        return super().destroy(request, *args, **kwargs)
+        self.perform_destroy(course)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 # -- API endpoints для создания CRUD-операций с уроками --
@@ -166,7 +264,7 @@ class LessonCreateAPIView(LessonPermissionMixin, generics.CreateAPIView):
         return response
 
 
-class LessonListAPIView(LessonPermissionMixin, generics.ListAPIView):
+class LessonListAPIView(ConditionalGetMixin, LessonPermissionMixin, generics.ListAPIView):
     """
     Определяет API endpoint для получения списка уроков.
     Attributes:
@@ -177,7 +275,7 @@ class LessonListAPIView(LessonPermissionMixin, generics.ListAPIView):
 
     queryset = Lesson.objects.all().order_by("id")
     serializer_class = LessonSerializer
-    pagination_class = CoursePagination
+    pagination_class = LessonSelectablePagination  # Постраничная или курсорная (?pagination=cursor)
 
     def list(self, request, *args, **kwargs):
         """
@@ -188,10 +286,25 @@ class LessonListAPIView(LessonPermissionMixin, generics.ListAPIView):
         :return: Ответ
         """
         logger.info("Запрос на получение списка уроков от %s", request.user)
-        return super().list(request, *args, **kwargs)
+        lessons_state = cache.get_state(
+            "lesson-list",
+            lambda: tuple(Lesson.objects.aggregate(count=Count("id"), updated=Max("updated_at")).values()),
+        )
+        etag = self.make_etag(request.get_full_path(), *lessons_state)
+        not_modified = self.not_modified(request, etag)
+        if not_modified is not None:
+            return not_modified
+
+        key = cache.response_key("lesson-list", request)
+        data = cache.get_response(key)
+        if data is None:
+            response = super().list(request, *args, **kwargs)
+            cache.set_response(key, response.data)
+            return self.set_validators(response, etag)
+        return self.set_validators(Response(data), etag)
 
 
-class LessonRetrieveAPIView(LessonPermissionMixin, generics.RetrieveAPIView):
+class LessonRetrieveAPIView(ConditionalGetMixin, LessonPermissionMixin, generics.RetrieveAPIView):
     """
     Определяет API endpoint для получения одного урока.
     Attributes:
@@ -210,9 +323,30 @@ class LessonRetrieveAPIView(LessonPermissionMixin, generics.RetrieveAPIView):
         :param kwargs: Список именованных аргументов
         :return: Ответ
         """
-        lesson = self.get_object()
+        pk = self.kwargs[self.lookup_field]
+        key = cache.response_key(f"lesson:{pk}")
+        entry = cache.get_response(key)
+        state = entry
+        if state is None and self.is_conditional(request):
+            state = self.get_object_state(self.get_queryset(), pk)  # Лёгкий запрос версии вместо всего урока
+
+        if state is not None:
+            self.check_object_permissions(request, Lesson(pk=pk, owner_id=state["owner_id"]))
+            etag = self.make_etag("lesson", pk, state["updated_at"].isoformat())
+            not_modified = self.not_modified(request, etag, state["updated_at"])
+            if not_modified is not None:
+                return not_modified
+
+        if entry is not None:
+            logger.info("Урок %s запрошен пользователем %s", entry["data"]["name"], request.user)
+            return self.set_validators(Response(entry["data"]), etag, entry["updated_at"])
+
+        lesson = self.get_object()  # Урок запрашивается один раз и используется и для лога, и для ответа
         logger.info("Урок %s запрошен пользователем %s", lesson.name, request.user)
-        return super().retrieve(request, *args, **kwargs)
+        response = Response(self.get_serializer(lesson).data)
+        cache.set_response(key, {"owner_id": lesson.owner_id, "updated_at": lesson.updated_at, "data": response.data})
+        etag = self.make_etag("lesson", lesson.pk, lesson.updated_at.isoformat())
+        return self.set_validators(response, etag, lesson.updated_at)
 
 
 class LessonUpdateAPIView(LessonPermissionMixin, generics.UpdateAPIView):
@@ -260,6 +394,7 @@ class LessonDestroyAPIView(LessonPermissionMixin, generics.DestroyAPIView):
         :param kwargs: Список именованных аргументов
         :return: Ответ
         """
-        lesson = self.get_object()
+        lesson = self.get_object()  # Объект запрашивается и проверяется один раз для лога и удаления
         logger.warning("Урок %s удалён пользователем %s", lesson.name, request.user)
-        return super().destroy(request, *args, **kwargs)
+        self.perform_destroy(lesson)
+        return Response(status=status.HTTP_204_NO_CONTENT)
@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from users.models import User, Payment
+from users.models import User, Payment, StripeEvent, DailyStats
 
 
 @admin.register(User)
@@ -21,3 +21,22 @@ class PaymentAdmin(admin.ModelAdmin):
     list_display = ("user", "course", "lesson", "payment_method", "amount", "date",)
     list_filter = ("user", "course", "lesson", "payment_method", )
     search_fields = ("user__email", "course__name", "lesson__name", )
+
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    """
+    Отображает поля модели События Stripe в админке.
+    """
+    list_display = ("event_id", "type", "created_at",)
+    list_filter = ("type",)
+    search_fields = ("event_id", )
+
+
+@admin.register(DailyStats)
+class DailyStatsAdmin(admin.ModelAdmin):
+    """
+    Отображает поля модели Дневная статистика в админке.
+    """
+    list_display = ("date", "course", "payments_count", "revenue", "new_subscriptions", "unsubscriptions",)
+    list_filter = ("date", "course",)
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class UsersConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "users"
+
+    def ready(self):
+        """
+        Подключает обработчики сигналов приложения.
+        :return: None
+        """
+        from . import signals  # noqa: F401
@@ -0,0 +1,189 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urljoin
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+
+class UpstreamMetrics:
+    """
+    Накапливает метрики обращений к внешнему сервису.
+    Attributes:
+        requests (int): Количество обращений
+        errors (int): Количество ошибок (исключения и ответы 5xx)
+        total_time (float): Суммарное время обращений (секунды)
+        max_time (float): Максимальное время обращения (секунды)
+        histogram (list): Количество обращений по корзинам длительности buckets (последняя - больше всех границ)
+    """
+
+    buckets = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20)  # Границы корзин длительности обращений (секунды)
+
+    def __init__(self):
+        """
+        Инициализирует пустые счётчики.
+        :return: None
+        """
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.histogram = [0] * (len(self.buckets) + 1)
+
+    def record(self, elapsed, error=False):
+        """
+        Учитывает одно обращение.
+        :param elapsed: Длительность обращения (секунды)
+        :param error: True, если обращение завершилось ошибкой
+        :return: None
+        """
+        with self._lock:
+            self.requests += 1
+            self.errors += int(error)
+            self.total_time += elapsed
+            self.max_time = max(self.max_time, elapsed)
+            self.histogram[next((i for i, bound in enumerate(self.buckets) if elapsed <= bound), -1)] += 1
+
+    def snapshot(self):
+        """
+        Возвращает текущие значения метрик.
+        :return: Словарь с метриками
+        """
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "total_time": self.total_time,
+                "avg_time": self.total_time / self.requests if self.requests else 0.0,
+                "max_time": self.max_time,
+                "histogram": list(self.histogram),
+            }
+
+
+class HttpClient:
+    """
+    Определяет HTTP-клиент внешнего сервиса с пулом keep-alive соединений, таймаутами и повторами.
+    Один экземпляр на сервис переиспользует TCP- и TLS-соединения между запросами: у каждого потока своя сессия
+    requests (сессия не потокобезопасна), а пул соединений адаптера общий (пул urllib3 потокобезопасен).
+    Attributes:
+        name (str): Имя сервиса для логов и метрик
+        base_url (str): Базовый адрес сервиса
+        timeout (tuple): Таймауты подключения и чтения (секунды)
+        adapter (HTTPAdapter): Адаптер с общим пулом соединений и повторами
+        metrics (UpstreamMetrics): Метрики обращений
+    """
+
+    retry_statuses = (429, 500, 502, 503, 504)  # Ответы, после которых запрос повторяется
+
+    def __init__(self, name, base_url="", connect_timeout=3.05, read_timeout=10, retries=2, backoff_factor=0.3,
+                 pool_maxsize=10):
+        """
+        :param name: Имя сервиса
+        :param base_url: Базовый адрес сервиса
+        :param connect_timeout: Таймаут подключения (секунды)
+        :param read_timeout: Таймаут чтения ответа (секунды)
+        :param retries: Количество повторов безопасных (GET, HEAD) запросов
+        :param backoff_factor: Множитель экспоненциальной паузы между повторами
+        :param pool_maxsize: Максимальное количество соединений в пуле
+        :return: None
+        """
+        self.name = name
+        self.base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.metrics = UpstreamMetrics()
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=self.retry_statuses,
+            allowed_methods=frozenset({"GET", "HEAD"}),
+            raise_on_status=False,
+        )
+        self.adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=retry)
+        self._local = threading.local()
+
+    @property
+    def session(self):
+        """
+        Получает сессию requests текущего потока, подключённую к общему адаптеру.
+        :return: Сессия requests
+        """
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            session.mount("http://", self.adapter)
+            session.mount("https://", self.adapter)
+        return session
+
+    @contextmanager
+    def track(self):
+        """
+        Учитывает в метриках обращение, выполненное в блоке with (например, через SDK сервиса).
+        :return: Контекстный менеджер
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            self.metrics.record(time.perf_counter() - start, error=True)
+            raise
+        self.metrics.record(time.perf_counter() - start)
+
+    def request(self, method, url, **kwargs):
+        """
+        Выполняет запрос к сервису.
+        :param method: HTTP-метод
+        :param url: Абсолютный адрес или путь относительно base_url
+        :param kwargs: Параметры requests (headers, params, data и т.д.)
+        :return: Ответ requests
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, urljoin(self.base_url, url), **kwargs)
+        except requests.RequestException as e:
+            self.metrics.record(time.perf_counter() - start, error=True)
+            logger.warning("Ошибка запроса к %s: %s", self.name, e)
+            raise
+        self.metrics.record(time.perf_counter() - start, error=response.status_code >= 500)
+        return response
+
+    def get(self, url, **kwargs):
+        """
+        Выполняет GET-запрос к сервису.
+        :param url: Абсолютный адрес или путь относительно base_url
+        :param kwargs: Параметры requests
+        :return: Ответ requests
+        """
+        return self.request("GET", url, **kwargs)
+
+
+cbr_client = HttpClient(
+    "cbr",
+    connect_timeout=settings.HTTP_CONNECT_TIMEOUT,
+    read_timeout=settings.CBR_REQUEST_TIMEOUT,
+    retries=settings.HTTP_RETRIES,
+)
+
+stripe_client = HttpClient(
+    "stripe",
+    base_url=settings.STRIPE_API_BASE,
+    connect_timeout=settings.HTTP_CONNECT_TIMEOUT,
+    read_timeout=settings.STRIPE_REQUEST_TIMEOUT,
+    retries=settings.HTTP_RETRIES,
+)
+
+
+def get_upstream_metrics():
+    """
+    Собирает метрики всех внешних сервисов.
+    :return: Словарь {имя сервиса: метрики}
+    """
+    return {client.name: client.metrics.snapshot() for client in (cbr_client, stripe_client)}
@@ -0,0 +1,49 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+class Echo:
+    """
+    Определяет псевдо-файл для csv.writer: возвращает записанную строку вместо буферизации.
+    """
+
+    def write(self, value):
+        """
+        Возвращает записанную строку.
+        :param value: Строка CSV
+        :return: Та же строка
+        """
+        return value
+
+
+def stream_csv(fields, rows):
+    """
+    Формирует выгрузку в CSV построчно.
+    :param fields: Заголовки столбцов
+    :param rows: Итератор кортежей значений
+    :return: Генератор строк CSV
+    """
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_jsonl(fields, rows):
+    """
+    Формирует выгрузку в JSON Lines (один объект JSON на строку).
+    :param fields: Ключи объектов
+    :param rows: Итератор кортежей значений
+    :return: Генератор строк JSON
+    """
+    for row in rows:
+        yield json.dumps(dict(zip(fields, row)), cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+# Форматы выгрузки: {формат: (генератор строк, тип содержимого, расширение файла)}
+EXPORT_FORMATS = {
+    "csv": (stream_csv, "text/csv; charset=utf-8", "csv"),
+    "jsonl": (stream_jsonl, "application/x-ndjson; charset=utf-8", "jsonl"),
+}
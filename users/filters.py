@@ -0,0 +1,21 @@
+from django_filters import rest_framework as filters
+
+from .models import Payment
+
+
+class PaymentFilter(filters.FilterSet):
+    """
+    Определяет фильтры списка оплат.
+    Attributes:
+        date (DateFromToRangeFilter): Период оплаты (`date_after`, `date_before`, границы включаются)
+    """
+
+    date = filters.DateFromToRangeFilter()
+
+    class Meta:
+        """
+        Определяет модель и поля фильтрации.
+        """
+
+        model = Payment
+        fields = ["user", "course", "lesson", "payment_method", "status", "date"]
@@ -0,0 +1,333 @@
+import json
+import platform
+import random
+import tempfile
+import threading
+import time
+from contextlib import ExitStack
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+
+import django
+import stripe
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import Group
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connection, connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from materials.models import Course, Lesson
+from users.clients import stripe_client
+from users.models import Payment, Subscription, User
+from users.roles import MODERATORS_GROUP
+from users.stubs import UpstreamStubServer
+
+PASSWORD = "benchmark-password"
+
+
+def percentile(values, percent):
+    """
+    Вычисляет перцентиль методом ближайшего ранга.
+    :param values: Отсортированный список значений
+    :param percent: Перцентиль (0-100)
+    :return: Значение перцентиля или None для пустого списка
+    """
+    if not values:
+        return None
+    rank = max(int(round(percent / 100 * len(values) + 0.5)) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+class Command(BaseCommand):
+    """
+    Кастомная команда. Нагрузочный прогон REST API.
+    Создаёт тестовую БД (PostgreSQL или SQLite из настроек), заполняет её данными, получает JWT-токены через
+    TokenObtainPairView и отправляет параллельные запросы к основным эндпоинтам. Stripe и ЦБ РФ заменяются локальной
+    заглушкой. Результаты (пропускная способность, перцентили задержки, запросы к БД на запрос) сохраняются в JSON.
+    """
+    help = "Нагрузочный прогон API с сохранением результатов в JSON"
+
+    # Сценарии: {имя: (метод, адрес, тело запроса, ожидаемые статусы)}
+    scenarios = {
+        "course-list": ("get", "/course/", None, {200}),
+        "lesson-list": ("get", "/lesson/list/", None, {200}),
+        "payment-list": ("get", "/users/payment/", None, {200}),
+        "subscription-toggle": ("post", "/users/subscription/", "course_id", {201, 204}),
+        "payment-create": ("post", "/users/payment/", "payment", {201}),
+    }
+
+    def add_arguments(self, parser):
+        """
+        Добавляет аргументы команды.
+        :param parser: Парсер аргументов
+        :return: None
+        """
+        parser.add_argument("--courses", type=int, default=200, help="Количество курсов")
+        parser.add_argument("--lessons-per-course", type=int, default=10, help="Количество уроков в курсе")
+        parser.add_argument("--users", type=int, default=20, help="Количество пользователей, отправляющих запросы")
+        parser.add_argument("--payments", type=int, default=5000, help="Количество оплат")
+        parser.add_argument("--requests", type=int, default=200, help="Количество запросов к каждому эндпоинту")
+        parser.add_argument("--concurrency", type=int, default=8, help="Количество параллельных клиентов")
+        parser.add_argument("--scenario", action="append", choices=list(self.scenarios), help="Только эти сценарии")
+        parser.add_argument("--no-cache", action="store_true", help="Отключить кэш ответов курсов и уроков")
+        parser.add_argument(
+            "--conn-max-age", type=int, help="Переопределить CONN_MAX_AGE (0 - новое соединение на каждый запрос)"
+        )
+        parser.add_argument("--keepdb", action="store_true", help="Не удалять тестовую БД после прогона")
+        parser.add_argument("--seed", type=int, default=1, help="Начальное значение генератора случайных чисел")
+        parser.add_argument(
+            "--output", help="Файл результатов (по умолчанию в каталоге benchmarks временного каталога системы)"
+        )
+
+    def handle(self, *args, **options):
+        if options["concurrency"] < 1 or options["requests"] < 1:
+            raise CommandError("--concurrency и --requests должны быть положительными")
+        random.seed(options["seed"])
+        scenarios = options["scenario"] or list(self.scenarios)
+
+        pool = bool(connection.settings_dict["OPTIONS"].get("pool"))
+        if options["conn_max_age"] is not None:
+            if pool:
+                raise CommandError("--conn-max-age несовместим с пулом соединений (DB_POOL_ENABLED)")
+            connection.settings_dict["CONN_MAX_AGE"] = options["conn_max_age"]
+
+        old_name = connection.settings_dict["NAME"]
+        if connection.vendor == "sqlite" and not connection.settings_dict["TEST"].get("NAME"):
+            # БД SQLite в памяти блокирует таблицы при параллельной записи из потоков, поэтому используется файл
+            connection.settings_dict["TEST"]["NAME"] = str(Path(tempfile.gettempdir()) / "benchmark_api.sqlite3")
+        test_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, keepdb=options["keepdb"])
+        self.stdout.write(f"Тестовая БД: {test_name} ({connection.vendor})")
+        try:
+            with UpstreamStubServer() as stub, self.upstream_stubs(stub), override_settings(
+                MATERIALS_CACHE_ENABLED=not options["no_cache"],
+                PAYMENT_CHECKOUT_EAGER=True,  # Сессия Stripe создаётся в запросе, через заглушку
+            ):
+                caches[settings.MATERIALS_CACHE_ALIAS].clear()
+                dataset = self.seed(options)
+                tokens = self.obtain_tokens(dataset["users"])
+                results = {
+                    name: self.run_scenario(name, tokens, dataset, options["requests"], options["concurrency"])
+                    for name in scenarios
+                }
+                upstream_requests = stub.requests
+        finally:
+            connections.close_all()
+            if not options["keepdb"]:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        report = {
+            "started_at": datetime.now().isoformat(timespec="seconds"),
+            "environment": {
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+                "conn_max_age": connection.settings_dict["CONN_MAX_AGE"],
+                "conn_health_checks": connection.settings_dict["CONN_HEALTH_CHECKS"],
+                "pool": connection.settings_dict["OPTIONS"].get("pool") if pool else None,
+                "cache": settings.CACHES[settings.MATERIALS_CACHE_ALIAS]["BACKEND"],
+                "materials_cache": not options["no_cache"],
+            },
+            "options": {
+                key: options[key]
+                for key in ("courses", "lessons_per_course", "users", "payments", "requests", "concurrency", "seed")
+            },
+            "upstream_requests": upstream_requests,
+            "scenarios": results,
+        }
+        self.write_report(report, options["output"])
+
+    @staticmethod
+    def upstream_stubs(stub):
+        """
+        Направляет запросы к Stripe и ЦБ РФ на локальную заглушку.
+        :param stub: Запущенная заглушка
+        :return: Контекстный менеджер
+        """
+        stack = ExitStack()
+        stack.enter_context(mock.patch.object(stripe, "api_base", stub.url))
+        stack.enter_context(mock.patch.object(stripe_client, "base_url", stub.url))
+        stack.enter_context(mock.patch("users.services.STRIPE_API_KEY", "sk_test_benchmark"))
+        stack.enter_context(override_settings(CBR_RATES_URL=f"{stub.url}/scripts/XML_daily.asp"))
+        return stack
+
+    def seed(self, options):
+        """
+        Заполняет тестовую БД курсами, уроками, пользователями, оплатами и подписками.
+        :param options: Аргументы команды
+        :return: Словарь с пользователями и ID курсов
+        """
+        start = time.perf_counter()
+        password = make_password(PASSWORD)  # Хэш считается один раз для всех пользователей
+        owner = User.objects.create(username="bench-owner", email="bench-owner@example.com", password=password)
+        moderator = User.objects.create(username="bench-moder", email="bench-moder@example.com", password=password)
+        Group.objects.get_or_create(name=MODERATORS_GROUP)[0].user_set.add(moderator)
+        users = User.objects.bulk_create(
+            User(username=f"bench-user-{index}", email=f"bench-user-{index}@example.com", password=password)
+            for index in range(options["users"])
+        )
+
+        courses = Course.objects.bulk_create(
+            Course(name=f"Курс {index}", description="Описание курса", owner=owner)
+            for index in range(options["courses"])
+        )
+        Lesson.objects.bulk_create(
+            (
+                Lesson(name=f"Урок {index}", description="Описание урока", course=course, owner=owner)
+                for course in courses
+                for index in range(options["lessons_per_course"])
+            ),
+            batch_size=1000,
+        )
+        Payment.objects.bulk_create(
+            (
+                Payment(
+                    user=random.choice(users),
+                    course=random.choice(courses),
+                    amount=random.randint(1, 100) * 100,
+                    payment_method=random.choice(["cash", "transfer"]),
+                    status=random.choice(Payment.StatusChoices.values),
+                )
+                for _ in range(options["payments"])
+            ),
+            batch_size=1000,
+        )
+        Subscription.objects.bulk_create(
+            (Subscription(user=user, course=course) for user in users for course in random.sample(courses, 5)),
+            ignore_conflicts=True,
+        )
+
+        self.stdout.write(f"Данные созданы за {time.perf_counter() - start:.2f} с")
+        return {"users": [owner, moderator, *users], "course_ids": [course.id for course in courses]}
+
+    def obtain_tokens(self, users):
+        """
+        Получает JWT-токены пользователей через TokenObtainPairView.
+        :param users: Список пользователей
+        :return: Список пар (ID пользователя, токен доступа)
+        """
+        client = Client()
+        tokens = []
+        for user in users:
+            response = client.post("/users/token/", {"email": user.email, "password": PASSWORD})
+            if response.status_code != 200:
+                raise CommandError(f"Не удалось получить токен для {user.email}: {response.status_code}")
+            tokens.append((user.id, response.json()["access"]))
+        return tokens
+
+    def run_scenario(self, name, tokens, dataset, total, concurrency):
+        """
+        Выполняет сценарий параллельными клиентами.
+        :param name: Имя сценария
+        :param tokens: Пары (ID пользователя, токен доступа)
+        :param dataset: Созданные данные
+        :param total: Общее количество запросов
+        :param concurrency: Количество параллельных клиентов
+        :return: Метрики сценария
+        """
+        method, url, body, expected = self.scenarios[name]
+        samples = []
+        opened = []
+        lock = threading.Lock()
+
+        def count_connection(sender, connection, **kwargs):
+            """
+            Учитывает открытие соединения с БД (без пула и постоянных соединений - на каждый запрос).
+            :return: None
+            """
+            with lock:
+                opened.append(connection.alias)
+
+        def make_body(user_id):
+            """
+            Формирует тело запроса сценария.
+            :param user_id: ID пользователя, от имени которого отправляется запрос
+            :return: Тело запроса или None
+            """
+            course_id = random.choice(dataset["course_ids"])
+            if body == "course_id":
+                return {"course_id": course_id}
+            if body == "payment":
+                return {"amount": "1000.00", "payment_method": "transfer", "course": course_id, "user": user_id}
+            return None
+
+        def worker(worker_index):
+            """
+            Отправляет запросы одного клиента. Каждый поток использует свой клиент и своё соединение с БД.
+            :param worker_index: Номер клиента
+            :return: None
+            """
+            user_id, token = tokens[worker_index % len(tokens)]
+            client = Client(HTTP_AUTHORIZATION=f"Bearer {token}")
+            local = []
+            try:
+                for _ in range(worker_index, total, concurrency):
+                    data = make_body(user_id)
+                    with CaptureQueriesContext(connections["default"]) as queries:
+                        start = time.perf_counter()
+                        if method == "get":
+                            response = client.get(url)
+                        else:
+                            response = client.post(url, data, content_type="application/json")
+                        # Тестовый клиент не закрывает соединения по окончании запроса, как это делает WSGI-обработчик;
+                        # без этого CONN_MAX_AGE не влиял бы на результаты
+                        close_old_connections()
+                        elapsed = time.perf_counter() - start
+                    local.append((elapsed, len(queries), response.status_code in expected))
+            finally:
+                connections.close_all()
+            with lock:
+                samples.extend(local)
+
+        threads = [threading.Thread(target=worker, args=(index,)) for index in range(concurrency)]
+        connection_created.connect(count_connection)
+        start = time.perf_counter()
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            duration = time.perf_counter() - start
+            connection_created.disconnect(count_connection)
+
+        latencies = sorted(sample[0] * 1000 for sample in samples)
+        result = {
+            "method": method.upper(),
+            "url": url,
+            "requests": len(samples),
+            "errors": sum(1 for sample in samples if not sample[2]),
+            "duration_s": round(duration, 3),
+            "throughput_rps": round(len(samples) / duration, 2) if duration else None,
+            "latency_ms": {
+                "mean": round(sum(latencies) / len(latencies), 2) if latencies else None,
+                **{f"p{p}": round(percentile(latencies, p), 2) if latencies else None for p in (50, 90, 95, 99)},
+                "max": round(latencies[-1], 2) if latencies else None,
+            },
+            "queries_per_request": round(sum(sample[1] for sample in samples) / len(samples), 2) if samples else None,
+            "connections_opened": len(opened),
+        }
+        self.stdout.write(
+            f"{name}: {result['throughput_rps']} запросов/с, p95 {result['latency_ms']['p95']} мс, "
+            f"запросов к БД {result['queries_per_request']}, соединений {len(opened)}, ошибок {result['errors']}"
+        )
+        return result
+
+    def write_report(self, report, output):
+        """
+        Сохраняет результаты прогона в JSON.
+        :param report: Результаты
+        :param output: Путь к файлу или None
+        :return: None
+        """
+        if output is None:
+            # Вне каталога проекта, чтобы результаты не попадали в репозиторий
+            output = Path(tempfile.gettempdir()) / "benchmarks" / f"benchmark_api-{datetime.now():%Y%m%d-%H%M%S}.json"
+        output = Path(output)
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+        self.stdout.write(self.style.SUCCESS(f"Результаты сохранены в {output}"))
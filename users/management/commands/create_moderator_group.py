@@ -2,6 +2,7 @@ from django.core.management.base import BaseCommand
 from django.contrib.auth.models import Group, Permission
 from django.contrib.contenttypes.models import ContentType
 from materials.models import Lesson, Course
+from users.roles import MODERATORS_GROUP
 
 
 class Command(BaseCommand):
@@ -12,7 +13,7 @@ class Command(BaseCommand):
     help = "Создает группу 'Модераторы' с правами на редактирование и просмотр уроков и курсов"
 
     def handle(self, *args, **kwargs):
-        group, created = Group.objects.get_or_create(name="Модераторы")
+        group, created = Group.objects.get_or_create(name=MODERATORS_GROUP)
 
         # Получаем разрешения
         lesson_perms = Permission.objects.filter(
@@ -0,0 +1,86 @@
+import time
+from datetime import date, datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from users.models import DailyStats, Payment
+
+
+class Command(BaseCommand):
+    """
+    Кастомная команда. Пересчитывает оплаченные оплаты в дневной статистике за период.
+    Период обрабатывается порциями по несколько дней, каждая порция пересчитывается в своей транзакции.
+    Счётчики подписок хранят события и из таблицы подписок не восстанавливаются, поэтому не изменяются.
+    """
+    help = "Пересчитывает количество и сумму оплаченных оплат в дневной статистике за период"
+
+    def add_arguments(self, parser):
+        """
+        Добавляет аргументы команды.
+        :param parser: Парсер аргументов
+        :return: None
+        """
+        parser.add_argument("--date-from", type=date.fromisoformat, help="Первый день (по умолчанию - первой оплаты)")
+        parser.add_argument("--date-to", type=date.fromisoformat, help="Последний день (по умолчанию - сегодня)")
+        parser.add_argument("--chunk-days", type=int, default=31, help="Количество дней в одной порции")
+
+    def handle(self, *args, **options):
+        date_to = options["date_to"] or timezone.localdate()
+        date_from = options["date_from"]
+        if date_from is None:
+            first_payment = Payment.objects.aggregate(first=Min("date"))["first"]
+            date_from = timezone.localdate(first_payment) if first_payment else date_to
+        if date_from > date_to or options["chunk_days"] < 1:
+            raise CommandError("Неверный период или размер порции")
+
+        start = time.perf_counter()
+        days = rows = 0
+        chunk_start = date_from
+        while chunk_start <= date_to:
+            chunk_end = min(chunk_start + timedelta(days=options["chunk_days"] - 1), date_to)
+            rows += self.rebuild_chunk(chunk_start, chunk_end)
+            days += (chunk_end - chunk_start).days + 1
+            chunk_start = chunk_end + timedelta(days=1)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Пересчитано дней: {days} ({date_from} - {date_to}), строк статистики: {rows} "
+                f"за {time.perf_counter() - start:.2f} с"
+            )
+        )
+
+    @staticmethod
+    def rebuild_chunk(date_from, date_to):
+        """
+        Пересчитывает оплаченные оплаты за несколько дней.
+        :param date_from: Первый день
+        :param date_to: Последний день
+        :return: Количество пересчитанных строк статистики
+        """
+        # Границы дней в текущем часовом поясе, чтобы фильтр по дате оплаты использовал индекс
+        start = timezone.make_aware(datetime.combine(date_from, datetime.min.time()))
+        end = timezone.make_aware(datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+        totals = (
+            Payment.objects.filter(date__gte=start, date__lt=end, status=Payment.StatusChoices.PAID)
+            .annotate(day=TruncDate("date"))
+            .values("day", "course")
+            .annotate(payments_count=Count("id"), revenue=Sum("amount"))
+            .order_by()
+        )
+
+        with transaction.atomic():
+            DailyStats.objects.filter(date__range=(date_from, date_to)).update(payments_count=0, revenue=0)
+            changes = {
+                (row["day"], row["course"]): {"payments_count": row["payments_count"], "revenue": row["revenue"]}
+                for row in totals
+            }
+            if changes:
+                DailyStats.objects.add(changes)
+            DailyStats.objects.filter(
+                date__range=(date_from, date_to), payments_count=0, new_subscriptions=0, unsubscriptions=0
+            ).delete()  # Строки без оплат и подписок не нужны
+        return len(changes)
@@ -0,0 +1,184 @@
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+
+import requests
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+
+from users.models import Payment
+from users.services import get_checkout_session, payment_status_from_stripe, update_payment_statuses
+from users.tasks import process_checkout
+
+
+def fetch_payment_status(session_id):
+    """
+    Запрашивает статус сессии оплаты в Stripe.
+    :param session_id: ID сессии оплаты
+    :return: Статус оплаты или None, если Stripe не ответил
+    """
+    try:
+        response = get_checkout_session(session_id)
+    except requests.RequestException:
+        return None
+    if response.status_code != 200:
+        return None
+    return payment_status_from_stripe(response.json().get("payment_status"))
+
+
+class Command(BaseCommand):
+    """
+    Кастомная команда. Сверяет статусы ожидающих оплат со Stripe.
+    Оплаты читаются порциями, сессии запрашиваются параллельно ограниченным пулом потоков, а изменённые статусы
+    записываются через bulk_update. Одновременно может выполняться только один запуск команды: блокировка берётся
+    в PostgreSQL (pg_try_advisory_lock), а для других БД - в общем кэше (локальный кэш процесса не подходит).
+    С --requeue-after повторно создаются сессии для ожидающих оплат без сессии: фоновая задача создания сессии
+    живёт только в памяти процесса и теряется при его перезапуске.
+    """
+    help = "Обновляет статусы ожидающих оплат по данным Stripe"
+
+    lock_key = "users:sync_payment_statuses:lock"
+
+    def add_arguments(self, parser):
+        """
+        Добавляет аргументы команды.
+        :param parser: Парсер аргументов
+        :return: None
+        """
+        parser.add_argument("--chunk-size", type=int, default=500, help="Количество оплат в одной порции")
+        parser.add_argument("--workers", type=int, default=8, help="Количество параллельных запросов к Stripe")
+        parser.add_argument("--lock-timeout", type=int, default=60 * 60, help="Время жизни блокировки (секунды)")
+        parser.add_argument(
+            "--requeue-after",
+            type=int,
+            default=None,
+            help="Создать сессии для ожидающих оплат без сессии, созданных больше указанного числа минут назад",
+        )
+
+    def handle(self, *args, **options):
+        with self.run_lock(options["lock_timeout"]) as acquired:
+            if not acquired:
+                self.stdout.write(self.style.WARNING("Сверка статусов уже выполняется, запуск пропущен"))
+                return
+            if options["requeue_after"] is not None:
+                self.requeue(options["requeue_after"])
+            self.sync(options["chunk_size"], options["workers"])
+
+    @contextmanager
+    def run_lock(self, timeout):
+        """
+        Захватывает блокировку, общую для всех процессов и серверов.
+        В PostgreSQL используется сессионная advisory-блокировка соединения команды: она снимается и при аварийном
+        завершении процесса. Для других БД используется общий кэш, блокировка в нём истекает через timeout секунд.
+        :param timeout: Время жизни блокировки в кэше (секунды)
+        :return: Контекстный менеджер, возвращающий True, если блокировка захвачена
+        """
+        if connection.vendor == "postgresql":
+            lock_id = zlib.crc32(self.lock_key.encode())
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT pg_try_advisory_lock(%s)", [lock_id])
+                acquired = cursor.fetchone()[0]
+            try:
+                yield acquired
+            finally:
+                if acquired:
+                    with connection.cursor() as cursor:
+                        cursor.execute("SELECT pg_advisory_unlock(%s)", [lock_id])
+            return
+
+        if isinstance(caches[DEFAULT_CACHE_ALIAS], (LocMemCache, DummyCache)):
+            raise CommandError(
+                "Блокировка запуска требует PostgreSQL или общего кэша (Redis, Memcached, файловый, в БД): "
+                "кэш в памяти процесса не виден другим запускам команды"
+            )
+        acquired = cache.add(self.lock_key, True, timeout)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                cache.delete(self.lock_key)
+
+    def requeue(self, minutes):
+        """
+        Создаёт сессии Stripe для ожидающих оплат без сессии, задача которых потерялась (процесс перезапустился
+        до её выполнения). Свежие оплаты пропускаются: их задача может ещё выполняться.
+        :param minutes: Возраст оплаты (минуты), после которого задача считается потерянной
+        :return: None
+        """
+        payment_ids = list(
+            Payment.objects.filter(
+                Q(session_id__isnull=True) | Q(session_id=""),
+                status=Payment.StatusChoices.PENDING,
+                date__lt=timezone.now() - timedelta(minutes=minutes),
+            )
+            .order_by("id")
+            .values_list("id", flat=True)
+        )
+        for payment_id in payment_ids:
+            process_checkout(payment_id)
+        self.stdout.write(self.style.SUCCESS(f"Повторно создано сессий оплаты: {len(payment_ids)}"))
+
+    def sync(self, chunk_size, workers):
+        """
+        Сверяет статусы всех ожидающих оплат с сессией Stripe.
+        :param chunk_size: Количество оплат в одной порции
+        :param workers: Количество параллельных запросов к Stripe
+        :return: None
+        """
+        payments = (
+            Payment.objects.filter(status=Payment.StatusChoices.PENDING, session_id__isnull=False)
+            .exclude(session_id="")
+            .only("id", "session_id", "status")
+            .order_by("id")
+        )
+
+        start = time.perf_counter()
+        processed = updated = failed = 0
+        chunk = []
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="payment-sync") as executor:
+            for payment in payments.iterator(chunk_size=chunk_size):
+                chunk.append(payment)
+                if len(chunk) >= chunk_size:
+                    chunk_updated, chunk_failed = self.sync_chunk(executor, chunk)
+                    processed, updated, failed = processed + len(chunk), updated + chunk_updated, failed + chunk_failed
+                    chunk = []
+            if chunk:
+                chunk_updated, chunk_failed = self.sync_chunk(executor, chunk)
+                processed, updated, failed = processed + len(chunk), updated + chunk_updated, failed + chunk_failed
+
+        elapsed = time.perf_counter() - start
+        rate = processed / elapsed if elapsed else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Проверено оплат: {processed}, обновлено: {updated}, ошибок: {failed} "
+                f"за {elapsed:.2f} с ({rate:.1f} оплат/с)"
+            )
+        )
+
+    @staticmethod
+    def sync_chunk(executor, chunk):
+        """
+        Сверяет порцию оплат и сохраняет изменённые статусы через update_payment_statuses
+        (один UPDATE на статус, с учётом оплат в дневной статистике).
+        :param executor: Пул потоков для запросов к Stripe
+        :param chunk: Список оплат
+        :return: Количество обновлённых оплат и количество ошибок
+        """
+        statuses = executor.map(fetch_payment_status, [payment.session_id for payment in chunk])
+
+        changed = {}
+        failed = 0
+        for payment, payment_status in zip(chunk, statuses):
+            if payment_status is None:
+                failed += 1
+            elif payment_status != payment.status:
+                changed[payment.session_id] = payment_status
+
+        return update_payment_statuses(changed) if changed else 0, failed
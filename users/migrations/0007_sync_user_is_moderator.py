@@ -0,0 +1,25 @@
+from django.db import migrations
+from django.db.models import Exists, OuterRef
+
+MODERATORS_GROUP = "Модераторы"
+
+
+def sync_is_moderator(apps, schema_editor):
+    """
+    Приводит поле is_moderator в соответствие с членством пользователей в группе модераторов.
+    """
+    User = apps.get_model("users", "User")
+    in_group = User.groups.through.objects.filter(user_id=OuterRef("pk"), group__name=MODERATORS_GROUP)
+    User.objects.update(is_moderator=Exists(in_group))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("users", "0006_payment_status"),
+    ]
+
+    operations = [
+        migrations.RunPython(sync_is_moderator, migrations.RunPython.noop),
+    ]
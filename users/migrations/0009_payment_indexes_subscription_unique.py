@@ -0,0 +1,48 @@
+# Generated by Django 5.2 on 2026-10-18 12:07
+
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def remove_duplicate_subscriptions(apps, schema_editor):
+    """
+    Удаляет повторные подписки пользователя на один курс, оставляя самую раннюю.
+    """
+    Subscription = apps.get_model("users", "Subscription")
+    duplicates = (
+        Subscription.objects.values("user_id", "course_id")
+        .annotate(first_id=Min("id"), total=Count("id"))
+        .filter(total__gt=1)
+    )
+    for duplicate in duplicates:
+        Subscription.objects.filter(user_id=duplicate["user_id"], course_id=duplicate["course_id"]).exclude(
+            id=duplicate["first_id"]
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("materials", "0003_course_owner_lesson_owner"),
+        ("users", "0008_stripeevent"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(fields=["session_id"], name="payment_session_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(fields=["user", "date"], name="payment_user_date_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="payment",
+            index=models.Index(fields=["status", "date"], name="payment_status_date_idx"),
+        ),
+        migrations.RunPython(remove_duplicate_subscriptions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="subscription",
+            constraint=models.UniqueConstraint(fields=("user", "course"), name="unique_user_course_subscription"),
+        ),
+    ]
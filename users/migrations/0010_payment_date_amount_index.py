@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 12:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0004_course_updated_at_lesson_updated_at'),
+        ('users', '0009_payment_indexes_subscription_unique'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['date', 'amount'], name='payment_date_amount_idx'),
+        ),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 5.2 on 2026-10-18 12:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('materials', '0004_course_updated_at_lesson_updated_at'),
+        ('users', '0010_payment_date_amount_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='День')),
+                ('payments_count', models.IntegerField(default=0, verbose_name='Количество оплат')),
+                (
+                    'revenue',
+                    models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Сумма оплат'),
+                ),
+                ('new_subscriptions', models.IntegerField(default=0, verbose_name='Новые подписки')),
+                ('unsubscriptions', models.IntegerField(default=0, verbose_name='Отписки')),
+                (
+                    'course',
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to='materials.course',
+                        verbose_name='Курс',
+                    ),
+                ),
+            ],
+            options={
+                'verbose_name': 'Дневная статистика',
+                'verbose_name_plural': 'Дневная статистика',
+                'constraints': [
+                    models.UniqueConstraint(
+                        condition=models.Q(('course__isnull', False)),
+                        fields=('date', 'course'),
+                        name='unique_daily_stats_course',
+                    ),
+                    models.UniqueConstraint(
+                        condition=models.Q(('course__isnull', True)),
+                        fields=('date',),
+                        name='unique_daily_stats_no_course',
+                    ),
+                ],
+            },
+        ),
+    ]
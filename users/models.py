@@ -1,9 +1,23 @@
+from collections import defaultdict
+from decimal import Decimal
+
 from django.contrib.auth.models import AbstractUser, BaseUserManager
-from django.db import models
+from django.db import connections, models, router, transaction
+from django.utils import timezone
 
 from materials.models import Course, Lesson
 
 
+def write_db(manager):
+    """
+    Получает БД для записи raw SQL-запросами менеджера: выбранную через db_manager или роутером для записи
+    (менеджер.db выбирается роутером для чтения и может указывать на реплику).
+    :param manager: Менеджер модели
+    :return: Псевдоним БД
+    """
+    return manager._db or router.db_for_write(manager.model)
+
+
 class UserManager(BaseUserManager):
     """
     Определяет менеджера пользователей. Нужен для правильного создания пользователей и суперпользователей в кастомной
@@ -220,6 +234,12 @@ class Payment(models.Model):
 
         verbose_name = "Оплата"
         verbose_name_plural = "Оплаты"
+        indexes = [
+            models.Index(fields=["session_id"], name="payment_session_idx"),  # Вебхук и сверка статусов
+            models.Index(fields=["user", "date"], name="payment_user_date_idx"),  # Оплаты пользователя по дате
+            models.Index(fields=["status", "date"], name="payment_status_date_idx"),  # Оплаты по статусу и дате
+            models.Index(fields=["date", "amount"], name="payment_date_amount_idx"),  # Выручка за период
+        ]
 
     def __str__(self):
         """
@@ -228,6 +248,76 @@ class Payment(models.Model):
         return f"{self.user.email} - {self.amount} руб."
 
 
+class SubscriptionManager(models.Manager):
+    """
+    Определяет менеджера подписок. Подписка и отписка выполняются одним-двумя SQL-запросами без гонок.
+    """
+
+    def subscribe_many(self, user, course_ids):
+        """
+        Подписывает пользователя на существующие курсы одним запросом INSERT ... SELECT ... ON CONFLICT DO NOTHING.
+        Несуществующие курсы и уже оформленные подписки пропускаются. Новые подписки учитываются в DailyStats.
+        :param user: Пользователь
+        :param course_ids: Список ID курсов
+        :return: Количество добавленных подписок
+        """
+        course_ids = list(course_ids)
+        if not course_ids:
+            return 0
+        course_table = Course._meta.db_table
+        placeholders = ", ".join(["%s"] * len(course_ids))
+        sql = (
+            f"INSERT INTO {self.model._meta.db_table} (user_id, course_id) "
+            f"SELECT %s, id FROM {course_table} WHERE id IN ({placeholders}) "
+            f"ON CONFLICT DO NOTHING RETURNING course_id"
+        )
+        db = write_db(self)
+        with connections[db].cursor() as cursor:
+            cursor.execute(sql, [user.pk, *course_ids])
+            subscribed = [row[0] for row in cursor.fetchall()]
+        DailyStats.objects.db_manager(db).record_subscriptions(subscribed, "new_subscriptions")
+        return len(subscribed)
+
+    def unsubscribe_many(self, user, course_ids):
+        """
+        Отписывает пользователя от курсов одним запросом DELETE. Отписки учитываются в DailyStats.
+        :param user: Пользователь
+        :param course_ids: Список ID курсов
+        :return: Количество удалённых подписок
+        """
+        course_ids = list(course_ids)
+        if not course_ids:
+            return 0
+        placeholders = ", ".join(["%s"] * len(course_ids))
+        sql = (
+            f"DELETE FROM {self.model._meta.db_table} "
+            f"WHERE user_id = %s AND course_id IN ({placeholders}) RETURNING course_id"
+        )
+        db = write_db(self)
+        with connections[db].cursor() as cursor:
+            cursor.execute(sql, [user.pk, *course_ids])
+            unsubscribed = [row[0] for row in cursor.fetchall()]
+        DailyStats.objects.db_manager(db).record_subscriptions(unsubscribed, "unsubscriptions")
+        return len(unsubscribed)
+
+    def toggle(self, user, course_id):
+        """
+        Переключает подписку пользователя на курс в одной транзакции.
+        Сначала удаляет подписку и, если удалять было нечего, добавляет её.
+        :param user: Пользователь
+        :param course_id: ID курса
+        :return: True, если подписка добавлена, False, если удалена, None, если курс не найден
+        """
+        db = write_db(self)
+        with transaction.atomic(using=db):
+            if self.unsubscribe_many(user, [course_id]):
+                return False
+            if self.subscribe_many(user, [course_id]):
+                return True
+        # Ничего не добавлено: курса нет или подписку только что оформил параллельный запрос
+        return True if Course.objects.using(db).filter(pk=course_id).exists() else None
+
+
 class Subscription(models.Model):
     """
     Определяет модель подписки.
@@ -246,6 +336,8 @@ class Subscription(models.Model):
         verbose_name="Курс",
     )
 
+    objects = SubscriptionManager()
+
     class Meta:
         """
         Определяет отображение имени модели в админке.
@@ -253,6 +345,9 @@ class Subscription(models.Model):
 
         verbose_name = "Подписка"
         verbose_name_plural = "Подписки"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "course"], name="unique_user_course_subscription"),
+        ]
 
     def __str__(self):
         """
@@ -260,3 +355,177 @@ class Subscription(models.Model):
         :return: Электронная почта пользователя и название курса
         """
         return f"{self.user.email} - {self.course.name}"
+
+
+class StripeEvent(models.Model):
+    """
+    Определяет обработанное событие вебхука Stripe.
+    Нужна для идемпотентной обработки: Stripe может доставить одно событие несколько раз.
+    Attributes:
+        event_id (CharField): ID события Stripe.
+        type (CharField): Тип события.
+        created_at (DateTimeField): Дата обработки события.
+    """
+
+    event_id = models.CharField(max_length=255, unique=True, verbose_name="ID события")
+    type = models.CharField(max_length=100, verbose_name="Тип события")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата обработки")
+
+    class Meta:
+        """
+        Определяет отображение имени модели в админке.
+        """
+
+        verbose_name = "Событие Stripe"
+        verbose_name_plural = "События Stripe"
+
+    def __str__(self):
+        """
+        Определяет отображение объекта события в админке.
+        :return: Тип и ID события
+        """
+        return f"{self.type} - {self.event_id}"
+
+
+class DailyStatsManager(models.Manager):
+    """
+    Определяет менеджера дневной статистики. Счётчики увеличиваются одним запросом INSERT ... ON CONFLICT DO UPDATE,
+    поэтому параллельные изменения не теряются.
+    """
+
+    counters = ("payments_count", "revenue", "new_subscriptions", "unsubscriptions")
+
+    def add(self, changes):
+        """
+        Прибавляет изменения к счётчикам дневной статистики, создавая недостающие строки.
+        :param changes: Словарь {(дата, ID курса или None): {счётчик: изменение}}
+        :return: None
+        """
+        connection = connections[write_db(self)]
+        table = self.model._meta.db_table
+        columns = ", ".join(self.counters)
+        updates = ", ".join(f"{counter} = {table}.{counter} + EXCLUDED.{counter}" for counter in self.counters)
+        # Для строк без курса действует отдельное уникальное ограничение по дате
+        targets = {True: "(date, course_id) WHERE course_id IS NOT NULL", False: "(date) WHERE course_id IS NULL"}
+
+        for has_course, target in targets.items():
+            rows = [(key, values) for key, values in changes.items() if (key[1] is not None) == has_course]
+            if not rows:
+                continue
+            params = []
+            for (date, course_id), values in rows:
+                params += [
+                    connection.ops.adapt_datefield_value(date),
+                    course_id,
+                    values.get("payments_count", 0),
+                    connection.ops.adapt_decimalfield_value(Decimal(values.get("revenue", 0))),
+                    values.get("new_subscriptions", 0),
+                    values.get("unsubscriptions", 0),
+                ]
+            placeholders = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(rows))
+            sql = (
+                f"INSERT INTO {table} (date, course_id, {columns}) VALUES {placeholders} "
+                f"ON CONFLICT {target} DO UPDATE SET {updates}"
+            )
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
+
+    def record_payments(self, payments, sign=1):
+        """
+        Учитывает оплаты (sign=1) или их вычитание (sign=-1) в статистике дней оплат одним запросом.
+        В статистику попадают только оплаты в статусе "Оплачено".
+        :param payments: Список оплат
+        :param sign: Знак изменения
+        :return: None
+        """
+        changes = defaultdict(lambda: {"payments_count": 0, "revenue": 0})
+        for payment in payments:
+            if payment.status != Payment.StatusChoices.PAID:
+                continue
+            key = (timezone.localdate(payment.date), payment.course_id)
+            changes[key]["payments_count"] += sign
+            changes[key]["revenue"] += sign * payment.amount
+        if changes:
+            self.add(changes)
+
+    def record_payment(self, payment, sign=1):
+        """
+        Учитывает оплату (sign=1) или её удаление (sign=-1) в статистике дня оплаты, если она оплачена.
+        :param payment: Оплата
+        :param sign: Знак изменения
+        :return: None
+        """
+        self.record_payments([payment], sign)
+
+    def record_subscriptions(self, course_ids, counter):
+        """
+        Учитывает подписки или отписки за сегодня.
+        :param course_ids: Список ID курсов
+        :param counter: Счётчик: "new_subscriptions" или "unsubscriptions"
+        :return: None
+        """
+        changes = defaultdict(lambda: {counter: 0})
+        today = timezone.localdate()
+        for course_id in course_ids:
+            changes[(today, course_id)][counter] += 1
+        if changes:
+            self.add(changes)
+
+    def detach_course(self, course_id):
+        """
+        Переносит статистику удаляемого курса в строки без курса, чтобы итоги по дням не изменились.
+        :param course_id: ID курса
+        :return: None
+        """
+        rows = self.filter(course_id=course_id)
+        changes = {(row.date, None): {counter: getattr(row, counter) for counter in self.counters} for row in rows}
+        if changes:
+            self.add(changes)
+            rows.delete()
+
+
+class DailyStats(models.Model):
+    """
+    Определяет дневную статистику оплаченных оплат и подписок по курсу.
+    Обновляется при изменении оплат (в том числе их статуса) и подписок, оплаты пересчитываются командой rebuild_daily_stats.
+    При удалении курса его статистика переносится в строки без курса.
+    Attributes:
+        date (DateField): День.
+        course (ForeignKey): Курс (пусто для оплат без курса и удалённых курсов).
+        payments_count (IntegerField): Количество оплаченных оплат.
+        revenue (DecimalField): Сумма оплаченных оплат.
+        new_subscriptions (IntegerField): Количество новых подписок.
+        unsubscriptions (IntegerField): Количество отписок.
+    """
+
+    date = models.DateField(verbose_name="День")
+    course = models.ForeignKey(Course, null=True, blank=True, on_delete=models.SET_NULL, verbose_name="Курс")
+    payments_count = models.IntegerField(default=0, verbose_name="Количество оплат")
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Сумма оплат")
+    new_subscriptions = models.IntegerField(default=0, verbose_name="Новые подписки")
+    unsubscriptions = models.IntegerField(default=0, verbose_name="Отписки")
+
+    objects = DailyStatsManager()
+
+    class Meta:
+        """
+        Определяет отображение имени модели в админке.
+        """
+
+        verbose_name = "Дневная статистика"
+        verbose_name_plural = "Дневная статистика"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["date", "course"], condition=models.Q(course__isnull=False), name="unique_daily_stats_course"
+            ),
+            models.UniqueConstraint(
+                fields=["date"], condition=models.Q(course__isnull=True), name="unique_daily_stats_no_course"
+            ),
+        ]
+
+    def __str__(self):
+        """
+        Определяет отображение объекта статистики в админке.
+        :return: День и ID курса
+        """
+        return f"{self.date} - {self.course_id or 'без курса'}"
@@ -0,0 +1,13 @@
+from rest_framework.pagination import CursorPagination
+
+
+class PaymentCursorPagination(CursorPagination):
+    """
+    Определяет курсорную пагинацию для списка оплат.
+    Курсор строится по дате и ID оплаты, поэтому страницы выбираются по индексу без COUNT(*) и OFFSET.
+    """
+
+    page_size = 20  # Количество элементов на одной странице
+    page_size_query_param = "page_size"  # Позволяет клиенту запрашивать разное количество элементов
+    max_page_size = 100  # Максимальное количество элементов на одной странице
+    ordering = ("-date", "-id")  # Сначала новые оплаты
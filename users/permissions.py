@@ -1,5 +1,7 @@
 from rest_framework.permissions import BasePermission, SAFE_METHODS
 
+from .roles import is_moderator
+
 
 class IsOwner(BasePermission):
     """
@@ -16,7 +18,7 @@ class IsOwner(BasePermission):
         :param obj: Объект
         :return: True, если текущий пользователь авторизован и является владельцем, иначе False
         """
-        return request.user.is_authenticated and obj.owner == request.user
+        return request.user.is_authenticated and obj.owner_id == request.user.pk  # Без загрузки владельца из БД
 
 
 class IsModerator(BasePermission):
@@ -33,8 +35,8 @@ class IsModerator(BasePermission):
         :param view:
         :return: True, если текущий пользователь является модератором и действия create и destroy запрещены, иначе False
         """
-        is_moderator = request.user.groups.filter(name="Модераторы").exists()
-        return is_moderator and view.action not in ["create", "destroy"]
+        # У APIView уроков нет action, для них создание и удаление ограничены в LessonPermissionMixin
+        return is_moderator(request) and getattr(view, "action", None) not in ["create", "destroy"]
 
     def has_object_permission(self, request, view, obj):
         """
@@ -44,7 +46,7 @@ class IsModerator(BasePermission):
         :param obj: Объект
         :return: True, если пользователь является модератором, иначе False
         """
-        return request.user.groups.filter(name="Модераторы").exists()
+        return is_moderator(request)  # Флаг загружен вместе с пользователем, проверка не обращается к БД
 
 
 class DenyAll(BasePermission):
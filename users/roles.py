@@ -0,0 +1,27 @@
+from django.db.models import Exists, OuterRef
+
+MODERATORS_GROUP = "Модераторы"  # Имя группы модераторов
+
+
+def is_moderator(request):
+    """
+    Проверяет, является ли текущий пользователь модератором.
+    Читает поле User.is_moderator, которое синхронизируется с членством в группе модераторов сигналами
+    (users.signals) и загружается вместе с пользователем, поэтому проверка не обращается к БД и кэшу,
+    а изменение группы сразу действует во всех процессах.
+    :param request: Запрос
+    :return: True, если пользователь модератор, иначе False
+    """
+    return request.user.is_authenticated and request.user.is_moderator
+
+
+def sync_moderator_flag(user_ids):
+    """
+    Приводит поле User.is_moderator в соответствие с членством в группе модераторов одним UPDATE-запросом.
+    :param user_ids: Список ID пользователей
+    :return: None
+    """
+    from .models import User
+
+    in_group = User.groups.through.objects.filter(user_id=OuterRef("pk"), group__name=MODERATORS_GROUP)
+    User.objects.filter(pk__in=user_ids).update(is_moderator=Exists(in_group))
@@ -89,3 +89,17 @@ class RegisterSerializer(serializers.ModelSerializer):
             password=validated_data["password"],
         )
         return user
+
+
+class SubscriptionBulkSerializer(serializers.Serializer):
+    """
+    Определяет сериализатор для массовой подписки и отписки от курсов.
+    """
+
+    ACTIONS = [
+        ("subscribe", "Подписаться"),
+        ("unsubscribe", "Отписаться"),
+    ]
+
+    course_ids = serializers.ListField(child=serializers.IntegerField(min_value=1), allow_empty=False, max_length=500)
+    action = serializers.ChoiceField(choices=ACTIONS)
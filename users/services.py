@@ -1,34 +1,241 @@
-import stripe
-import requests
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
 from xml.etree import ElementTree
+from zoneinfo import ZoneInfo
+
+import requests
+import stripe
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.module_loading import import_string
+
 from config.settings import STRIPE_API_KEY
+from .clients import cbr_client, stripe_client
+from .models import DailyStats, Payment
 
 # stripe.api_key = STRIPE_API_KEY
 
+# SDK Stripe работает с теми же таймаутами, что и остальные запросы к Stripe. Сессию requests SDK создаёт сам
+# для каждого потока: одна сессия на все потоки (фоновые оформления оплат, сверка статусов) не потокобезопасна
+stripe.api_base = settings.STRIPE_API_BASE
+stripe.default_http_client = stripe.RequestsClient(timeout=stripe_client.timeout)
 
-def convert_rub_to_usd(amount_rub):
+logger = logging.getLogger(__name__)
+
+
+def parse_cbr_rates(content):
     """
-    Конвертирует рубли в доллары
-    :param amount_rub: Сумма в рублях
-    :return: Сумма в долларах
+    Разбирает XML с ежедневными курсами ЦБ РФ.
+    :param content: Содержимое документа XML_daily.asp
+    :return: Словарь {код валюты: курс одной единицы валюты в рублях}
+    """
+    tree = ElementTree.fromstring(content)
+    rates = {}
+    for currency in tree.findall("Valute"):
+        value = float(currency.find("Value").text.replace(",", "."))
+        nominal = int(currency.find("Nominal").text)
+        rates[currency.find("CharCode").text] = value / nominal
+    return rates
+
+
+class RateProvider:
+    """
+    Определяет базовый поставщик курсов валют к рублю.
+    """
+
+    def get_rates(self):
+        """
+        Получает таблицу курсов.
+        :return: Словарь {код валюты: курс одной единицы валюты в рублях}
+        """
+        raise NotImplementedError
+
+    def get_rate(self, char_code):
+        """
+        Получает курс валюты к рублю.
+        :param char_code: Буквенный код валюты, например "USD"
+        :return: Курс или None, если валюта не найдена
+        """
+        return self.get_rates().get(char_code)
+
+
+class StaticRateProvider(RateProvider):
     """
+    Определяет поставщик с заранее заданными курсами (для тестов и нагрузочных прогонов).
+    """
+
+    def __init__(self, rates=None):
+        """
+        :param rates: Словарь {код валюты: курс}
+        :return: None
+        """
+        self.rates = rates if rates is not None else {"USD": 100.0}
+
+    def get_rates(self):
+        """
+        Получает заданную таблицу курсов.
+        :return: Словарь курсов
+        """
+        return self.rates
+
+
+class FileRateProvider(RateProvider):
+    """
+    Определяет поставщик, читающий курсы из локального файла в формате XML_daily.asp.
+    """
+
+    def __init__(self, path=None):
+        """
+        :param path: Путь к файлу, по умолчанию CBR_RATES_FILE из настроек
+        :return: None
+        """
+        self.path = path or settings.CBR_RATES_FILE
+        self._rates = None
+
+    def get_rates(self):
+        """
+        Читает и разбирает файл при первом обращении.
+        :return: Словарь курсов
+        """
+        if self._rates is None:
+            with open(self.path, "rb") as file:
+                self._rates = parse_cbr_rates(file.read())
+        return self._rates
+
+
+class CbrRateProvider(RateProvider):
+    """
+    Определяет поставщик курсов ЦБ РФ с кэшированием.
+    Таблица курсов хранится в памяти процесса и в общем кэше до следующей публикации курсов ЦБ. Устаревшая таблица
+    обновляется в фоновом потоке, а пока обновление идёт или ЦБ недоступен, отдаются прежние курсы.
+    Attributes:
+        cache_key: Ключ таблицы курсов в общем кэше
+    """
+
+    cache_key = "users:cbr_rates"
+    timezone = ZoneInfo("Europe/Moscow")  # ЦБ публикует курсы по московскому времени
+
+    def __init__(self):
+        """
+        Инициализирует пустой кэш процесса.
+        :return: None
+        """
+        self._entry = None  # {"rates": ..., "expires_at": ...}
+        self._lock = threading.Lock()
+        self._refreshing = False
+
+    def next_publication(self, now=None):
+        """
+        Вычисляет момент, когда начнут действовать следующие курсы ЦБ.
+        :param now: Текущее время (timestamp)
+        :return: Timestamp ближайшего обновления курсов
+        """
+        now = datetime.fromtimestamp(now or time.time(), self.timezone)
+        refresh_at = now.replace(hour=settings.CBR_RATES_REFRESH_HOUR, minute=0, second=0, microsecond=0)
+        if refresh_at <= now:
+            refresh_at += timedelta(days=1)
+        return refresh_at.timestamp()
+
+    def fetch(self):
+        """
+        Загружает и разбирает таблицу курсов с сайта ЦБ.
+        :return: Словарь курсов
+        """
+        response = cbr_client.get(settings.CBR_RATES_URL)
+        response.raise_for_status()
+        return parse_cbr_rates(response.content)
 
-    def get_rub_to_usd_rate():
+    def refresh(self):
         """
-        Получает курс конвертации рубля к доллару
-        :return: Курс конвертации рубля РФ к доллару США
+        Обновляет таблицу курсов в памяти процесса и в общем кэше.
+        При ошибке ЦБ оставляет прежнюю таблицу и откладывает повторную попытку на CBR_RATES_RETRY_INTERVAL секунд.
+        :return: Запись кэша с курсами или None, если курсов нет
         """
-        URL = "https://www.cbr.ru/scripts/XML_daily.asp"  # Ссылка на ежедневный курс конвертации рубля по ЦБ РФ
-        response = requests.get(URL)
-        tree = ElementTree.fromstring(response.content)
+        try:
+            rates = self.fetch()
+        except (requests.RequestException, ElementTree.ParseError, ValueError) as e:
+            logger.warning("Не удалось обновить курсы ЦБ: %s", e)
+            entry = self._entry
+            if entry is not None:
+                entry = {"rates": entry["rates"], "expires_at": time.time() + settings.CBR_RATES_RETRY_INTERVAL}
+        else:
+            entry = {"rates": rates, "expires_at": self.next_publication()}
 
-        for currency in tree.findall("Valute"):
-            char_code = currency.find("CharCode").text
-            if char_code == "USD":
-                rate = float(currency.find("Value").text.replace(",", "."))
-                return rate
-        return None  # Если курс конвертации не найден
+        if entry is not None:
+            timeout = entry["expires_at"] - time.time() + settings.CBR_RATES_STALE_TTL
+            cache.set(self.cache_key, entry, timeout)
+            self._entry = entry
+        return entry
 
+    def refresh_in_background(self):
+        """
+        Запускает обновление курсов в фоновом потоке, если оно ещё не запущено.
+        :return: None
+        """
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+
+        def target():
+            try:
+                self.refresh()
+            finally:
+                self._refreshing = False
+
+        threading.Thread(target=target, name="cbr-rates-refresh", daemon=True).start()
+
+    def get_rates(self):
+        """
+        Получает таблицу курсов из кэша процесса, общего кэша или, при холодном старте, с сайта ЦБ.
+        :return: Словарь курсов (пустой, если курсы получить не удалось)
+        """
+        entry = self._entry
+        if entry is None or entry["expires_at"] <= time.time():
+            entry = cache.get(self.cache_key) or entry  # Другой процесс мог уже обновить курсы
+            self._entry = entry
+
+        if entry is None:
+            entry = self.refresh()  # Холодный старт: курсов ещё нет, ждём ответа ЦБ
+            return entry["rates"] if entry else {}
+
+        if entry["expires_at"] <= time.time():
+            self.refresh_in_background()  # Отдаём устаревшие курсы, пока загружаются новые
+        return entry["rates"]
+
+
+_rate_providers = {}
+
+
+def get_rate_provider():
+    """
+    Получает поставщика курсов, заданного настройкой CBR_RATE_PROVIDER.
+    Экземпляр создаётся один раз на процесс, чтобы кэш курсов в памяти переживал запросы.
+    :return: Поставщик курсов
+    """
+    path = settings.CBR_RATE_PROVIDER
+    if path not in _rate_providers:
+        _rate_providers[path] = import_string(path)()
+    return _rate_providers[path]
+
+
+def get_rub_to_usd_rate():
+    """
+    Получает курс конвертации рубля к доллару
+    :return: Курс конвертации рубля РФ к доллару США
+    """
+    return get_rate_provider().get_rate("USD")
+
+
+def convert_rub_to_usd(amount_rub):
+    """
+    Конвертирует рубли в доллары
+    :param amount_rub: Сумма в рублях
+    :return: Сумма в долларах
+    """
     rate = get_rub_to_usd_rate()
     return round(float(amount_rub) / rate, 2) if rate else "Ошибка получения курса конвертации"
 
@@ -42,12 +249,13 @@ def create_price(amount):
     stripe.api_key = STRIPE_API_KEY
     price = None
     try:
-        price = stripe.Price.create(
-            currency="usd",
-            unit_amount=int(amount * 100),
-            recurring={"interval": "month"},
-            product_data={"name": "Gold Plan"}
-        )
+        with stripe_client.track():
+            price = stripe.Price.create(
+                currency="usd",
+                unit_amount=int(amount * 100),
+                recurring={"interval": "month"},
+                product_data={"name": "Gold Plan"}
+            )
     except stripe.error.StripeError as e:
         print(e)
     return price
@@ -59,13 +267,65 @@ def create_checkout_session(price_id):
     :param price_id: ID цены
     :return: Объект сессии stripe
     """
-    session = stripe.checkout.Session.create(
-        line_items=[{
-            "price": price_id,
-            "quantity": 1,
-        }],
-        mode="subscription",
-        success_url="http://localhost:8000/",
-        cancel_url="http://localhost:8000/",
-    )
+    with stripe_client.track():
+        session = stripe.checkout.Session.create(
+            line_items=[{
+                "price": price_id,
+                "quantity": 1,
+            }],
+            mode="subscription",
+            success_url="http://localhost:8000/",
+            cancel_url="http://localhost:8000/",
+        )
     return session.get("id"), session.get("url")
+
+
+def get_checkout_session(session_id):
+    """
+    Запрашивает сессию оплаты в API Stripe через общий пул соединений.
+    :param session_id: ID сессии оплаты
+    :return: Ответ Stripe
+    """
+    headers = {"Authorization": f"Bearer {settings.STRIPE_SECRET_KEY}"}
+    return stripe_client.get(f"/v1/checkout/sessions/{session_id}", headers=headers)
+
+
+def payment_status_from_stripe(stripe_status):
+    """
+    Переводит статус оплаты сессии Stripe в статус модели Payment.
+    :param stripe_status: Значение payment_status сессии Stripe
+    :return: Статус оплаты
+    """
+    if stripe_status in ("paid", "no_payment_required"):
+        return Payment.StatusChoices.PAID
+    if stripe_status == "unpaid":
+        return Payment.StatusChoices.UNPAID
+    return Payment.StatusChoices.PENDING
+
+
+def update_payment_statuses(statuses):
+    """
+    Обновляет статусы оплат по ID сессий Stripe одним UPDATE-запросом на каждый статус.
+    Изменённые оплаты блокируются до конца транзакции, а переходы в статус "Оплачено" и из него
+    учитываются в дневной статистике.
+    :param statuses: Словарь {session_id: статус оплаты}
+    :return: Количество изменённых оплат
+    """
+    with transaction.atomic():
+        changed = [
+            payment
+            for payment in Payment.objects.select_for_update()
+            .filter(session_id__in=list(statuses))
+            .only("id", "session_id", "status", "date", "course_id", "amount")
+            if payment.status != statuses[payment.session_id]
+        ]
+        DailyStats.objects.record_payments(changed, sign=-1)
+
+        ids_by_status = {}
+        for payment in changed:
+            payment.status = statuses[payment.session_id]
+            ids_by_status.setdefault(payment.status, []).append(payment.pk)
+        for payment_status, ids in ids_by_status.items():
+            Payment.objects.filter(pk__in=ids).update(status=payment_status)
+        DailyStats.objects.record_payments(changed)
+    return len(changed)
@@ -0,0 +1,165 @@
+from django.contrib.auth.models import Group
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from materials.models import Course
+
+from .models import DailyStats, Payment, Subscription, User
+from .roles import sync_moderator_flag
+
+
+def _refresh_roles(user_ids):
+    """
+    Синхронизирует поле is_moderator для пользователей.
+    :param user_ids: Список ID пользователей
+    :return: None
+    """
+    if user_ids:
+        sync_moderator_flag(user_ids)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """
+    Обрабатывает изменение членства пользователей в группах (user.groups.add() и group.user_set.add()).
+    :param sender: Промежуточная модель связи пользователей и групп
+    :param instance: Пользователь или группа, в зависимости от направления связи
+    :param action: Тип изменения
+    :param reverse: True, если изменение выполнено со стороны группы
+    :param pk_set: ID добавленных или удалённых объектов
+    :return: None
+    """
+    if action == "pre_clear" and reverse:
+        # После очистки связей список участников группы уже не получить, поэтому запоминаем его заранее
+        instance._cleared_user_ids = set(instance.user_set.values_list("pk", flat=True))
+        return
+    if action not in ("post_add", "post_remove", "post_clear"):
+        return
+
+    if reverse:
+        user_ids = pk_set if action != "post_clear" else getattr(instance, "_cleared_user_ids", set())
+    else:
+        user_ids = {instance.pk}
+    _refresh_roles(user_ids)
+
+
+@receiver(pre_delete, sender=Group)
+def group_pre_delete(sender, instance, **kwargs):
+    """
+    Запоминает участников удаляемой группы.
+    :param sender: Модель группы
+    :param instance: Удаляемая группа
+    :return: None
+    """
+    instance._deleted_user_ids = set(instance.user_set.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Group)
+def group_post_delete(sender, instance, **kwargs):
+    """
+    Обновляет роли бывших участников удалённой группы.
+    :param sender: Модель группы
+    :param instance: Удалённая группа
+    :return: None
+    """
+    _refresh_roles(getattr(instance, "_deleted_user_ids", set()))
+
+
+@receiver(pre_save, sender=Payment)
+def payment_pre_save(sender, instance, **kwargs):
+    """
+    Запоминает прежнюю оплату, чтобы при изменении суммы, курса или статуса перенести её в статистике.
+    :param sender: Модель оплаты
+    :param instance: Оплата
+    :return: None
+    """
+    if instance.pk is not None:
+        instance._previous = (
+            Payment.objects.filter(pk=instance.pk).only("date", "course_id", "amount", "status").first()
+        )
+
+
+@receiver(post_save, sender=Payment)
+def payment_saved(sender, instance, created, **kwargs):
+    """
+    Учитывает новую или изменённую оплату в дневной статистике (только в статусе "Оплачено").
+    :param sender: Модель оплаты
+    :param instance: Оплата
+    :param created: True, если оплата создана
+    :return: None
+    """
+    previous = getattr(instance, "_previous", None)
+    if not created and previous is not None:
+        fields = ("date", "course_id", "amount", "status")
+        if all(getattr(previous, field) == getattr(instance, field) for field in fields):
+            return  # Изменились только данные Stripe
+        DailyStats.objects.record_payment(previous, sign=-1)
+    DailyStats.objects.record_payment(instance)
+
+
+@receiver(post_delete, sender=Payment)
+def payment_deleted(sender, instance, **kwargs):
+    """
+    Вычитает удалённую оплату из дневной статистики.
+    :param sender: Модель оплаты
+    :param instance: Оплата
+    :return: None
+    """
+    DailyStats.objects.record_payment(instance, sign=-1)
+
+
+@receiver(pre_delete, sender=Course)
+def course_pre_delete(sender, instance, **kwargs):
+    """
+    Переносит статистику удаляемого курса в строки без курса.
+    :param sender: Модель курса
+    :param instance: Удаляемый курс
+    :return: None
+    """
+    DailyStats.objects.detach_course(instance.pk)
+
+
+@receiver(pre_save, sender=Subscription)
+def subscription_pre_save(sender, instance, **kwargs):
+    """
+    Запоминает прежний курс подписки, чтобы при его изменении учесть отписку и новую подписку.
+    :param sender: Модель подписки
+    :param instance: Подписка
+    :return: None
+    """
+    if instance.pk is not None:
+        instance._previous_course_id = (
+            Subscription.objects.filter(pk=instance.pk).values_list("course_id", flat=True).first()
+        )
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_saved(sender, instance, created, **kwargs):
+    """
+    Учитывает подписку, созданную или изменённую через ORM (админка, Subscription.objects.create()).
+    Подписки SubscriptionManager.subscribe_many создаются SQL-запросом без сигналов и учитываются им самим.
+    :param sender: Модель подписки
+    :param instance: Подписка
+    :param created: True, если подписка создана
+    :return: None
+    """
+    previous_course_id = getattr(instance, "_previous_course_id", None)
+    if not created:
+        if previous_course_id is None or previous_course_id == instance.course_id:
+            return  # Курс подписки не изменился
+        DailyStats.objects.record_subscriptions([previous_course_id], "unsubscriptions")
+    DailyStats.objects.record_subscriptions([instance.course_id], "new_subscriptions")
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_deleted(sender, instance, origin=None, **kwargs):
+    """
+    Учитывает отписку при удалении подписки через ORM (админка, удаление пользователя).
+    :param sender: Модель подписки
+    :param instance: Подписка
+    :param origin: Объект или QuerySet, удаление которого вызвало удаление подписки
+    :return: None
+    """
+    if isinstance(origin, Course) or getattr(origin, "model", None) is Course:
+        return  # Подписки удаляемого курса не считаются отписками, статистика курса переносится course_pre_delete
+    DailyStats.objects.record_subscriptions([instance.course_id], "unsubscriptions")
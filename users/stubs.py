@@ -0,0 +1,168 @@
+import itertools
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+
+
+class UpstreamStubHandler(BaseHTTPRequestHandler):
+    """
+    Обрабатывает запросы к заглушке ЦБ РФ и Stripe.
+    """
+
+    protocol_version = "HTTP/1.1"  # Поддерживает keep-alive, как настоящие сервисы
+
+    session_path = re.compile(r"^/v1/checkout/sessions/(?P<session_id>[\w-]+)$")
+
+    def log_message(self, format, *args):
+        """
+        Отключает вывод запросов в stderr.
+        :return: None
+        """
+
+    def send_body(self, status, body, content_type="application/json"):
+        """
+        Отправляет ответ.
+        :param status: HTTP-статус
+        :param body: Тело ответа (bytes)
+        :param content_type: Тип содержимого
+        :return: None
+        """
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, data, status=200):
+        """
+        Отправляет JSON-ответ.
+        :param data: Данные ответа
+        :param status: HTTP-статус
+        :return: None
+        """
+        self.send_body(status, json.dumps(data).encode("utf-8"))
+
+    def should_fail(self):
+        """
+        Отвечает ошибкой 503, если заглушке задано количество сбоев.
+        :return: True, если ответ с ошибкой отправлен
+        """
+        stub = self.server.stub
+        with stub.lock:
+            stub.requests += 1
+            if stub.failures > 0:
+                stub.failures -= 1
+                self.send_json({"error": {"message": "Service unavailable"}}, status=503)
+                return True
+        return False
+
+    def do_GET(self):
+        """
+        Отдаёт курсы ЦБ и сессии оплаты Stripe.
+        :return: None
+        """
+        if self.should_fail():
+            return
+        stub = self.server.stub
+        if self.path.startswith("/scripts/XML_daily.asp"):
+            with open(settings.CBR_RATES_FILE, "rb") as file:
+                self.send_body(200, file.read(), content_type="application/xml")
+            return
+        match = self.session_path.match(self.path)
+        if match:
+            session_id = match.group("session_id")
+            if session_id not in stub.sessions:
+                self.send_json({"error": {"message": "No such checkout.session"}}, status=404)
+                return
+            payment_status = stub.sessions[session_id]
+            self.send_json({"id": session_id, "object": "checkout.session", "payment_status": payment_status})
+            return
+        self.send_json({"error": {"message": "Not found"}}, status=404)
+
+    def do_POST(self):
+        """
+        Создаёт цены и сессии оплаты Stripe.
+        :return: None
+        """
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.should_fail():
+            return
+        stub = self.server.stub
+        number = next(stub.counter)
+        if self.path == "/v1/prices":
+            self.send_json({"id": f"price_stub_{number}", "object": "price"})
+        elif self.path == "/v1/checkout/sessions":
+            session_id = f"cs_stub_{number}"
+            stub.sessions[session_id] = "unpaid"
+            self.send_json({"id": session_id, "object": "checkout.session", "url": f"{stub.url}/pay/{session_id}"})
+        else:
+            self.send_json({"error": {"message": "Not found"}}, status=404)
+
+
+class UpstreamStubServer:
+    """
+    Определяет локальную заглушку API ЦБ РФ и Stripe для тестов и нагрузочных прогонов.
+    Attributes:
+        sessions (dict): Сессии оплаты {session_id: payment_status}
+        failures (int): Сколько следующих запросов завершить ошибкой 503
+        requests (int): Количество полученных запросов
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        """
+        :param host: Адрес сервера
+        :param port: Порт сервера (0 - любой свободный)
+        :return: None
+        """
+        self.server = ThreadingHTTPServer((host, port), UpstreamStubHandler)
+        self.server.daemon_threads = True
+        self.server.stub = self
+        self.sessions = {}
+        self.failures = 0
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.counter = itertools.count(1)
+        self.thread = None
+
+    @property
+    def url(self):
+        """
+        Получает базовый адрес заглушки.
+        :return: Адрес вида http://127.0.0.1:port
+        """
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """
+        Запускает сервер в фоновом потоке.
+        :return: Заглушка
+        """
+        self.thread = threading.Thread(target=self.server.serve_forever, name="upstream-stub", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        """
+        Останавливает сервер.
+        :return: None
+        """
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        """
+        Запускает сервер при входе в блок with.
+        :return: Заглушка
+        """
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        """
+        Останавливает сервер при выходе из блока with.
+        :return: None
+        """
+        self.stop()
@@ -0,0 +1,79 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .models import Payment
+from .services import convert_rub_to_usd, create_price, create_checkout_session
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    """
+    Получает пул потоков для фоновых задач оплаты.
+    Пул создаётся один раз на процесс при первом обращении.
+    :return: Пул потоков
+    """
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.PAYMENT_CHECKOUT_WORKERS,
+            thread_name_prefix="payment-checkout",
+        )
+    return _executor
+
+
+def _run_in_worker(task, *args):
+    """
+    Выполняет задачу в фоновом потоке и закрывает открытые потоком соединения с БД.
+    :param task: Функция задачи
+    :param args: Аргументы задачи
+    :return: None
+    """
+    try:
+        task(*args)
+    finally:
+        close_old_connections()
+
+
+def process_checkout(payment_id):
+    """
+    Создаёт цену и сессию оплаты Stripe и сохраняет ссылку на оплату.
+    Если создать сессию не удалось, оплата переводится в статус "Не оплачено".
+    :param payment_id: ID оплаты
+    :return: None
+    """
+    try:
+        payment = Payment.objects.get(pk=payment_id)
+        amount_usd = convert_rub_to_usd(payment.amount)
+        if not isinstance(amount_usd, float):
+            raise ValueError(amount_usd)  # Курс конвертации не получен
+        price = create_price(amount_usd)
+        if price is None:
+            raise ValueError("Не удалось создать цену Stripe.")
+        session_id, session_url = create_checkout_session(price.id)
+    except Exception:
+        logger.exception("Не удалось создать сессию оплаты для оплаты %s", payment_id)
+        Payment.objects.filter(pk=payment_id).update(status=Payment.StatusChoices.UNPAID)
+        return
+
+    Payment.objects.filter(pk=payment_id).update(session_id=session_id, link=session_url)
+    logger.info("Создана сессия оплаты %s для оплаты %s", session_id, payment_id)
+
+
+def enqueue_checkout(payment_id):
+    """
+    Ставит создание сессии оплаты в очередь фоновых задач после фиксации транзакции.
+    При PAYMENT_CHECKOUT_EAGER задача выполняется сразу в текущем потоке. Очередь хранится в памяти процесса:
+    задачи, потерянные при перезапуске, выполняет команда sync_payment_statuses --requeue-after.
+    :param payment_id: ID оплаты
+    :return: None
+    """
+    if settings.PAYMENT_CHECKOUT_EAGER:
+        process_checkout(payment_id)
+        return
+    transaction.on_commit(lambda: get_executor().submit(_run_in_worker, process_checkout, payment_id))
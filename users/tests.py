@@ -1,10 +1,43 @@
+import hashlib
+import hmac
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from logging.handlers import WatchedFileHandler
+from pathlib import Path
+from unittest import mock
+
+import requests
 from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, connection, transaction
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
 from rest_framework import status
-from rest_framework.test import APITestCase
+from rest_framework.test import APITestCase, APITransactionTestCase
 from rest_framework_simplejwt.tokens import RefreshToken
 
+from config.db_router import ReadReplicaRouter, ReadRouting, current_routing, lag_monitor, pin_key
+from config.logs import JsonFormatter, QueuedFileHandler, RequestContextFilter, request_id_var
+from config.middleware import ReplicaRoutingMiddleware
+from config import metrics
+from config.profiling import RequestProfile, registry as profiling_registry
 from materials.models import Course
-from users.models import Subscription
+from users.models import DailyStats, Payment, StripeEvent, Subscription
+from users.paginators import PaymentCursorPagination
+from users.roles import MODERATORS_GROUP
+from users.clients import HttpClient, stripe_client
+from users.services import CbrRateProvider, FileRateProvider, convert_rub_to_usd, update_payment_statuses
+from users.stubs import UpstreamStubServer
 from django.urls import reverse
 
 User = get_user_model()
@@ -92,6 +125,61 @@ class SubscriptionAPIViewTestCase(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_201_CREATED)
         self.assertTrue(Subscription.objects.filter(user=self.other_user, course=self.course).exists())
 
+    def test_toggle_statement_count(self):
+        """
+        Проверяет, что подписка и отписка выполняются не более чем тремя SQL-запросами (с учётом дневной статистики).
+        :param self: Объект класса
+        """
+        self.client.force_authenticate(user=self.user)
+        for expected_status in (status.HTTP_201_CREATED, status.HTTP_204_NO_CONTENT):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(self.subscription_url, self.data, format="json")
+            self.assertEqual(response.status_code, expected_status)
+            statements = [query for query in queries.captured_queries if "SAVEPOINT" not in query["sql"]]
+            self.assertLessEqual(len(statements), 3)
+
+    def test_subscribe_missing_course(self):
+        """
+        Проверяет, что подписка на несуществующий курс возвращает 404.
+        :param self: Объект класса
+        """
+        self.client.force_authenticate(user=self.user)
+        response = self.client.post(self.subscription_url, {"course_id": self.course.id + 1000}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Subscription.objects.exists())
+
+    def test_bulk_subscribe_and_unsubscribe(self):
+        """
+        Проверяет массовую подписку и отписку: несуществующие курсы и повторные подписки пропускаются.
+        :param self: Объект класса
+        """
+        other_course = Course.objects.create(name="Other Course", description="Description", owner=self.user)
+        course_ids = [self.course.id, other_course.id, other_course.id + 1000]
+        Subscription.objects.create(user=self.user, course=self.course)
+        self.client.force_authenticate(user=self.user)
+
+        response = self.client.post(
+            "/users/subscription/bulk/", {"course_ids": course_ids, "action": "subscribe"}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["changed"], 1)
+        self.assertEqual(Subscription.objects.filter(user=self.user).count(), 2)
+
+        response = self.client.post(
+            "/users/subscription/bulk/", {"course_ids": course_ids, "action": "unsubscribe"}, format="json"
+        )
+        self.assertEqual(response.data["changed"], 2)
+        self.assertFalse(Subscription.objects.filter(user=self.user).exists())
+
+    def test_duplicate_subscription_rejected(self):
+        """
+        Проверяет, что БД не допускает повторную подписку пользователя на один курс.
+        :param self: Объект класса
+        """
+        Subscription.objects.create(user=self.user, course=self.course)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Subscription.objects.create(user=self.user, course=self.course)
+
 
 class UserViewSetTestCase(APITestCase):
     """
@@ -193,3 +281,1215 @@ class UserViewSetTestCase(APITestCase):
         self.client.force_authenticate(user=self.admin_user)
         response = self.client.delete(self.user_url)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class UserRolesTestCase(APITestCase):
+    """
+    Определяет тесты для проверки прав модератора.
+    """
+
+    def setUp(self):
+        """
+        Создаёт владельца курса, модератора и тестовый курс.
+        :param self: Объект класса
+        """
+        cache.clear()
+        self.owner = User.objects.create_user(username="owner", email="owner@email", password="password123")
+        self.moderator = User.objects.create_user(username="moder", email="moder@email", password="password123")
+        self.group, _ = Group.objects.get_or_create(name=MODERATORS_GROUP)
+        self.group.user_set.add(self.moderator)
+        self.course = Course.objects.create(name="Test Course", description="Test Description", owner=self.owner)
+
+    def test_moderator_flag_synced_with_group(self):
+        """
+        Проверяет, что поле is_moderator следует за членством в группе модераторов.
+        :param self: Объект класса
+        """
+        self.moderator.refresh_from_db()
+        self.assertTrue(self.moderator.is_moderator)
+
+        self.moderator.groups.remove(self.group)
+        self.moderator.refresh_from_db()
+        self.assertFalse(self.moderator.is_moderator)
+
+    def test_no_group_queries(self):
+        """
+        Проверяет, что проверка прав модератора не обращается к группам и кэшу ролей.
+        :param self: Объект класса
+        """
+        self.moderator.refresh_from_db()  # Как при аутентификации по JWT: пользователь загружается из БД
+        self.client.force_authenticate(user=self.moderator)
+        data = {"name": "Updated Course", "description": "Updated Description"}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.put(f"/course/{self.course.id}/", data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        group_queries = [query for query in queries.captured_queries if "auth_group" in query["sql"]]
+        self.assertEqual(group_queries, [])
+
+    def test_rights_revoked_on_group_change(self):
+        """
+        Проверяет, что удаление из группы модераторов сразу отзывает права модератора.
+        :param self: Объект класса
+        """
+        self.moderator.refresh_from_db()
+        self.client.force_authenticate(user=self.moderator)
+        response = self.client.get(f"/course/{self.course.id}/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        self.group.user_set.remove(self.moderator)
+        self.moderator.refresh_from_db()
+        response = self.client.get(f"/course/{self.course.id}/")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class PaymentPaginationTestCase(APITestCase):
+    """
+    Определяет тесты для курсорной пагинации и фильтрации списка оплат.
+    """
+
+    def setUp(self):
+        """
+        Создаёт пользователя и тестовые оплаты.
+        :param self: Объект класса
+        """
+        self.user = User.objects.create_user(username="payer", email="payer@email", password="password123")
+        for amount in range(1, 4):
+            Payment.objects.create(user=self.user, amount=amount * 100, payment_method="cash")
+        self.client.force_authenticate(user=self.user)
+
+    def test_cursor_pagination(self):
+        """
+        Проверяет, что список отдаёт оплаты от новых к старым без COUNT-запроса.
+        :param self: Объект класса
+        """
+        with self.assertNumQueries(1):
+            response = self.client.get("/users/payment/", {"page_size": 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item["amount"] for item in response.data["results"]], ["300.00", "200.00"])
+
+        response = self.client.get(response.data["next"])
+        self.assertEqual([item["amount"] for item in response.data["results"]], ["100.00"])
+
+    def test_max_page_size(self):
+        """
+        Проверяет, что размер страницы ограничен сверху.
+        :param self: Объект класса
+        """
+        max_page_size = PaymentCursorPagination.max_page_size
+        Payment.objects.bulk_create(
+            Payment(user=self.user, amount=10, payment_method="cash") for _ in range(max_page_size)
+        )
+        response = self.client.get("/users/payment/", {"page_size": 1000})
+        self.assertEqual(len(response.data["results"]), max_page_size)
+
+    def test_filter_by_status_and_date(self):
+        """
+        Проверяет фильтрацию оплат по статусу и периоду.
+        :param self: Объект класса
+        """
+        Payment.objects.filter(amount=200).update(status=Payment.StatusChoices.PAID)
+        Payment.objects.filter(amount=300).update(date=timezone.now() - timedelta(days=10))
+
+        response = self.client.get("/users/payment/", {"status": "paid"})
+        self.assertEqual([item["amount"] for item in response.data["results"]], ["200.00"])
+
+        date_after = (timezone.now() - timedelta(days=1)).date().isoformat()
+        response = self.client.get("/users/payment/", {"date_after": date_after})
+        self.assertEqual(sorted(item["amount"] for item in response.data["results"]), ["100.00", "200.00"])
+
+
+class RateProviderTestCase(SimpleTestCase):
+    """
+    Определяет тесты для поставщиков курсов валют.
+    """
+
+    def setUp(self):
+        """
+        Очищает общий кэш курсов.
+        :param self: Объект класса
+        """
+        cache.clear()
+
+    def test_file_provider(self):
+        """
+        Проверяет чтение курсов из локального файла с учётом номинала валюты.
+        :param self: Объект класса
+        """
+        provider = FileRateProvider()
+        self.assertEqual(provider.get_rate("USD"), 84.0)
+        self.assertAlmostEqual(provider.get_rate("CNY"), 11.52)
+
+    @override_settings(CBR_RATE_PROVIDER="users.services.FileRateProvider")
+    def test_convert_rub_to_usd(self):
+        """
+        Проверяет конвертацию рублей в доллары через поставщика из настроек.
+        :param self: Объект класса
+        """
+        self.assertEqual(convert_rub_to_usd(8400), 100.0)
+
+    def test_cbr_provider_caches_rates(self):
+        """
+        Проверяет, что курсы ЦБ загружаются один раз и дальше берутся из кэша.
+        :param self: Объект класса
+        """
+        provider = CbrRateProvider()
+        with mock.patch.object(CbrRateProvider, "fetch", return_value={"USD": 80.0}) as fetch:
+            self.assertEqual(provider.get_rate("USD"), 80.0)
+            self.assertEqual(provider.get_rate("USD"), 80.0)
+            self.assertEqual(CbrRateProvider().get_rate("USD"), 80.0)  # Другой процесс берёт курсы из общего кэша
+        self.assertEqual(fetch.call_count, 1)
+
+    def test_cbr_provider_serves_stale_rates_on_failure(self):
+        """
+        Проверяет, что при недоступности ЦБ отдаются прежние курсы.
+        :param self: Объект класса
+        """
+        provider = CbrRateProvider()
+        provider._entry = {"rates": {"USD": 80.0}, "expires_at": time.time() - 1}
+        with mock.patch.object(CbrRateProvider, "fetch", side_effect=requests.ConnectionError):
+            entry = provider.refresh()
+        self.assertEqual(entry["rates"], {"USD": 80.0})
+        self.assertGreater(entry["expires_at"], time.time())
+        self.assertEqual(provider.get_rate("USD"), 80.0)
+
+
+class PaymentCheckoutTestCase(APITestCase):
+    """
+    Определяет тесты для фонового создания сессии оплаты.
+    """
+
+    def setUp(self):
+        """
+        Создаёт пользователя и данные оплаты.
+        :param self: Объект класса
+        """
+        self.user = User.objects.create_user(username="payer", email="payer@email", password="password123")
+        self.client.force_authenticate(user=self.user)
+        self.data = {"amount": 8400, "payment_method": "transfer", "user": self.user.id}
+
+    def test_create_payment_returns_pending(self):
+        """
+        Проверяет, что оплата создаётся без обращения к Stripe, а сессия ставится в очередь после коммита.
+        :param self: Объект класса
+        """
+        with mock.patch("users.tasks.create_price") as create_price:
+            with self.captureOnCommitCallbacks(execute=False) as callbacks:
+                response = self.client.post("/users/payment/", self.data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["status"], Payment.StatusChoices.PENDING)
+        self.assertIsNone(response.data["link"])
+        self.assertEqual(len(callbacks), 1)
+        create_price.assert_not_called()
+
+        response = self.client.get(f"/users/payment/{response.data['id']}/link/")
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(response.data["ready"])
+
+    @override_settings(PAYMENT_CHECKOUT_EAGER=True, CBR_RATE_PROVIDER="users.services.FileRateProvider")
+    def test_checkout_link_ready(self):
+        """
+        Проверяет, что после обработки задачи ссылка на оплату доступна через действие link.
+        :param self: Объект класса
+        """
+        with mock.patch("users.tasks.create_price", return_value=mock.Mock(id="price_1")) as create_price, \
+                mock.patch("users.tasks.create_checkout_session", return_value=("cs_1", "https://pay.test/cs_1")):
+            response = self.client.post("/users/payment/", self.data, format="json")
+        create_price.assert_called_once_with(100.0)
+
+        response = self.client.get(f"/users/payment/{response.data['id']}/link/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["link"], "https://pay.test/cs_1")
+        self.assertTrue(response.data["ready"])
+
+
+class HttpClientTestCase(APITestCase):
+    """
+    Определяет тесты HTTP-клиента внешних сервисов на локальной заглушке.
+    """
+
+    def setUp(self):
+        """
+        Запускает заглушку ЦБ РФ и Stripe.
+        :param self: Объект класса
+        """
+        self.stub = UpstreamStubServer().start()
+        self.addCleanup(self.stub.stop)
+
+    def test_retries_and_metrics(self):
+        """
+        Проверяет повтор GET-запроса после ответа 503 и учёт ошибок в метриках.
+        :param self: Объект класса
+        """
+        client = HttpClient("test", base_url=self.stub.url, retries=2, backoff_factor=0)
+        self.stub.failures = 1
+        response = client.get("/scripts/XML_daily.asp")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stub.requests, 2)
+        self.assertEqual(client.metrics.snapshot()["requests"], 1)
+
+        self.stub.failures = 5
+        response = client.get("/scripts/XML_daily.asp")
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(client.metrics.snapshot()["errors"], 1)
+
+    def test_session_per_thread(self):
+        """
+        Проверяет, что у каждого потока своя сессия requests с общим пулом соединений.
+        :param self: Объект класса
+        """
+        client = HttpClient("test", base_url=self.stub.url)
+        sessions = []
+        thread = threading.Thread(target=lambda: sessions.append(client.session))
+        thread.start()
+        thread.join()
+        self.assertIs(client.session, client.session)
+        self.assertIsNot(sessions[0], client.session)
+        self.assertIs(sessions[0].get_adapter(self.stub.url), client.session.get_adapter(self.stub.url))
+
+    def test_check_status_uses_stripe_client(self):
+        """
+        Проверяет обновление статуса оплаты по ответу заглушки Stripe.
+        :param self: Объект класса
+        """
+        user = User.objects.create_user(username="payer", email="payer@email", password="password123")
+        payment = Payment.objects.create(user=user, amount=100, payment_method="cash", session_id="cs_test")
+        self.stub.sessions["cs_test"] = "paid"
+        self.client.force_authenticate(user=user)
+
+        with mock.patch.object(stripe_client, "base_url", self.stub.url):
+            response = self.client.get(f"/users/payment/{payment.id}/check_status/", {"refresh": "true"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["payment_status"], "paid")
+        payment.refresh_from_db()
+        self.assertEqual(payment.status, Payment.StatusChoices.PAID)
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET="whsec_test")
+class StripeWebhookTestCase(APITestCase):
+    """
+    Определяет тесты для вебхука Stripe.
+    """
+
+    def setUp(self):
+        """
+        Создаёт пользователя и ожидающую оплату.
+        :param self: Объект класса
+        """
+        self.user = User.objects.create_user(username="payer", email="payer@email", password="password123")
+        self.payment = Payment.objects.create(user=self.user, amount=100, payment_method="cash", session_id="cs_1")
+        self.url = "/users/payment/webhook/"
+
+    def post_event(self, event, secret="whsec_test"):
+        """
+        Отправляет подписанное событие Stripe.
+        :param event: Событие
+        :param secret: Секрет подписи
+        :return: Ответ
+        """
+        payload = json.dumps(event)
+        timestamp = int(time.time())
+        signature = hmac.new(secret.encode(), f"{timestamp}.{payload}".encode(), hashlib.sha256).hexdigest()
+        return self.client.generic(
+            "POST",
+            self.url,
+            payload,
+            content_type="application/json",
+            HTTP_STRIPE_SIGNATURE=f"t={timestamp},v1={signature}",
+        )
+
+    def completed_event(self, event_id="evt_1"):
+        """
+        Формирует событие завершения сессии оплаты.
+        :param event_id: ID события
+        :return: Событие
+        """
+        return {
+            "id": event_id,
+            "object": "event",
+            "type": "checkout.session.completed",
+            "data": {"object": {"id": "cs_1", "object": "checkout.session", "payment_status": "paid"}},
+        }
+
+    def test_completed_event_marks_payment_paid(self):
+        """
+        Проверяет, что событие завершения сессии переводит оплату в статус "Оплачено".
+        :param self: Объект класса
+        """
+        response = self.post_event(self.completed_event())
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.StatusChoices.PAID)
+
+    def test_duplicate_event_ignored(self):
+        """
+        Проверяет, что повторная доставка события не обрабатывается второй раз.
+        :param self: Объект класса
+        """
+        self.post_event(self.completed_event())
+        response = self.post_event(self.completed_event())
+        self.assertEqual(response.data["status"], "duplicate")
+        self.assertEqual(StripeEvent.objects.count(), 1)
+
+    def test_invalid_signature_rejected(self):
+        """
+        Проверяет, что событие с неверной подписью отклоняется.
+        :param self: Объект класса
+        """
+        response = self.post_event(self.completed_event(), secret="whsec_wrong")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, Payment.StatusChoices.PENDING)
+
+    def test_check_status_reads_database(self):
+        """
+        Проверяет, что check_status отвечает из БД без обращения к Stripe.
+        :param self: Объект класса
+        """
+        self.post_event(self.completed_event())
+        self.client.force_authenticate(user=self.user)
+        with mock.patch("users.views.get_checkout_session") as get_checkout_session:
+            response = self.client.get(f"/users/payment/{self.payment.id}/check_status/")
+        self.assertEqual(response.data["payment_status"], Payment.StatusChoices.PAID)
+        get_checkout_session.assert_not_called()
+
+
+class SyncPaymentStatusesTestCase(APITestCase):
+    """
+    Определяет тесты команды сверки статусов оплат на заглушке Stripe.
+    """
+
+    def setUp(self):
+        """
+        Запускает заглушку Stripe и создаёт ожидающие оплаты.
+        :param self: Объект класса
+        """
+        # Блокировка запуска в SQLite требует общего для процессов кэша
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        file_cache = {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": cache_dir.name}
+        shared_cache = override_settings(CACHES={"default": file_cache})
+        shared_cache.enable()
+        self.addCleanup(shared_cache.disable)
+        self.stub = UpstreamStubServer().start()
+        self.addCleanup(self.stub.stop)
+        patcher = mock.patch.object(stripe_client, "base_url", self.stub.url)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        user = User.objects.create_user(username="payer", email="payer@email", password="password123")
+        self.stub.sessions.update({"cs_paid": "paid", "cs_unpaid": "unpaid", "cs_open": "open"})
+        for session_id in ("cs_paid", "cs_unpaid", "cs_open", "cs_missing"):
+            Payment.objects.create(user=user, amount=100, payment_method="cash", session_id=session_id)
+        Payment.objects.create(user=user, amount=100, payment_method="cash")  # Без сессии, не проверяется
+
+    def test_sync_updates_statuses(self):
+        """
+        Проверяет, что команда обновляет изменившиеся статусы и считает ошибки.
+        :param self: Объект класса
+        """
+        out = StringIO()
+        call_command("sync_payment_statuses", chunk_size=2, workers=2, stdout=out)
+
+        statuses = dict(Payment.objects.exclude(session_id=None).values_list("session_id", "status"))
+        self.assertEqual(statuses["cs_paid"], Payment.StatusChoices.PAID)
+        self.assertEqual(statuses["cs_unpaid"], Payment.StatusChoices.UNPAID)
+        self.assertEqual(statuses["cs_open"], Payment.StatusChoices.PENDING)
+        self.assertEqual(statuses["cs_missing"], Payment.StatusChoices.PENDING)
+        self.assertIn("Проверено оплат: 4, обновлено: 2, ошибок: 1", out.getvalue())
+
+    def test_requeue_lost_checkouts(self):
+        """
+        Проверяет, что команда повторно создаёт сессии только для давних ожидающих оплат без сессии.
+        :param self: Объект класса
+        """
+        user = User.objects.get(username="payer")
+        stale = Payment.objects.get(session_id=None)
+        Payment.objects.filter(pk=stale.pk).update(date=timezone.now() - timedelta(minutes=30))
+        Payment.objects.create(user=user, amount=100, payment_method="cash")  # Задача может ещё выполняться
+        out = StringIO()
+        with mock.patch("users.management.commands.sync_payment_statuses.process_checkout") as process_checkout:
+            call_command("sync_payment_statuses", requeue_after=15, stdout=out)
+        process_checkout.assert_called_once_with(stale.pk)
+        self.assertIn("Повторно создано сессий оплаты: 1", out.getvalue())
+
+    def test_sync_skipped_when_locked(self):
+        """
+        Проверяет, что параллельный запуск команды пропускается.
+        :param self: Объект класса
+        """
+        cache.add("users:sync_payment_statuses:lock", True)
+        out = StringIO()
+        call_command("sync_payment_statuses", stdout=out)
+        self.assertIn("уже выполняется", out.getvalue())
+        self.assertFalse(Payment.objects.filter(status=Payment.StatusChoices.PAID).exists())
+
+    def test_sync_requires_shared_lock(self):
+        """
+        Проверяет, что без PostgreSQL и общего кэша команда не запускается: блокировка в памяти процесса
+        не защищает от параллельного запуска в другом процессе.
+        :param self: Объект класса
+        """
+        locmem = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+        with override_settings(CACHES=locmem), self.assertRaises(CommandError):
+            call_command("sync_payment_statuses", stdout=StringIO())
+        self.assertFalse(Payment.objects.filter(status=Payment.StatusChoices.PAID).exists())
+
+
+class PaymentExportTestCase(APITestCase):
+    """
+    Определяет тесты для потоковой выгрузки оплат.
+    """
+
+    def setUp(self):
+        """
+        Создаёт пользователя и тестовые оплаты.
+        :param self: Объект класса
+        """
+        self.user = User.objects.create_user(
+            username="finance", email="finance@email", password="password123", is_staff=True
+        )
+        Payment.objects.create(user=self.user, amount=100, payment_method="cash")
+        Payment.objects.create(user=self.user, amount=250, payment_method="transfer")
+        self.client.force_authenticate(user=self.user)
+
+    def test_export_csv(self):
+        """
+        Проверяет выгрузку в CSV с фильтром по способу оплаты.
+        :param self: Объект класса
+        """
+        response = self.client.get("/users/payment/export/", {"payment_method": "transfer"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        lines = b"".join(response.streaming_content).decode("utf-8").splitlines()
+        self.assertEqual(lines[0].split(",")[:3], ["id", "user", "user__email"])
+        self.assertEqual(len(lines), 2)
+        self.assertIn("250.00", lines[1])
+
+    def test_export_jsonl(self):
+        """
+        Проверяет выгрузку в JSON Lines с сортировкой по сумме.
+        :param self: Объект класса
+        """
+        response = self.client.get("/users/payment/export/", {"export_format": "jsonl", "ordering": "-amount"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rows = [json.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        self.assertEqual([row["amount"] for row in rows], ["250.00", "100.00"])
+        self.assertEqual(rows[0]["user__email"], "finance@email")
+
+    def test_export_unknown_format(self):
+        """
+        Проверяет ошибку при неизвестном формате выгрузки.
+        :param self: Объект класса
+        """
+        response = self.client.get("/users/payment/export/", {"export_format": "xlsx"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_not_staff_forbidden(self):
+        """
+        Проверяет, что обычный пользователь не может выгрузить все оплаты.
+        :param self: Объект класса
+        """
+        user = User.objects.create_user(username="student", email="student@email", password="password123")
+        self.client.force_authenticate(user=user)
+        response = self.client.get("/users/payment/export/")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class PaymentStatsTestCase(APITestCase):
+    """
+    Определяет тесты для статистики оплат.
+    """
+
+    def setUp(self):
+        """
+        Создаёт пользователя, курс и тестовые оплаты.
+        :param self: Объект класса
+        """
+        self.user = User.objects.create_user(
+            username="analyst", email="analyst@email", password="password123", is_staff=True
+        )
+        self.course = Course.objects.create(name="Course", description="Description")
+        Payment.objects.create(user=self.user, course=self.course, amount=100, payment_method="cash")
+        Payment.objects.create(user=self.user, course=self.course, amount=200, payment_method="transfer")
+        Payment.objects.create(user=self.user, amount=50, payment_method="cash", status=Payment.StatusChoices.PAID)
+        self.client.force_authenticate(user=self.user)
+
+    def test_totals(self):
+        """
+        Проверяет итоги по всем оплатам.
+        :param self: Объект класса
+        """
+        response = self.client.get("/users/payment/stats/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["totals"], {"count": 3, "total": "350.00", "average": "116.67"})
+
+    def test_group_by_course_and_method(self):
+        """
+        Проверяет группировку по курсу и способу оплаты с фильтром по статусу.
+        :param self: Объект класса
+        """
+        params = {"group_by": "course,payment_method", "status": "pending"}
+        with self.assertNumQueries(2):  # Итоги и группы
+            response = self.client.get("/users/payment/stats/", params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["totals"]["count"], 2)
+        self.assertEqual(
+            [(row["course"], row["payment_method"], row["total"]) for row in response.data["groups"]],
+            [(self.course.id, "cash", "100.00"), (self.course.id, "transfer", "200.00")],
+        )
+
+    def test_group_by_month(self):
+        """
+        Проверяет группировку по месяцам.
+        :param self: Объект класса
+        """
+        response = self.client.get("/users/payment/stats/", {"group_by": "month"})
+        self.assertEqual(len(response.data["groups"]), 1)
+        self.assertEqual(response.data["groups"][0]["count"], 3)
+
+    def test_unknown_group(self):
+        """
+        Проверяет ошибку при неизвестной группировке.
+        :param self: Объект класса
+        """
+        response = self.client.get("/users/payment/stats/", {"group_by": "amount"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_not_staff_forbidden(self):
+        """
+        Проверяет, что обычный пользователь не получает статистику по всем оплатам.
+        :param self: Объект класса
+        """
+        user = User.objects.create_user(username="student", email="student@email", password="password123")
+        self.client.force_authenticate(user=user)
+        response = self.client.get("/users/payment/stats/")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+
+class DailyStatsTestCase(APITestCase):
+    """
+    Определяет тесты для дневной статистики оплат и подписок.
+    """
+
+    def setUp(self):
+        """
+        Создаёт пользователя и курс.
+        :param self: Объект класса
+        """
+        self.user = User.objects.create_user(username="student", email="student@email", password="password123")
+        self.course = Course.objects.create(name="Course", description="Description")
+        self.today = timezone.localdate()
+
+    def create_paid(self, amount, course=None):
+        """
+        Создаёт оплаченную оплату пользователя.
+        :param amount: Сумма оплаты
+        :param course: Курс
+        :return: Оплата
+        """
+        return Payment.objects.create(
+            user=self.user, course=course, amount=amount, payment_method="cash", status=Payment.StatusChoices.PAID
+        )
+
+    def get_stats(self, course=None):
+        """
+        Получает статистику курса за сегодня.
+        :param course: Курс
+        :return: Дневная статистика
+        """
+        return DailyStats.objects.get(date=self.today, course=course)
+
+    def test_payments_counted(self):
+        """
+        Проверяет учёт создания, изменения и удаления оплат.
+        :param self: Объект класса
+        """
+        payment = self.create_paid(course=self.course, amount=100)
+        self.create_paid(course=self.course, amount=50)
+        self.create_paid(amount=70)
+        stats = self.get_stats(self.course)
+        self.assertEqual((stats.payments_count, stats.revenue), (2, 150))
+        self.assertEqual(self.get_stats().revenue, 70)
+
+        payment.amount = 300
+        payment.save()
+        self.assertEqual(self.get_stats(self.course).revenue, 350)
+
+        payment.delete()
+        stats = self.get_stats(self.course)
+        self.assertEqual((stats.payments_count, stats.revenue), (1, 50))
+
+    def test_payment_status_changes_counted(self):
+        """
+        Проверяет, что в статистику попадают только оплаченные оплаты, а смена статуса переносит счётчики.
+        :param self: Объект класса
+        """
+        payment = Payment.objects.create(user=self.user, course=self.course, amount=100, payment_method="transfer")
+        Payment.objects.filter(pk=payment.pk).update(session_id="cs_test_1")
+        self.assertFalse(DailyStats.objects.exists())  # Ожидающая оплата не учитывается
+
+        self.assertEqual(update_payment_statuses({"cs_test_1": Payment.StatusChoices.PAID}), 1)
+        self.assertEqual(update_payment_statuses({"cs_test_1": Payment.StatusChoices.PAID}), 0)
+        stats = self.get_stats(self.course)
+        self.assertEqual((stats.payments_count, stats.revenue), (1, 100))
+
+        payment.refresh_from_db()
+        payment.status = Payment.StatusChoices.UNPAID
+        payment.save()
+        stats = self.get_stats(self.course)
+        self.assertEqual((stats.payments_count, stats.revenue), (0, 0))
+
+    def test_subscriptions_counted(self):
+        """
+        Проверяет учёт подписок и отписок.
+        :param self: Объект класса
+        """
+        Subscription.objects.toggle(self.user, self.course.id)
+        Subscription.objects.toggle(self.user, self.course.id)
+        Subscription.objects.subscribe_many(self.user, [self.course.id])
+        stats = self.get_stats(self.course)
+        self.assertEqual((stats.new_subscriptions, stats.unsubscriptions), (2, 1))
+
+    def test_orm_subscriptions_counted(self):
+        """
+        Проверяет учёт подписок, созданных, изменённых и удалённых через ORM.
+        :param self: Объект класса
+        """
+        other_course = Course.objects.create(name="Other", description="Description")
+        subscription = Subscription.objects.create(user=self.user, course=self.course)
+        subscription.course = other_course
+        subscription.save()
+        subscription.delete()
+        stats = self.get_stats(self.course)
+        self.assertEqual((stats.new_subscriptions, stats.unsubscriptions), (1, 1))
+        stats = self.get_stats(other_course)
+        self.assertEqual((stats.new_subscriptions, stats.unsubscriptions), (1, 1))
+
+    def test_course_deleted(self):
+        """
+        Проверяет перенос статистики удалённого курса в строку без курса.
+        :param self: Объект класса
+        """
+        self.create_paid(course=self.course, amount=100)
+        self.create_paid(amount=70)
+        Subscription.objects.toggle(self.user, self.course.id)
+
+        self.course.delete()
+        stats = self.get_stats()
+        self.assertEqual((stats.payments_count, stats.revenue, stats.new_subscriptions), (2, 170, 1))
+        self.assertEqual(stats.unsubscriptions, 0)
+        self.assertEqual(DailyStats.objects.count(), 1)
+
+        Payment.objects.get(amount=100).delete()
+        self.assertEqual(self.get_stats().revenue, 70)
+
+    def test_rebuild(self):
+        """
+        Проверяет пересчёт оплат командой rebuild_daily_stats.
+        :param self: Объект класса
+        """
+        self.create_paid(course=self.course, amount=100)
+        self.create_paid(course=self.course, amount=50)
+        DailyStats.objects.all().update(payments_count=10, revenue=0)
+
+        out = StringIO()
+        call_command("rebuild_daily_stats", "--chunk-days", "1", stdout=out)
+        stats = self.get_stats(self.course)
+        self.assertEqual((stats.payments_count, stats.revenue), (2, 150))
+        self.assertIn("Пересчитано дней: 1", out.getvalue())
+
+
+class RequestLoggingTestCase(APITestCase):
+    """
+    Определяет тесты для ID запроса и JSON-формата логов.
+    """
+
+    def test_request_id_header(self):
+        """
+        Проверяет, что ответ содержит ID запроса, а переданный клиентом ID сохраняется.
+        :param self: Объект класса
+        """
+        response = self.client.get("/users/payment/")
+        self.assertEqual(len(response["X-Request-ID"]), 32)
+
+        response = self.client.get("/users/payment/", HTTP_X_REQUEST_ID="trace-1")
+        self.assertEqual(response["X-Request-ID"], "trace-1")
+
+    def test_json_formatter(self):
+        """
+        Проверяет, что запись лога содержит ID запроса и поля из extra.
+        :param self: Объект класса
+        """
+        record = logging.makeLogRecord({"name": "users", "msg": "Оплата %s", "args": (1,), "duration_ms": 5})
+        token = request_id_var.set("trace-2")
+        try:
+            RequestContextFilter().filter(record)
+        finally:
+            request_id_var.reset(token)
+        data = json.loads(JsonFormatter().format(record))
+        self.assertEqual(data["message"], "Оплата 1")
+        self.assertEqual(data["request_id"], "trace-2")
+        self.assertEqual(data["duration_ms"], 5)
+
+    def test_queued_file_handler_per_process(self):
+        """
+        Проверяет, что фоновый поток запускается при первой записи в процессе, а запись идёт в файл процесса.
+        :param self: Объект класса
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        handler = QueuedFileHandler(f"{directory.name}/app.log", per_process=True)
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        self.assertIsNone(handler.listener)  # При настройке логгера поток не запускается
+
+        handler.handle(logging.makeLogRecord({"msg": "first", "levelno": logging.INFO}))
+        parent_listener = handler.listener
+        parent_listener.stop()
+        handler._pid = -1  # Как в дочернем процессе после fork: поток родителя не работает
+        handler.handle(logging.makeLogRecord({"msg": "second", "levelno": logging.INFO}))
+        self.assertIsNot(handler.listener, parent_listener)
+        handler.close()
+
+        log = Path(directory.name, f"app.{os.getpid()}.log").read_text(encoding="utf-8")
+        self.assertEqual(log.split(), ["first", "second"])
+
+    def test_queued_file_handler_shared_file(self):
+        """
+        Проверяет, что по умолчанию процессы пишут в общий файл с внешней ротацией.
+        :param self: Объект класса
+        """
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        handler = QueuedFileHandler(f"{directory.name}/app.log")
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        handler.handle(logging.makeLogRecord({"msg": "shared", "levelno": logging.INFO}))
+        self.assertIsInstance(handler.target, WatchedFileHandler)
+        handler.close()
+        self.assertEqual([path.name for path in Path(directory.name).iterdir()], ["app.log"])
+
+
+@override_settings(PROFILING_ENABLED=True, PROFILING_SAMPLE_RATE=0)
+class ProfilingTestCase(APITestCase):
+    """
+    Определяет тесты для профилирования запросов.
+    """
+
+    def setUp(self):
+        """
+        Создаёт администратора, пользователя и очищает накопленные показатели.
+        :param self: Объект класса
+        """
+        self.admin = User.objects.create_user(
+            username="admin", email="admin@email", password="password123", is_staff=True
+        )
+        self.user = User.objects.create_user(username="user", email="user@email", password="password123")
+        Payment.objects.create(user=self.user, amount=1000, payment_method="cash")
+        profiling_registry.reset()
+        self.addCleanup(profiling_registry.reset)
+
+    @override_settings(PROFILING_HEADER_SECRET="profile-secret")
+    def test_profiled_request(self):
+        """
+        Проверяет, что запрос с заголовком профилирования от администратора или с секретом учитывается по имени URL,
+        а остальные - нет.
+        :param self: Объект класса
+        """
+        self.client.force_authenticate(user=self.user)
+        self.client.get("/users/payment/", HTTP_X_PROFILE="profile-secret")
+        self.client.get("/users/payment/", HTTP_X_PROFILE="1")  # Заголовок обычного пользователя без секрета
+        self.client.get("/users/payment/")
+        self.client.force_authenticate(user=None)
+        token = RefreshToken.for_user(self.admin).access_token
+        self.client.get("/users/payment/", HTTP_X_PROFILE="1", HTTP_AUTHORIZATION=f"Bearer {token}")
+
+        self.client.force_authenticate(user=self.admin)
+        response = self.client.get("/profiling/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        stats = response.json()["endpoints"]["users:payment-list"]
+        self.assertEqual(stats["count"], 2)
+        self.assertGreater(stats["avg_queries"], 0)
+        self.assertGreater(stats["avg_response_size"], 0)
+        self.assertGreater(stats["avg_serializer_time"], 0)
+        self.assertEqual(sum(stats["histogram_ms"].values()), 2)
+
+        response = self.client.delete("/profiling/")
+        self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
+        self.assertEqual(profiling_registry.snapshot(), {})
+
+    def test_profiled_session_request(self):
+        """
+        Проверяет, что учитывается заголовок профилирования от администратора, вошедшего по сессии.
+        :param self: Объект класса
+        """
+        self.client.force_login(self.admin)
+        self.client.get("/users/payment/", HTTP_X_PROFILE="1")
+        self.assertEqual(profiling_registry.snapshot()["users:payment-list"]["count"], 1)
+
+    def test_profiling_admin_only(self):
+        """
+        Проверяет, что показатели профилирования недоступны обычному пользователю.
+        :param self: Объект класса
+        """
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get("/profiling/")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_duplicate_queries(self):
+        """
+        Проверяет подсчёт времени SQL-запросов и повторов одинаковых запросов.
+        :param self: Объект класса
+        """
+        profile = RequestProfile()
+        with connection.execute_wrapper(profile):
+            Payment.objects.filter(user=self.user).count()
+            Payment.objects.filter(user=self.user).count()
+            Payment.objects.filter(user=self.admin).count()
+        self.assertEqual(len(profile.queries), 3)
+        self.assertEqual(profile.duplicate_queries, 1)
+        self.assertGreater(profile.db_time, 0)
+
+    def test_cprofile_dump(self):
+        """
+        Проверяет сохранение вывода cProfile для медленных запросов.
+        :param self: Объект класса
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(PROFILING_SAMPLE_RATE=1, PROFILING_SLOW_MS=0, PROFILING_CPROFILE_DIR=directory):
+                self.client.post("/users/token/", {"email": "user@email", "password": "wrong"})
+            self.assertEqual(profiling_registry.snapshot()["users:token_obtain_pair"]["count"], 1)
+            self.assertEqual(len(list(Path(directory).glob("users-token_obtain_pair-*.prof"))), 1)
+
+
+class MetricsTestCase(APITestCase):
+    """
+    Определяет тесты для метрик в формате Prometheus.
+    """
+
+    def setUp(self):
+        """
+        Создаёт пользователя и очищает метрики процесса.
+        :param self: Объект класса
+        """
+        self.user = User.objects.create_user(username="user", email="user@email", password="password123")
+        metrics.registry.counters.clear()
+        metrics.registry.histograms.clear()
+
+    @override_settings(METRICS_TOKEN="secret")
+    def test_request_and_upstream_metrics(self):
+        """
+        Проверяет счётчики и гистограммы запросов, SQL-запросов и обращений к внешним сервисам.
+        :param self: Объект класса
+        """
+        self.client.force_authenticate(user=self.user)
+        self.client.get("/users/payment/")
+        self.client.get("/users/payment/")
+        stripe_client.metrics.record(0.3, error=True)
+
+        response = self.client.get("/metrics/", HTTP_AUTHORIZATION="Bearer secret")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response["Content-Type"].startswith("text/plain; version=0.0.4"))
+        text = response.content.decode()
+        self.assertIn('http_requests_total{method="GET",status="200",view="users:payment-list"} 2', text)
+        self.assertIn('http_request_duration_seconds_count{view="users:payment-list"} 2', text)
+        self.assertIn('http_request_duration_seconds_bucket{view="users:payment-list",le="+Inf"} 2', text)
+        self.assertIn('db_queries_total{alias="default"}', text)
+        self.assertIn('upstream_errors_total{service="stripe"}', text)
+        self.assertIn('upstream_request_duration_seconds_bucket{service="stripe",le="0.5"}', text)
+        self.assertIn("# TYPE http_request_duration_seconds histogram", text)
+
+    def test_metrics_access(self):
+        """
+        Проверяет, что метрики доступны только с токеном METRICS_TOKEN или администратору.
+        :param self: Объект класса
+        """
+        admin = User.objects.create_user(username="admin", email="admin@email", password="password123", is_staff=True)
+        self.assertEqual(self.client.get("/metrics/").status_code, status.HTTP_403_FORBIDDEN)
+        user_token = RefreshToken.for_user(self.user).access_token
+        response = self.client.get("/metrics/", HTTP_AUTHORIZATION=f"Bearer {user_token}")
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+        admin_token = RefreshToken.for_user(admin).access_token
+        response = self.client.get("/metrics/", HTTP_AUTHORIZATION=f"Bearer {admin_token}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        with override_settings(METRICS_TOKEN="secret"):
+            self.assertEqual(self.client.get("/metrics/").status_code, status.HTTP_403_FORBIDDEN)
+            response = self.client.get("/metrics/", HTTP_AUTHORIZATION="Bearer secret")
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_multiprocess_merge(self):
+        """
+        Проверяет, что метрики других процессов из общего каталога складываются с метриками текущего.
+        :param self: Объект класса
+        """
+        metrics.registry.inc("http_requests_total", view="materials:course-list", method="GET", status=200)
+        labels = [["method", "GET"], ["status", 200], ["view", "materials:course-list"]]
+        other = {"counters": [["http_requests_total", labels, 4]], "histograms": []}
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_MULTIPROC_DIR=directory):
+            Path(directory, "metrics-1-0.json").write_text(json.dumps(other), encoding="utf-8")
+            text = metrics.render(metrics.collect())
+            # Файл текущего процесса помечен ID запуска: процесс с повторно выданным PID не перезапишет файл
+            self.assertTrue(Path(directory, f"metrics-{os.getpid()}-{metrics.registry.generation}.json").exists())
+        self.assertIn('http_requests_total{method="GET",status="200",view="materials:course-list"} 5', text)
+
+    def test_dead_process_compacted(self):
+        """
+        Проверяет, что файлы завершённых процессов переносятся в файл завершённых процессов без потери значений.
+        :param self: Объект класса
+        """
+        labels = [["method", "GET"], ["status", 200], ["view", "materials:course-list"]]
+        other = {"counters": [["http_requests_total", labels, 4]], "histograms": []}
+        with tempfile.TemporaryDirectory() as directory, override_settings(METRICS_MULTIPROC_DIR=directory):
+            # PID больше максимального в Linux: процесса точно нет
+            dead_path = Path(directory, f"metrics-{2 ** 22 + 1}-0.json")
+            dead_path.write_text(json.dumps(other), encoding="utf-8")
+            for _ in range(2):  # Повторный сбор не учитывает значения дважды
+                text = metrics.render(metrics.collect())
+                self.assertIn('http_requests_total{method="GET",status="200",view="materials:course-list"} 4', text)
+            self.assertFalse(dead_path.exists())
+
+            metrics.registry.inc("http_requests_total", view="materials:course-list", method="GET", status=200)
+            metrics.registry.mark_dead()
+            self.assertFalse(metrics.registry.path(directory).exists())
+            metrics.registry.counters.clear()
+            text = metrics.render(metrics.collect())
+        self.assertIn('http_requests_total{method="GET",status="200",view="materials:course-list"} 5', text)
+
+
+class ReadReplicaRouterTestCase(APITransactionTestCase):
+    """
+    Определяет тесты для маршрутизации чтения к репликам. Тесты выполняются без общей транзакции, так как внутри
+    транзакций чтение всегда направляется в основную БД.
+    """
+
+    def setUp(self):
+        """
+        Создаёт пользователей и курс.
+        :param self: Объект класса
+        """
+        # Закрепление чтения за основной БД требует общего для процессов кэша
+        cache_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(cache_dir.cleanup)
+        file_cache = {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache", "LOCATION": cache_dir.name}
+        shared_cache = override_settings(CACHES={"default": file_cache})
+        shared_cache.enable()
+        self.addCleanup(shared_cache.disable)
+        self.user = User.objects.create_user(username="user", email="user@email", password="password123")
+        self.other_user = User.objects.create_user(username="other", email="other@email", password="password123")
+        self.course = Course.objects.create(name="Курс", description="Описание", owner=self.user)
+
+    @staticmethod
+    def read_db(request):
+        """
+        Получает БД, выбранную роутером для чтения курсов при обработке запроса.
+        :param request: Запрос
+        :return: Псевдоним БД или None (основная БД)
+        """
+        token = current_routing.set(ReadRouting(request))
+        try:
+            return ReadReplicaRouter().db_for_read(Course)
+        finally:
+            current_routing.reset(token)
+
+    @override_settings(DB_REPLICAS=["replica1"])
+    def test_read_routing(self):
+        """
+        Проверяет, что к реплике направляется только чтение безопасных запросов и только без отставания реплики.
+        :param self: Объект класса
+        """
+        factory = RequestFactory()
+        with mock.patch.object(lag_monitor, "is_available", return_value=True):
+            self.assertEqual(self.read_db(factory.get("/course/")), "replica1")
+            self.assertIsNone(self.read_db(factory.post("/course/")))
+            self.assertIsNone(ReadReplicaRouter().db_for_read(Course))  # Вне HTTP-запроса
+        self.assertEqual(ReadReplicaRouter().db_for_write(Course), "default")
+        with mock.patch.object(lag_monitor, "is_available", return_value=False):  # Реплика отстаёт
+            self.assertIsNone(self.read_db(factory.get("/course/")))
+
+    def test_read_your_writes(self):
+        """
+        Проверяет, что после записи чтение пользователя закрепляется за основной БД, а чтение не закрепляет.
+        :param self: Объект класса
+        """
+        with override_settings(DB_REPLICAS=["default"]):  # Реплика - та же БД, чтобы запросы выполнялись
+            self.client.force_authenticate(user=self.user)
+            response = self.client.post("/users/subscription/", {"course_id": self.course.id}, format="json")
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+            self.client.force_authenticate(user=self.other_user)
+            self.client.get("/course/")
+        self.assertTrue(cache.get(pin_key(self.user.pk)))
+        self.assertIsNone(cache.get(pin_key(self.other_user.pk)))
+
+        factory = RequestFactory()
+        available = mock.patch.object(lag_monitor, "is_available", return_value=True)
+        with override_settings(DB_REPLICAS=["replica1"]), available:
+            request = factory.get("/course/")
+            request.user = self.user
+            self.assertIsNone(self.read_db(request))
+            request = factory.get("/course/")
+            request.user = self.other_user
+            self.assertEqual(self.read_db(request), "replica1")
+
+    def test_process_local_cache_rejected(self):
+        """
+        Проверяет, что маршрутизация к репликам не включается с кэшем в памяти процесса.
+        :param self: Объект класса
+        """
+        locmem = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+        with override_settings(DB_REPLICAS=["replica1"], CACHES=locmem), self.assertRaises(ImproperlyConfigured):
+            ReplicaRoutingMiddleware(lambda request: None)
+
+
+class UsersQueryBudgetTestCase(APITestCase):
+    """
+    Проверяет, что количество запросов к БД и размер ответа эндпоинтов оплат, подписок и профиля ограничены
+    и не зависят от объёма данных и запрошенного размера страницы.
+    """
+
+    courses_count = 200
+    payments_count = 2000
+    max_response_size = 64 * 1024  # Байт
+
+    @classmethod
+    def setUpTestData(cls):
+        """
+        Создаёт пользователей, курсы, уроки, оплаты и подписки.
+        :param cls: Класс тестов
+        """
+        cls.owner = User.objects.create_user(username="owner", email="owner@email", password="password123")
+        cls.moderator = User.objects.create_user(username="moder", email="moder@email", password="password123")
+        cls.user = User.objects.create_user(username="user", email="user@email", password="password123")
+        cls.admin = User.objects.create_user(
+            username="admin", email="admin@email", password="password123", is_staff=True
+        )
+        Group.objects.get_or_create(name=MODERATORS_GROUP)[0].user_set.add(cls.moderator)
+        payers = User.objects.bulk_create(
+            User(username=f"payer{index}", email=f"payer{index}@email") for index in range(50)
+        )
+
+        cls.courses = Course.objects.bulk_create(
+            Course(name=f"Course {index}", description="Description", owner=cls.owner)
+            for index in range(cls.courses_count)
+        )
+        Payment.objects.bulk_create(
+            Payment(
+                user=payers[index % len(payers)],
+                course=cls.courses[index % cls.courses_count],
+                amount=100 + index % 7,
+                payment_method="cash" if index % 2 else "transfer",
+                status=Payment.StatusChoices.PAID if index % 3 else Payment.StatusChoices.PENDING,
+                session_id=f"cs_{index}",
+                link=f"https://checkout.stripe.com/c/pay/cs_{index}",
+            )
+            for index in range(cls.payments_count)
+        )
+        Subscription.objects.bulk_create(Subscription(user=payer, course=cls.courses[0]) for payer in payers)
+        cls.payment = Payment.objects.create(user=cls.user, course=cls.courses[0], amount=100, payment_method="cash")
+
+    def setUp(self):
+        """
+        Очищает кэш курсов валют.
+        :param self: Объект класса
+        """
+        cache.clear()
+
+    def assert_budget(self, role, method, url, expected_status, max_queries, data=None, bounded=True):
+        """
+        Выполняет запрос от имени пользователя и проверяет статус, количество запросов к БД и размер ответа.
+        :param role: Имя атрибута пользователя: owner, moderator, user или admin
+        :param method: HTTP-метод
+        :param url: Адрес
+        :param expected_status: Ожидаемый статус ответа
+        :param max_queries: Максимальное количество запросов к БД
+        :param data: Тело запроса или параметры GET
+        :param bounded: False, если размер ответа намеренно не ограничен (потоковая выгрузка)
+        :return: None
+        """
+        cache.clear()
+        self.client.force_authenticate(user=getattr(self, role))
+        with CaptureQueriesContext(connection) as queries:
+            response = getattr(self.client, method)(url, data, format="json" if method != "get" else None)
+            # Потоковый ответ читает БД при отдаче содержимого
+            content = b"".join(response.streaming_content) if response.streaming else response.content
+        self.assertEqual(response.status_code, expected_status)
+        self.assertLessEqual(len(queries), max_queries, "\n".join(query["sql"] for query in queries.captured_queries))
+        if bounded:
+            self.assertLessEqual(len(content), self.max_response_size)
+
+    def test_payment_read_endpoints(self):
+        """
+        Проверяет эндпоинты чтения оплат для владельца курсов, модератора и пользователя.
+        :param self: Объект класса
+        """
+        payment_url = f"/users/payment/{self.payment.id}/"
+        endpoints = [
+            # Страница ограничена max_page_size, COUNT не выполняется
+            ("/users/payment/", {"page_size": 1000}, status.HTTP_200_OK, 1, True),
+            ("/users/payment/", {"status": "paid", "page_size": 1000}, status.HTTP_200_OK, 1, True),
+            (payment_url, None, status.HTTP_200_OK, 1, True),
+            (f"{payment_url}check_status/", None, status.HTTP_200_OK, 1, True),
+            (f"{payment_url}link/", None, status.HTTP_202_ACCEPTED, 1, True),
+            # Итоги, группы и выгрузка доступны только администратору
+            ("/users/payment/stats/", {"group_by": "status,payment_method"}, status.HTTP_403_FORBIDDEN, 0, True),
+            ("/users/payment/export/", None, status.HTTP_403_FORBIDDEN, 0, True),
+        ]
+        for role in ("owner", "moderator", "user"):
+            for url, data, expected_status, max_queries, bounded in endpoints:
+                with self.subTest(role=role, url=url, data=data):
+                    self.assert_budget(role, "get", url, expected_status, max_queries, data, bounded)
+
+    def test_payment_staff_endpoints(self):
+        """
+        Проверяет эндпоинты статистики и выгрузки всех оплат для администратора.
+        :param self: Объект класса
+        """
+        endpoints = [
+            # Итоги и группы
+            ("/users/payment/stats/", {"group_by": "status,payment_method"}, status.HTTP_200_OK, 2, True),
+            ("/users/payment/stats/", {"group_by": "month"}, status.HTTP_200_OK, 2, True),
+            # Выгрузка отдаёт все оплаты, поэтому ограничено только количество запросов
+            ("/users/payment/export/", None, status.HTTP_200_OK, 1, False),
+        ]
+        for url, data, expected_status, max_queries, bounded in endpoints:
+            with self.subTest(url=url, data=data):
+                self.assert_budget("admin", "get", url, expected_status, max_queries, data, bounded)
+
+    def test_write_endpoints(self):
+        """
+        Проверяет эндпоинты создания оплаты, подписок, профиля, токена и вебхука.
+        :param self: Объект класса
+        """
+        course_ids = [course.id for course in self.courses[:100]]
+        payment_data = {"course": self.courses[1].id, "amount": "100.00", "payment_method": "transfer"}
+        payment_data["user"] = self.user.id
+        endpoints = [
+            ("user", "post", "/users/payment/", payment_data, status.HTTP_201_CREATED, 4),
+            # Запросы подписки с учётом SAVEPOINT транзакции
+            ("user", "post", "/users/subscription/", {"course_id": course_ids[1]}, status.HTTP_201_CREATED, 5),
+            ("user", "post", "/users/subscription/", {"course_id": course_ids[1]}, status.HTTP_204_NO_CONTENT, 4),
+            (
+                "user", "post", "/users/subscription/bulk/", {"course_ids": course_ids, "action": "subscribe"},
+                status.HTTP_200_OK, 2,
+            ),
+            (
+                "user", "post", "/users/subscription/bulk/", {"course_ids": course_ids, "action": "unsubscribe"},
+                status.HTTP_200_OK, 2,
+            ),
+            # Профиль владельца: пользователь (дважды - при выборе сериализатора и в retrieve) и его оплаты
+            ("user", "get", f"/users/user/{self.user.id}/", None, status.HTTP_200_OK, 3),
+            ("user", "patch", f"/users/user/{self.user.id}/", {"city": "Москва"}, status.HTTP_200_OK, 4),
+            ("user", "post", "/users/payment/webhook/", {}, status.HTTP_503_SERVICE_UNAVAILABLE, 0),
+        ]
+        for role, method, url, data, expected_status, max_queries in endpoints:
+            with self.subTest(role=role, method=method, url=url):
+                self.assert_budget(role, method, url, expected_status, max_queries, data)
+
+    def test_token_endpoint(self):
+        """
+        Проверяет получение JWT-токена.
+        :param self: Объект класса
+        """
+        self.client.force_authenticate(user=None)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post("/users/token/", {"email": "user@email", "password": "password123"})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLessEqual(len(queries), 1)
@@ -7,6 +7,8 @@ from .views import (
     UserViewSet,
     PaymentViewSet,
     SubscriptionAPIView,
+    SubscriptionBulkAPIView,
+    StripeWebhookAPIView,
 )
 
 app_name = UsersConfig.name
@@ -19,4 +21,6 @@ urlpatterns = [
     path("token/", TokenObtainPairView.as_view(), name="token_obtain_pair"),
     path("token/refresh/", TokenObtainPairView.as_view(), name="token_refresh"),
     path("subscription/", SubscriptionAPIView.as_view(), name="subscription"),
+    path("subscription/bulk/", SubscriptionBulkAPIView.as_view(), name="subscription-bulk"),
+    path("payment/webhook/", StripeWebhookAPIView.as_view(), name="payment-webhook"),
 ] + routers.urls
@@ -1,27 +1,39 @@
+import time
+from decimal import Decimal
+
 import requests
+import stripe
+from django.db import transaction
+from django.db.models import Avg, Count, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.http import Http404, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
-from rest_framework.generics import get_object_or_404, CreateAPIView
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.generics import CreateAPIView
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from django.conf import settings
 
-from materials.models import Course
-from .models import User, Payment, Subscription
+from .models import User, Payment, Subscription, StripeEvent
+from .filters import PaymentFilter
+from .paginators import PaymentCursorPagination
 from .permissions import IsProfileOwner
 from .serializers import (
     UserSerializer,
     PaymentSerializer,
     UserDetailSerializer,
     RegisterSerializer,
+    SubscriptionBulkSerializer,
 )
 
 import logging
 
-from .services import convert_rub_to_usd, create_price, create_checkout_session
+from .exports import EXPORT_FORMATS
+from .services import get_checkout_session, payment_status_from_stripe, update_payment_statuses
+from .tasks import enqueue_checkout
 
 logger = logging.getLogger(__name__)
 
@@ -82,7 +94,7 @@ class UserViewSet(viewsets.ModelViewSet):
         self.permission_classes = [AllowAny]
         response = super().create(request, *args, **kwargs)
         logger.info(
-            "Пользователь с именем %s и email %s успешно создан." % (request.data["username"], request.data["email"])
+            "Пользователь с именем %s и email %s успешно создан.", request.data["username"], request.data["email"]
         )
         return response
 
@@ -109,7 +121,7 @@ class UserViewSet(viewsets.ModelViewSet):
         """
         self.permission_classes = [IsAuthenticated]
         response = super().retrieve(request, *args, **kwargs)
-        logger.info("Информация о пользователе с id %s успешно получена." % kwargs["pk"])
+        logger.info("Информация о пользователе с id %s успешно получена.", kwargs["pk"])
         return response
 
     def update(self, request, *args, **kwargs):
@@ -122,7 +134,7 @@ class UserViewSet(viewsets.ModelViewSet):
         """
         self.permission_classes = [IsAuthenticated]
         response = super().update(request, *args, **kwargs)
-        logger.info("Информация о пользователе с id %s успешно обновлена." % kwargs["pk"])
+        logger.info("Информация о пользователе с id %s успешно обновлена.", kwargs["pk"])
         return response
 
     def destroy(self, request, *args, **kwargs):
@@ -135,7 +147,7 @@ class UserViewSet(viewsets.ModelViewSet):
         """
         self.permission_classes = [IsAuthenticated]
         response = super().destroy(request, *args, **kwargs)
-        logger.info("Пользователь с id %s успешно удален." % kwargs["pk"])
+        logger.info("Пользователь с id %s успешно удален.", kwargs["pk"])
         return response
 
 
@@ -150,6 +162,7 @@ class PaymentViewSet(viewsets.ModelViewSet):
 
     queryset = Payment.objects.all()
     serializer_class = PaymentSerializer
+    pagination_class = PaymentCursorPagination  # Курсорная пагинация по дате, не больше 100 оплат на странице
 
     # Фильтрация, поиск и сортировка
     filter_backends = [
@@ -158,8 +171,8 @@ class PaymentViewSet(viewsets.ModelViewSet):
         filters.OrderingFilter,
     ]
 
-    # Фильтрация по конкретным полям
-    filterset_fields = ["user", "course", "lesson", "payment_method"]
+    # Фильтрация по конкретным полям, статусу и периоду (`date_after`, `date_before`)
+    filterset_class = PaymentFilter
 
     # Поля, по которым можно выполнять поиск (по частичному совпадению)
     search_fields = ["user__email", "course__name", "lesson__name"]
@@ -167,6 +180,15 @@ class PaymentViewSet(viewsets.ModelViewSet):
     # Поля, по которым можно сортировать (`ordering=-date` для сортировки по убыванию)
     ordering_fields = ["date", "amount"]
 
+    def get_permissions(self):
+        """
+        Ограничивает статистику и выгрузку всех оплат администраторами.
+        :return: Список разрешений
+        """
+        if self.action in ["stats", "export"]:
+            self.permission_classes = [IsAuthenticated, IsAdminUser]
+        return [permission() for permission in self.permission_classes]
+
     # Создание оплаты
     def perform_create(self, serializer):
         """
@@ -174,34 +196,137 @@ class PaymentViewSet(viewsets.ModelViewSet):
         :param serializer: Сериализатор
         :return: None
         """
-        payment = serializer.save(user=self.request.user)  # Сохраняем объект Payment
-        amount_usd = convert_rub_to_usd(payment.amount)  # Доступ к полю amount
-        price = create_price(amount_usd)
-        session_id, session_url = create_checkout_session(price.id)
+        payment = serializer.save(user=self.request.user)  # Сохраняем объект Payment со статусом "Ожидание"
+        enqueue_checkout(payment.id)  # Цена и сессия Stripe создаются в фоне, ссылку отдаёт действие link
 
-        # Обновляем созданный объект Payment
-        payment.session_id = session_id
-        payment.link = session_url
-        payment.save()
+    # Получение ссылки на оплату
+    @action(detail=True, methods=["get"])
+    def link(self, request, pk=None):
+        """
+        Возвращает ссылку на оплату, когда фоновая задача создала сессию Stripe.
+        Параметр `wait` (секунды, не больше PAYMENT_LINK_MAX_WAIT) включает ожидание ссылки (long polling).
+        :param request: Запрос
+        :param pk: id оплаты
+        :return: Ответ со ссылкой (200) или признаком, что ссылка ещё не готова (202)
+        """
+        payment = self.get_object()
+        try:
+            wait = min(float(request.query_params.get("wait", 0)), settings.PAYMENT_LINK_MAX_WAIT)
+        except ValueError:
+            return Response({"error": "Параметр wait должен быть числом."}, status=status.HTTP_400_BAD_REQUEST)
+
+        deadline = time.monotonic() + wait
+        while not payment.link and payment.status == Payment.StatusChoices.PENDING and time.monotonic() < deadline:
+            time.sleep(settings.PAYMENT_LINK_POLL_INTERVAL)
+            payment.refresh_from_db(fields=["session_id", "link", "status"])
+
+        ready = bool(payment.link)
+        return Response(
+            {"id": payment.id, "status": payment.status, "link": payment.link, "ready": ready},
+            status=status.HTTP_200_OK if ready else status.HTTP_202_ACCEPTED,
+        )
+
+    # Группировки статистики: {параметр group_by: поле модели или выражение}
+    stats_groups = {
+        "course": "course",
+        "lesson": "lesson",
+        "payment_method": "payment_method",
+        "status": "status",
+        "day": TruncDate("date"),
+        "week": TruncWeek("date"),
+        "month": TruncMonth("date"),
+    }
+
+    @action(detail=False, methods=["get"])
+    def stats(self, request):
+        """
+        Возвращает сумму, количество и среднюю сумму оплат, посчитанные агрегатами в БД.
+        Параметр `group_by` (через запятую: course, lesson, payment_method, status, day, week, month) добавляет
+        разбивку по группам. Учитываются те же фильтры и поиск, что и в списке оплат.
+        :param request: Запрос
+        :return: Ответ с итогами и группами
+        """
+        groups = [name for name in request.query_params.get("group_by", "").split(",") if name]
+        unknown = [name for name in groups if name not in self.stats_groups]
+        if unknown:
+            error = f"Неизвестная группировка: {', '.join(unknown)}. Доступные: {', '.join(self.stats_groups)}."
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = self.filter_queryset(self.get_queryset()).order_by()  # Сортировка не должна попасть в GROUP BY
+        aggregates = {"count": Count("id"), "total": Sum("amount"), "average": Avg("amount")}
+        data = {"totals": self.format_stats(queryset.aggregate(**aggregates))}
+
+        if groups:
+            # Поля модели группируются как есть, даты - через усечение до дня, недели или месяца
+            expressions = {name: self.stats_groups[name] for name in groups}
+            expressions = {name: expr for name, expr in expressions.items() if not isinstance(expr, str)}
+            rows = queryset.annotate(**expressions).values(*groups).annotate(**aggregates).order_by(*groups)
+            data["groups"] = [self.format_stats(row) for row in rows]
+        return Response(data)
+
+    @staticmethod
+    def format_stats(row):
+        """
+        Округляет суммы статистики до копеек и приводит их к строке, как в сериализаторе оплаты.
+        :param row: Строка статистики
+        :return: Строка статистики
+        """
+        for key in ("total", "average"):
+            row[key] = str(Decimal(row[key] or 0).quantize(Decimal("0.01")))
+        return row
+
+    # Выгрузка оплат
+    export_fields = ["id", "user", "user__email", "date", "course", "lesson", "amount", "payment_method", "status"]
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """
+        Выгружает оплаты в CSV или JSON Lines (`export_format=csv|jsonl`) с теми же фильтрами, поиском и сортировкой,
+        что и список. Строки читаются из БД порциями по PAYMENT_EXPORT_CHUNK_SIZE и сразу отправляются клиенту.
+        :param request: Запрос
+        :return: Потоковый ответ
+        """
+        export_format = request.query_params.get("export_format", "csv")
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {"error": f"Неизвестный формат выгрузки. Доступные форматы: {', '.join(EXPORT_FORMATS)}."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        stream, content_type, extension = EXPORT_FORMATS[export_format]
+
+        queryset = self.filter_queryset(self.get_queryset())
+        if not queryset.ordered:
+            queryset = queryset.order_by("id")  # Стабильный порядок строк выгрузки
+        rows = queryset.values_list(*self.export_fields).iterator(chunk_size=settings.PAYMENT_EXPORT_CHUNK_SIZE)
+
+        logger.info("Выгрузка оплат в формате %s запрошена пользователем %s", export_format, request.user)
+        response = StreamingHttpResponse(stream(self.export_fields, rows), content_type=content_type)
+        response["Content-Disposition"] = f'attachment; filename="payments.{extension}"'
+        return response
 
     # Проверка статуса оплаты
     @action(detail=True, methods=["get"])
-    def check_status(self, request, pk=None, drf_status=None):
+    def check_status(self, request, pk=None):
         """
         Проверяет статус оплаты.
+        Статус обновляется вебхуком Stripe, поэтому по умолчанию берётся из БД. Параметр `refresh=true`
+        принудительно запрашивает сессию в Stripe.
         :param request: Запрос
         :param pk: id оплаты
-        :param drf_status: Статус
         :return: Ответ
         """
         payment = self.get_object()
 
+        if request.query_params.get("refresh") != "true":
+            return Response({"payment_status": payment.status})
+
         if not payment.session_id:
-            return Response({"error": "Нет session_id для проверки оплаты."}, status=drf_status.HTTP_400_BAD_REQUEST)
+            return Response({"error": "Нет session_id для проверки оплаты."}, status=status.HTTP_400_BAD_REQUEST)
 
-        url = f"https://api.stripe.com/v1/checkout/sessions/{payment.session_id}"
-        headers = {"Authorization": f"Bearer {settings.STRIPE_SECRET_KEY}"}
-        response = requests.get(url, headers=headers)
+        try:
+            response = get_checkout_session(payment.session_id)
+        except requests.RequestException:
+            return Response({"error": "Stripe недоступен."}, status=status.HTTP_502_BAD_GATEWAY)
 
         if response.status_code != 200:
             return Response({"error": "Ошибка запроса к Stripe."}, status=response.status_code)
@@ -210,18 +335,72 @@ class PaymentViewSet(viewsets.ModelViewSet):
         stripe_status = session_data.get("payment_status")
 
         # Обновляем статус в модели Payment
-        if stripe_status == "paid":
-            payment.status = Payment.StatusChoices.PAID  # Например, "paid"
-        elif stripe_status == "unpaid":
-            payment.status = Payment.StatusChoices.UNPAID  # Например, "unpaid"
-        else:
-            payment.status = Payment.StatusChoices.PENDING  # Например, "pending"
-
-        payment.save()
+        update_payment_statuses({payment.session_id: payment_status_from_stripe(stripe_status)})
 
         return Response({"payment_status": stripe_status})
 
 
+# -- Stripe Webhook --
+class StripeWebhookAPIView(APIView):
+    """
+    Принимает вебхуки Stripe и обновляет статусы оплат по ID сессии.
+    Подпись запроса проверяется секретом STRIPE_WEBHOOK_SECRET, повторно доставленные события пропускаются.
+    Attributes:
+        authentication_classes (list): Список классов аутентификации
+        permission_classes (list): Список классов разрешений
+        event_statuses (dict): Статусы оплат для событий, не содержащих payment_status
+    """
+
+    authentication_classes = []  # Запрос аутентифицируется подписью Stripe
+    permission_classes = [AllowAny]
+
+    event_statuses = {
+        "checkout.session.async_payment_succeeded": Payment.StatusChoices.PAID,
+        "checkout.session.async_payment_failed": Payment.StatusChoices.UNPAID,
+        "checkout.session.expired": Payment.StatusChoices.UNPAID,
+    }
+
+    def post(self, request, *args, **kwargs):
+        """
+        Обрабатывает событие Stripe.
+        :param request: Запрос
+        :param args: Список позиционных документов
+        :param kwargs: Список именованных аргументов
+        :return: Ответ
+        """
+        if not settings.STRIPE_WEBHOOK_SECRET:
+            logger.error("Получен вебхук Stripe, но STRIPE_WEBHOOK_SECRET не задан.")
+            return Response({"error": "Вебхуки не настроены."}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        try:
+            event = stripe.Webhook.construct_event(
+                request.body,
+                request.META.get("HTTP_STRIPE_SIGNATURE", ""),
+                settings.STRIPE_WEBHOOK_SECRET,
+            )
+        except (ValueError, stripe.error.SignatureVerificationError) as e:
+            logger.warning("Отклонён вебхук Stripe: %s", e)
+            return Response({"error": "Неверная подпись или тело события."}, status=status.HTTP_400_BAD_REQUEST)
+
+        with transaction.atomic():
+            _, created = StripeEvent.objects.get_or_create(event_id=event["id"], defaults={"type": event["type"]})
+            if not created:
+                return Response({"status": "duplicate"})
+
+            session = event["data"]["object"]
+            if event["type"] == "checkout.session.completed":
+                payment_status = payment_status_from_stripe(session.get("payment_status"))
+            else:
+                payment_status = self.event_statuses.get(event["type"])
+
+            updated = 0
+            if payment_status is not None and session.get("id"):
+                updated = update_payment_statuses({session["id"]: payment_status})
+
+        logger.info("Обработано событие Stripe %s (%s), обновлено оплат: %s", event["id"], event["type"], updated)
+        return Response({"status": "processed", "updated": updated})
+
+
 # -- Subscription ViewSet --
 class SubscriptionAPIView(APIView):
     """
@@ -241,20 +420,53 @@ class SubscriptionAPIView(APIView):
         :return: Ответ
         """
         user = request.user
-        course_id = request.data.get("course_id")
+        try:
+            course_id = int(request.data.get("course_id"))
+        except (TypeError, ValueError):
+            raise Http404("Курс не найден.")
 
-        course_item = get_object_or_404(Course, id=course_id)
-        subs_item = Subscription.objects.filter(user=user, course=course_item)
+        subscribed = Subscription.objects.toggle(user, course_id)  # DELETE и, если удалять нечего, INSERT
+        if subscribed is None:
+            raise Http404("Курс не найден.")
 
-        if subs_item.exists():
-            subs_item.delete()
-            message = "Подписка удалена"
-            logger.info("Подписка на курс %s удалена пользователем %s", course_item, user)
-            answer = status.HTTP_204_NO_CONTENT
-        else:
-            Subscription.objects.create(user=user, course=course_item)
+        if subscribed:
             message = "Подписка добавлена"
-            logger.info("Подписка на курс %s добавлена пользователем %s", course_item, user)
+            logger.info("Подписка на курс %s добавлена пользователем %s", course_id, user)
             answer = status.HTTP_201_CREATED
+        else:
+            message = "Подписка удалена"
+            logger.info("Подписка на курс %s удалена пользователем %s", course_id, user)
+            answer = status.HTTP_204_NO_CONTENT
 
         return Response({"message": message}, status=answer)
+
+
+class SubscriptionBulkAPIView(APIView):
+    """
+    Определяет API для массовой подписки и отписки пользователя от курсов.
+    Attributes:
+        permission_classes (list): Список классов разрешений
+    """
+
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, *args, **kwargs):
+        """
+        Подписывает пользователя на курсы или отписывает от них одним SQL-запросом.
+        :param request: Запрос
+        :param args: Список позиционных документов
+        :param kwargs: Список именованных аргументов
+        :return: Ответ с количеством изменённых подписок
+        """
+        serializer = SubscriptionBulkSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        action_name = serializer.validated_data["action"]
+        course_ids = serializer.validated_data["course_ids"]
+
+        if action_name == "subscribe":
+            changed = Subscription.objects.subscribe_many(request.user, course_ids)
+        else:
+            changed = Subscription.objects.unsubscribe_many(request.user, course_ids)
+
+        logger.info("Массовое действие %s с подписками пользователя %s: %s", action_name, request.user, changed)
+        return Response({"action": action_name, "changed": changed}, status=status.HTTP_200_OK)